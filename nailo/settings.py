@@ -13,6 +13,10 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from decouple import config
 import os
+import sys
+
+# manage.py test 실행 여부 (테스트에서는 백그라운드 스레드를 띄우지 않음)
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,11 +35,33 @@ ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '43.202.1.33', '156e-211-117-82-98.ng
 
 ASGI_APPLICATION = 'nailo.asgi.application'
 
+# 채널 레이어
+# REDIS_URL이 설정되면 Redis Pub/Sub 레이어로 여러 ASGI 워커와 WSGI 프로세스 간에 그룹 메시지를 전달
+# 설정되지 않으면 단일 프로세스에서만 동작하는 InMemoryChannelLayer 사용 (로컬 개발용)
+REDIS_URL = config('REDIS_URL', default='')
+CHANNEL_LAYER_BACKEND = config(
+    'CHANNEL_LAYER_BACKEND',
+    default='channels_redis.pubsub.RedisPubSubChannelLayer' if REDIS_URL else 'channels.layers.InMemoryChannelLayer',
+)
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': CHANNEL_LAYER_BACKEND,
     }
 }
+if REDIS_URL:
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'hosts': [REDIS_URL],
+    }
+
+# WebSocket 세션과 재전송용 알림은 cache에 저장하므로, 여러 워커가 공유하도록 REDIS_URL이 있으면 Redis cache 사용
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
 
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -57,6 +83,40 @@ REST_FRAMEWORK = {
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = 'media/'
+# 미디어 파일을 CDN으로 제공할 때의 주소 (예: https://cdn.example.com/media/), 비어 있으면 요청 host 기준 MEDIA_URL
+MEDIA_CDN_URL = config('MEDIA_CDN_URL', default='')
+
+# Try-On 작업 큐: 동시에 모델 서버를 호출하는 작업 수와 대기할 수 있는 작업 수 (초과 시 429)
+TRYON_MAX_WORKERS = config('TRYON_MAX_WORKERS', default=4, cast=int)
+TRYON_MAX_PENDING = config('TRYON_MAX_PENDING', default=16, cast=int)
+# Try-On 결과 캐시 최대 용량 (bytes), MEDIA_ROOT/tryon/cache를 공유하는 모든 워커 프로세스를 합한 값
+TRYON_CACHE_MAX_BYTES = config('TRYON_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int)
+# WebSocket 응답 JSON encoder ("auto": orjson이 설치되어 있으면 orjson, 아니면 표준 json)
+WS_JSON_ENCODER = config('WS_JSON_ENCODER', default='auto')
+# WebSocket 재연결 세션 유지 시간(초), 재연결 시 다시 보낼 그룹별 최근 알림 개수와 보관 시간(초)
+WS_SESSION_TTL = config('WS_SESSION_TTL', default=24 * 60 * 60, cast=int)
+WS_REPLAY_BUFFER_SIZE = config('WS_REPLAY_BUFFER_SIZE', default=100, cast=int)
+WS_REPLAY_TTL = config('WS_REPLAY_TTL', default=60 * 60, cast=int)
+# Try-On 이미지 보관 개수 (전체/사용자별, 원본과 결과 이미지를 각각 1개로 계산), 초과분은 백그라운드에서 오래된 순으로 삭제
+TRYON_RETENTION_MAX_FILES = config('TRYON_RETENTION_MAX_FILES', default=2000, cast=int)
+TRYON_RETENTION_MAX_FILES_PER_USER = config('TRYON_RETENTION_MAX_FILES_PER_USER', default=40, cast=int)
+TRYON_RETENTION_SWEEP_INTERVAL = config('TRYON_RETENTION_SWEEP_INTERVAL', default=300, cast=int)
+TRYON_RETENTION_BACKGROUND = config('TRYON_RETENTION_BACKGROUND', default=True, cast=bool)
+# 좋아요 수(like_count)를 Like 행 수로 다시 계산하는 주기(초)와 백그라운드 실행 여부
+LIKE_RECONCILE_INTERVAL = config('LIKE_RECONCILE_INTERVAL', default=60 * 60, cast=int)
+LIKE_RECONCILE_BACKGROUND = config('LIKE_RECONCILE_BACKGROUND', default=not TESTING, cast=bool)
+# 홈 화면 전체 디자인 스냅샷: 다시 생성하는 주기(초), chunk당 디자인 수, 백그라운드 생성 여부 (끄면 요청 처리 중에 생성)
+HOME_FEED_TTL = config('HOME_FEED_TTL', default=60, cast=int)
+HOME_FEED_CHUNK_SIZE = config('HOME_FEED_CHUNK_SIZE', default=100, cast=int)
+HOME_FEED_BACKGROUND = config('HOME_FEED_BACKGROUND', default=not TESTING, cast=bool)
+
+# 모델 서버(FastAPI) 연결 설정
+MODEL_SERVER_URL = config('MODEL_SERVER_URL', default='https://52b9-211-117-82-98.ngrok-free.app')
+MODEL_SERVER_CONNECT_TIMEOUT = config('MODEL_SERVER_CONNECT_TIMEOUT', default=3.0, cast=float)
+MODEL_SERVER_READ_TIMEOUT = config('MODEL_SERVER_READ_TIMEOUT', default=60.0, cast=float)
+MODEL_SERVER_MAX_RETRIES = config('MODEL_SERVER_MAX_RETRIES', default=2, cast=int)
+MODEL_SERVER_CIRCUIT_THRESHOLD = config('MODEL_SERVER_CIRCUIT_THRESHOLD', default=5, cast=int)
+MODEL_SERVER_CIRCUIT_RESET = config('MODEL_SERVER_CIRCUIT_RESET', default=30.0, cast=float)
 
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -83,6 +143,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
+    'nailo_be.middleware.UserIdentityMiddleware',
 ]
 
 
@@ -155,6 +216,7 @@ DATABASES = {
 }
 
 # 추후 MySQL 연결 예정
+# MySQL은 부분 인덱스(condition)를 만들지 않으므로 활성 디자인/샵 조회용 일반 인덱스를 마이그레이션(0012)에서 대신 생성
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.mysql',
@@ -32,6 +32,7 @@ urlpatterns = [
     path('api/nail-design/<uuid:design_key>/', DesignDetailView.as_view(), name='nail_design_detail'), #네일 디자인 상세 페이지
     path('api/try-on/', TryOnView.as_view(), name='try-on'), # 네일 입혀보기 기능 모델 서버 통신
     path('api/try-on-history/', TryOnHistoryView.as_view(), name='try-on-history'), # 입혀본 목록 반환
+    path('metrics/', metrics, name='metrics'), # WebSocket action 지표 (Prometheus)
     
     # Swagger documentation
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class NailoBeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
-    name = "nailo_be"
\ No newline at end of file
+    name = "nailo_be"
+
+    def ready(self):
+        # 캐시 무효화 signal 등록
+        from . import signals  # noqa: F401
@@ -1,18 +1,282 @@
+import asyncio
+import contextvars
 import json
 import logging
-from typing import Dict, Any
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, Any, List
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Exists, F
+from django.utils import timezone
 from .models import Request, Response, Designs, Shops, Customers
-from .serializers import RequestSerializer, ResponseSerializer, AddRequestSerializer, ResponseListSerializer
-from .utils import get_user_id
+from .serializers import RequestSerializer, ResponseSerializer, ResponseListSerializer
+from .utils import identity_cache, encode_cursor, keyset_filter
+from .geo import shop_index
+from .metrics import action_metrics
+from .encoders import get_encoder
+from .realtime import create_session, get_session, ack_session, current_seq, missed_events, publish
 
 logger = logging.getLogger('nailo_be.consumers')
 
+DEFAULT_NEARBY_RADIUS_M = 3000
+MAX_NEARBY_SHOPS = 100
+DEFAULT_REQUEST_PAGE_SIZE = 20
+MAX_REQUEST_PAGE_SIZE = 100
+# latest_cursor가 넘지 않는 최근 구간(초), 먼저 생성되었지만 늦게 커밋된 요청도 다음 since 응답에 포함
+REQUEST_SINCE_LOOKBACK = 5
+MAX_BATCH_ACTIONS = 20
+
+# batch 처리 중 reply()가 응답을 전달할 수집기
+_reply_sink = contextvars.ContextVar('reply_sink', default=None)
+# 처리 중인 action의 상태 (에러 응답 여부)
+_action_state = contextvars.ContextVar('action_state', default=None)
+
+# action 이름 -> {"handler": 메서드 이름, "schema": data 필드 타입, "concurrent": batch에서 함께 실행 가능 여부}
+ACTIONS: Dict[str, Dict[str, Any]] = {}
+
+def action(name: str, schema: Dict[str, Any] = None, concurrent: bool = False):
+    """
+    Consumer 메서드를 WebSocket action handler로 등록하는 decorator
+    - schema: data에 들어올 수 있는 필드와 타입, 값이 있는 필드만 타입을 검사
+    - concurrent: 조회만 하는 action이면 True (batch에서 다른 조회 action과 함께 실행)
+    """
+    def decorator(func):
+        ACTIONS[name] = {"handler": func.__name__, "schema": schema or {}, "concurrent": concurrent}
+        return func
+    return decorator
+
+def validate_action_data(schema: Dict[str, Any], params: Any) -> str:
+    """schema와 맞지 않으면 에러 메시지를, 맞으면 None을 반환"""
+    if not schema or params is None:
+        return None
+    if not isinstance(params, dict):
+        return "data must be an object"
+    for field, types in schema.items():
+        value = params.get(field)
+        if value is not None and not isinstance(value, types):
+            return f"Invalid type for {field}"
+    return None
+
+def request_rows(queryset):
+    """
+    get_requests 목록과 새 요청 알림(new_request)에서 함께 쓰는 요청 row 형식
+    응답에 필요한 컬럼만 dict로 조회 (UUID, datetime 변환은 encoder에서 처리)
+    """
+    return queryset.values(
+        'request_key', 'status', 'created_at', 'price', 'contents',
+        customer_name=F('customer__customer_name'),
+        design_name=F('design__design_name'),
+    )
+
+def format_request_detail(request, response) -> Dict[str, Any]:
+    """get_responses 목록과 새 응답 알림(new_response)에서 함께 쓰는 요청/응답 형식"""
+    return {
+        'request_key': request.request_key,
+        'status': request.status,
+        'created_at': request.created_at,
+        'request': {
+            'price': request.price,  # 고객이 제시한 희망 가격
+            'contents': request.contents,  # 고객의 요청 내용
+        },
+        'response': {
+            'response_key': response.response_key,
+            'price': response.price,  # 샵이 제시한 가격
+            'contents': response.contents,  # 샵의 응답 내용
+            'created_at': response.created_at
+        } if response else None
+    }
+
+def format_design_delta(request, response) -> Dict[str, Any]:
+    """요청 하나만 담은 get_responses의 디자인 항목 (디자인 → 샵 → 요청 → 응답)"""
+    return {
+        'design_key': request.design.design_key,
+        'design_name': request.design.design_name,
+        'shop_requests': [{
+            'shop_name': request.shop.shop_name,
+            'request_details': [format_request_detail(request, response)],
+        }],
+    }
+
+def build_response_list(customer_key) -> List[Dict[str, Any]]:
+    """
+    고객의 요청과 응답을 디자인 → 샵 → 요청 → 응답 구조로 묶어 반환합니다.
+    요청 이력의 크기와 관계없이 요청, 디자인, 샵, 최근 응답을 JOIN한 쿼리 1번으로 조회합니다.
+    """
+    # 고객의 모든 요청과 각 요청의 최근 응답을 함께 조회
+    requests = Request.objects.filter(
+        customer__customer_key=customer_key
+    ).select_related('design', 'shop', 'latest_response')
+
+    # 디자인별로 요청과 응답을 그룹화
+    design_requests = {}
+    for request in requests:
+        design_key = request.design.design_key
+        if design_key not in design_requests:
+            design_requests[design_key] = {
+                'design_key': design_key,
+                'design_name': request.design.design_name,
+                'shop_requests': {}
+            }
+
+        shop_key = request.shop.shop_key
+        if shop_key not in design_requests[design_key]['shop_requests']:
+            design_requests[design_key]['shop_requests'][shop_key] = {
+                'shop_name': request.shop.shop_name,
+                'request_details': []
+            }
+
+        # 요청과 응답을 구분하여 저장
+        request_detail = format_request_detail(request, request.latest_response)
+
+        design_requests[design_key]['shop_requests'][shop_key]['request_details'].append(request_detail)
+
+    # Dictionary를 리스트로 변환하고 shop_requests도 리스트로 변환
+    formatted_designs = []
+    for design in design_requests.values():
+        design['shop_requests'] = list(design['shop_requests'].values())
+        formatted_designs.append(design)
+    return formatted_designs
+
+def build_request_page(shop_key, limit=None, cursor=None, since=None) -> Dict[str, Any]:
+    """
+    샵이 받은 요청을 (created_at, request_key) 기준 keyset 페이지네이션으로 조회합니다.
+    - cursor: 해당 위치보다 오래된 요청을 최신순으로 반환
+    - since: 해당 위치보다 새로운 요청을 오래된 순으로 반환
+    created_at은 커밋 전에 정해지므로 latest_cursor는 최근 REQUEST_SINCE_LOOKBACK초 이전 위치까지만 전진하고,
+    다음 since 응답에는 이미 받은 요청이 다시 포함될 수 있음 (request_key로 중복 제거)
+    """
+    limit = min(int(limit or DEFAULT_REQUEST_PAGE_SIZE), MAX_REQUEST_PAGE_SIZE)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    if cursor and since:
+        raise ValueError("cursor and since cannot be used together")
+
+    requests = request_rows(Request.objects.filter(shop_id=shop_key))
+    if since:
+        requests = keyset_filter(requests, since, 'created_at', 'request_key', descending=False)
+        requests = requests.order_by('created_at', 'request_key')
+    else:
+        if cursor:
+            requests = keyset_filter(requests, cursor, 'created_at', 'request_key')
+        requests = requests.order_by('-created_at', '-request_key')
+
+    requests = list(requests[:limit + 1])
+    has_more = len(requests) > limit
+    requests = requests[:limit]
+
+    if since:
+        newest = requests[-1] if requests else None
+        next_cursor = None
+    else:
+        newest = requests[0] if requests and not cursor else None
+        next_cursor = encode_cursor(requests[-1]["created_at"], requests[-1]["request_key"]) if has_more else None
+
+    horizon = timezone.now() - timedelta(seconds=REQUEST_SINCE_LOOKBACK)
+    if newest is None:
+        latest_cursor = since
+    elif newest["created_at"] <= horizon or (since and has_more):
+        # 남은 요청이 더 있으면 같은 페이지를 반복하지 않도록 마지막 요청 위치로 전진
+        latest_cursor = encode_cursor(newest["created_at"], newest["request_key"])
+    else:
+        latest_cursor = encode_cursor(horizon, uuid.UUID(int=0))
+
+    return {
+        "requests": requests,
+        "next_cursor": next_cursor,
+        "latest_cursor": latest_cursor,
+        "has_more": has_more,
+    }
+
+def create_service_request(customer_key, design_key, shop_key, contents='') -> Dict[str, Any]:
+    """
+    시술 요청을 생성하고 {"request_key", "shop_key", "request", "timings"}를 반환합니다.
+    request는 get_requests 목록과 같은 형식의 row입니다.
+    고객/디자인/샵 존재 여부와 디자인 가격을 한 번의 쿼리로 확인하고, 한 트랜잭션에서 생성합니다.
+    없는 대상이 있으면 해당 모델의 DoesNotExist가 발생합니다.
+    """
+    timings = {}
+    started = time.perf_counter()
+    with transaction.atomic():
+        design = Designs.objects.filter(design_key=design_key).annotate(
+            customer_exists=Exists(Customers.objects.filter(customer_key=customer_key)),
+            shop_exists=Exists(Shops.objects.filter(shop_key=shop_key)),
+        ).values('price', 'customer_exists', 'shop_exists').first()
+
+        if design is None:
+            raise Designs.DoesNotExist("Designs matching query does not exist.")
+        if not design['customer_exists']:
+            raise Customers.DoesNotExist("Customers matching query does not exist.")
+        if not design['shop_exists']:
+            raise Shops.DoesNotExist("Shops matching query does not exist.")
+        timings['validate'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        request = Request.objects.create(
+            customer_id=customer_key,
+            shop_id=shop_key,
+            design_id=design_key,
+            price=design['price'],
+            status="pending",
+            contents=contents,
+        )
+    timings['create'] = time.perf_counter() - started
+
+    row = request_rows(Request.objects.filter(pk=request.pk)).get()
+    return {"request_key": request.request_key, "shop_key": shop_key, "request": row, "timings": timings}
+
+class RequestAlreadyAnswered(Exception):
+    """이미 응답한 시술 요청"""
+
+def respond_to_request(request_key, status, price=None, contents='') -> Dict[str, Any]:
+    """
+    대기 중인 시술 요청의 상태를 바꾸고 Response를 생성합니다.
+    status는 pending인 경우에만 조건부 UPDATE로 변경하므로 동시에 응답해도 한 번만 성공하고,
+    나머지는 RequestAlreadyAnswered가 발생합니다. 요청이 없으면 Request.DoesNotExist가 발생합니다.
+    생성한 Response는 같은 트랜잭션에서 요청의 latest_response로 연결합니다.
+    """
+    with transaction.atomic():
+        claimed = Request.objects.filter(request_key=request_key, status='pending').update(status=status)
+        if not claimed:
+            if Request.objects.filter(request_key=request_key).exists():
+                raise RequestAlreadyAnswered(request_key)
+            raise Request.DoesNotExist("Request matching query does not exist.")
+
+        request = Request.objects.select_related('customer', 'shop', 'design').get(request_key=request_key)
+        response = Response.objects.create(
+            request=request,
+            customer=request.customer,
+            shop=request.shop,
+            price=price if price is not None else request.price,
+            contents=contents,
+        )
+        Request.objects.filter(request_key=request_key).update(latest_response=response)
+
+    return {
+        "response_key": response.response_key,
+        "request_key": request.request_key,
+        "customer_key": request.customer.customer_key,
+        "shop_name": request.shop.shop_name,
+        "design": format_design_delta(request, response),
+    }
+
 class NailServiceConsumer(AsyncWebsocketConsumer):
 
     """네일 서비스 WebSocket Consumer"""
+
+    # 응답 JSON encoder 이름 ("auto" | "json" | "orjson"), None이면 settings.WS_JSON_ENCODER
+    json_encoder = None
+
+    # 재연결 시 재전송한 알림 번호, 같은 알림이 실시간으로 다시 도착하면 건너뜀
+    replayed_seqs = frozenset()
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        """응답을 JSON 문자열로 변환합니다. UUID, Decimal, datetime은 encoder가 변환합니다."""
+        return get_encoder(self.json_encoder).dumps(payload)
     
     async def connect(self) -> None:
         """
@@ -21,24 +285,42 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
         Headers:
         - x-user-type: "customer" | "shop"
         - x-user-id: str
+
+        Query String (재연결 시):
+        - session: 이전 연결에서 받은 세션 토큰, 유효하면 사용자 조회 없이 연결
+        - last_seq: 마지막으로 받은 알림 번호, 없으면 ack로 확인한 번호 사용
+        이후 도착한 알림은 연결 메시지 다음에 다시 전송됩니다.
         """
         try:
             self.user_type = self.scope['url_route']['kwargs']['user_type']
             self.user_id = self.scope['url_route']['kwargs']['user_id']
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            token = query.get('session', [None])[0]
             
             logger.info(f"Connection attempt: user_type={self.user_type}, user_id={self.user_id}")
             
-            # 사용자 객체 가져오기
-            user, user_type = await database_sync_to_async(get_user_id)(self.user_type, self.user_id)
-            self.user = user
-            self.user_type = user_type
+            session = await get_session(token, self.user_type, self.user_id) if token else None
+            if session is not None:
+                # 세션으로 재연결하면 사용자를 다시 조회하지 않음
+                user_key, user_name = session['key'], session['name']
+                last_seq = int(query.get('last_seq', [session['last_seq']])[0])
+            else:
+                # 사용자 객체 가져오기
+                user, user_type = await database_sync_to_async(identity_cache.get)(self.user_type, self.user_id)
+                if user is None or user_type not in ("customer", "shop"):
+                    raise ValueError(f"User not found: {self.user_type} {self.user_id}")
+                user_key = user.customer_key if user_type == "customer" else user.shop_key
+                user_name = str(user)
+                token = await create_session(self.user_type, self.user_id, user_key, user_name)
+                last_seq = None
+            self.session_token = token
             
             # 고객 또는 샵의 key값 가져오기
             if self.user_type == "customer":
-                self.customer_key = self.user.customer_key
+                self.customer_key = user_key
                 self.group_name = f"customer_{self.customer_key}"
             elif self.user_type == "shop":          
-                self.shop_key = self.user.shop_key
+                self.shop_key = user_key
                 self.group_name = f"shop_{self.shop_key}"        
                 
             # 그룹에 추가
@@ -49,17 +331,22 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
             await self.accept()
 
             # 연결 성공 시 프론트에 알림
-            if self.user_type == "customer":
-                await self.send(text_data=json.dumps({
-                    "message": f"Connected as customer: {self.user}, key={self.customer_key}"
-                }, ensure_ascii=False))
-                logger.info(f"Connected to customer: {self.user}, key={self.customer_key}")
-            
-            elif self.user_type == "shop":
-                await self.send(text_data=json.dumps({
-                    "message": f"Connected as shop: {self.user}, key={self.shop_key}"
-                }, ensure_ascii=False))
-                logger.info(f"Connected to shop: {self.user}, key={self.shop_key}")
+            seq = await current_seq(self.group_name)
+            await self.send(text_data=self.encode({
+                "message": f"Connected as {self.user_type}: {user_name}, key={user_key}",
+                "session": token,
+                "seq": seq,
+            }))
+            logger.info(f"Connected to {self.user_type}: {user_name}, key={user_key}")
+
+            # 재연결이면 놓친 알림을 다시 전송
+            # group_add 이후 발행된 알림은 실시간 전송과 재전송에 모두 포함될 수 있으므로
+            # 재전송한 번호의 실시간 알림은 notify에서 한 번 건너뜀
+            if last_seq is not None:
+                events = await missed_events(self.group_name, last_seq)
+                self.replayed_seqs = {event["seq"] for event in events}
+                for event in events:
+                    await getattr(self, event["type"])({**event, "replayed": True})
         
         except ValueError as e:
             logger.error(f"WebSocket connection error: {str(e)}")
@@ -71,11 +358,61 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         """WebSocket 연결 종료를 처리합니다."""
+        group_name = getattr(self, 'group_name', None)
+        if group_name is None:
+            # 연결에 실패한 경우
+            return
         await self.channel_layer.group_discard(
-            self.group_name,
+            group_name,
             self.channel_name
         )
-        logger.info(f"WebSocket connection closed for {self.user_type}: {self.user.customer_id if self.user_type == 'customer' else self.user.shop_id}")
+        logger.info(f"WebSocket connection closed for {self.user_type}: {self.user_id}")
+
+    async def notify(self, event: Dict[str, Any], payload: Dict[str, Any]) -> None:
+        """
+        그룹 알림을 전송합니다. 재연결 시 이어받을 수 있도록 알림 번호(seq)를 함께 보냅니다.
+        연결 시 이미 재전송한 알림이 실시간으로 다시 도착하면 보내지 않습니다.
+        알림은 발행 순서와 다르게 도착할 수 있으므로 번호 크기로는 거르지 않습니다.
+        """
+        seq = event.get("seq")
+        if not event.get("replayed") and seq in self.replayed_seqs:
+            self.replayed_seqs.discard(seq)
+            return
+        await self.send(text_data=self.encode({**payload, "seq": seq}))
+
+    @action("ack", schema={"seq": int})
+    async def handle_ack(self, data: Dict[str, Any]) -> None:
+        """
+        받은 알림 번호를 확인합니다. 세션 토큰으로 재연결하면 이 번호 이후의 알림을 다시 받습니다.
+
+        Expected Format:
+        {
+            "action": "ack",
+            "data": {
+                "seq": int
+            }
+        }
+        """
+        seq = (data.get('data') or {}).get('seq')
+        if seq is None:
+            await self.reply({"error": "seq is required"})
+            return
+        await ack_session(self.session_token, seq)
+
+    async def reply(self, payload: Dict[str, Any]) -> None:
+        """
+        요청한 클라이언트에게 응답을 전송합니다.
+        batch 처리 중에는 바로 전송하지 않고 batch의 응답 수집기로 전달합니다.
+        """
+        state = _action_state.get()
+        if state is not None and "error" in payload:
+            state["error"] = True
+
+        sink = _reply_sink.get()
+        if sink is not None:
+            await sink(payload)
+            return
+        await self.send(text_data=self.encode(payload))
 
     async def receive(self, text_data: str) -> None:
         """
@@ -83,43 +420,159 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
         
         Expected Format:
         {
-            "action": str,  # "nearby_shops" | "request_service" | "respond_service" | "get_responses"
+            "action": str,  # ACTIONS에 등록된 action
             ... action별 추가 데이터
         }
         """
         try:
             data = json.loads(text_data)
-            action = data.get("action")
-
-            if action == "nearby_shops":
-                await self.handle_nearby_shops(data)
-            elif action == "request_service":
-                await self.handle_service_request(data)
-            elif action == "respond_service":
-                await self.handle_service_response(data)
-            elif action == "get_responses":
-                await self.handle_get_responses(data)
-            elif action == "get_requests": 
-                await self.handle_get_requests(data)
-            elif action == "try_on":
-                await self.handle_try_on(data)
-            else:
-                await self.send(text_data=json.dumps({
-                    "error": f"Unknown action: {action}"
-                }, ensure_ascii=False))
+            await self.dispatch_action(data.get("action"), data)
         except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": "Invalid JSON format"
-            }))
+            })
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": str(e)
-            }))
+            })
+
+    async def dispatch_action(self, action_name: str, data: Dict[str, Any]) -> None:
+        """
+        ACTIONS에서 action의 handler를 찾아 실행하고 처리 시간, 처리 중인 개수, 에러 개수를 기록합니다.
+        handler가 error 응답을 보내거나 예외가 발생하면 에러로 집계합니다.
+        """
+        spec = ACTIONS.get(action_name)
+        if spec is None:
+            action_metrics.error("unknown")
+            await self.reply({
+                "error": f"Unknown action: {action_name}"
+            })
+            return
+
+        error = validate_action_data(spec["schema"], data.get("data"))
+        if error:
+            action_metrics.error(action_name)
+            await self.reply({"error": error})
+            return
+
+        state = {"error": False}
+        token = _action_state.set(state)
+        action_metrics.start(action_name)
+        started = time.perf_counter()
+        try:
+            await getattr(self, spec["handler"])(data)
+        except Exception:
+            state["error"] = True
+            raise
+        finally:
+            action_metrics.finish(action_name, time.perf_counter() - started, error=state["error"])
+            _action_state.reset(token)
+
+    @action("batch")
+    async def handle_batch(self, data: Dict[str, Any]) -> None:
+        """
+        여러 action을 한 번에 처리합니다.
+        조회 action(concurrent=True로 등록된 action)이 연속되면 asyncio.gather로 함께 실행하고,
+        그 외 action은 보낸 순서대로 하나씩 실행합니다.
+
+        Expected Format:
+        {
+            "action": "batch",
+            "mode": "combined" | "stream",  # 기본 combined
+            "actions": [
+                {"id": str, "action": str, "data": {...}}
+            ]
+        }
+
+        Response Format:
+        - combined: 모든 action이 끝난 뒤 한 번에 전송
+        {
+            "type": "batch_result",
+            "results": [
+                {"id": str, "responses": [{...}]}  # 보낸 순서대로, id가 없으면 action의 순번
+            ]
+        }
+        - stream: action의 응답마다 id를 붙여 바로 전송하고, 마지막에 완료 알림 전송
+        {"id": str, ... action 응답}
+        {"type": "batch_complete", "ids": [str]}
+        """
+        actions = data.get("actions")
+        mode = data.get("mode", "combined")
+        if not isinstance(actions, list) or not actions:
+            await self.reply({"error": "actions must be a non-empty list"})
+            return
+        if len(actions) > MAX_BATCH_ACTIONS:
+            await self.reply({"error": f"Too many actions in batch (max {MAX_BATCH_ACTIONS})"})
+            return
+        if mode not in ("combined", "stream"):
+            await self.reply({"error": f"Unknown batch mode: {mode}"})
+            return
 
+        items = []
+        for index, item in enumerate(actions):
+            if not isinstance(item, dict):
+                await self.reply({"error": "Each batch action must be an object"})
+                return
+            if item.get("action") == "batch":
+                await self.reply({"error": "Nested batch is not allowed"})
+                return
+            items.append((item.get("id", index), item))
+
+        responses = [[] for _ in items]
+
+        async def run(index, item_id, item):
+            async def collect(payload):
+                if mode == "stream":
+                    await self.send(text_data=self.encode({"id": item_id, **payload}))
+                else:
+                    responses[index].append(payload)
+
+            # gather는 action마다 별도 Task(context 복사본)로 실행하므로 수집기가 섞이지 않음
+            _reply_sink.set(collect)
+            try:
+                await self.dispatch_action(item.get("action"), item)
+            except Exception as e:
+                await collect({"error": str(e)})
+
+        # 연속된 조회 action은 함께, 나머지는 순서대로 실행
+        group = []
+        for index, (item_id, item) in enumerate(items + [(None, None)]):
+            if item is not None and ACTIONS.get(item.get("action"), {}).get("concurrent"):
+                group.append(asyncio.ensure_future(run(index, item_id, item)))
+                continue
+            if group:
+                await asyncio.gather(*group)
+                group = []
+            if item is not None:
+                await asyncio.ensure_future(run(index, item_id, item))
+
+        ids = [item_id for item_id, _ in items]
+        if mode == "stream":
+            await self.reply({"type": "batch_complete", "ids": ids})
+        else:
+            await self.reply({
+                "type": "batch_result",
+                "results": [{"id": item_id, "responses": responses[index]} for index, item_id in enumerate(ids)],
+            })
+
+    @action("nearby_shops", schema={"lat": (int, float, str), "lng": (int, float, str), "radius": (int, float, str), "k": (int, str)}, concurrent=True)
     async def handle_nearby_shops(self, data: Dict[str, Any]) -> None:
         """
         주변 네일샵 정보를 조회합니다.
-        
+        위치(lat, lng)와 함께 radius(m) 또는 k를 보내면 가까운 순으로 정렬된 샵만 반환합니다.
+        위치가 없으면 활성화된 모든 샵을 반환합니다.
+
+        Expected Format:
+        {
+            "action": "nearby_shops",
+            "data": {
+                "lat": float,
+                "lng": float,
+                "radius": float,  # 반경(m), k와 함께 보내면 반경 내 가까운 k개
+                "k": int
+            }
+        }
+
         Response Format:
         {
             "type": "shop_list",
@@ -130,43 +583,58 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
                     "shop_id": str,
                     "lat": float,
                     "lng": float,
-                    "shop_url": str
+                    "shop_url": str,
+                    "distance": float
                 }
             ]
         }
         """
         try:
-            # 활성화된 모든 샵 조회
-            shops = await database_sync_to_async(list)(
-                Shops.objects.filter(is_active=True).values(
-                    'shop_key',
-                    'shop_name',
-                    'shop_id',
-                    'lat',
-                    'lng',
-                    'shop_url'
-                )
-            )
-
-            # UUID는 JSON 직렬화가 안 되므로 문자열로 변환
-            for shop in shops:
-                shop['shop_key'] = str(shop['shop_key'])
-                # Decimal 타입의 위도/경도를 float로 변환
-                shop['lat'] = float(shop['lat'])
-                shop['lng'] = float(shop['lng'])
-
-            print("Processed shops data:", shops)
-            
-            await self.send(text_data=json.dumps({
+            params = data.get('data') or {}
+            lat, lng = params.get('lat'), params.get('lng')
+            radius, k = params.get('radius'), params.get('k')
+
+            if lat is None or lng is None:
+                if radius is not None or k is not None:
+                    await self.reply({
+                        "error": "lat and lng are required"
+                    })
+                    return
+                shops = await database_sync_to_async(lambda: shop_index.get().shops)()
+            else:
+                lat, lng = float(lat), float(lng)
+                if radius is None and k is None:
+                    radius = DEFAULT_NEARBY_RADIUS_M
+                radius = float(radius) if radius is not None else None
+                k = min(int(k), MAX_NEARBY_SHOPS) if k is not None else None
+                # 반경과 개수는 양수만 허용 (NaN 반경도 거부)
+                if (radius is not None and not radius > 0) or (k is not None and k <= 0):
+                    raise ValueError("radius and k must be positive")
+
+                @database_sync_to_async
+                def find_shops():
+                    index = shop_index.get()
+                    if radius is None:
+                        return index.nearest(lat, lng, k)
+                    return index.within(lat, lng, radius, limit=k)
+
+                shops = await find_shops()
+
+            await self.reply({
                 "type": "shop_list",
                 "shops": shops
-            }, ensure_ascii=False))
+            })
 
+        except (TypeError, ValueError):
+            await self.reply({
+                "error": "Invalid location parameters"
+            })
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": str(e)
-            }))
+            })
         
+    @action("request_service", schema={"customer_key": str, "design_key": str, "shop_key": str, "contents": str})
     async def handle_service_request(self, data: Dict[str, Any]) -> None:
         """
         시술 요청을 처리합니다.
@@ -192,68 +660,65 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
         try:
             serializer = RequestSerializer(data=data.get('data', {}))
             if not serializer.is_valid():
-                await self.send(text_data=json.dumps({
+                await self.reply({
                     "error": serializer.errors
-                }))
+                })
                 return
 
-            # 데이터 검증
-            customer = await database_sync_to_async(Customers.objects.get)(
-                customer_key=serializer.validated_data['customer_key']
-            )
-            design = await database_sync_to_async(Designs.objects.get)(
-                design_key=serializer.validated_data['design_key']
-            )
-            shop = await database_sync_to_async(Shops.objects.get)(
-                shop_key=serializer.validated_data['shop_key']
+            # 검증과 생성을 한 번의 thread 전환, 한 트랜잭션에서 처리
+            started = time.perf_counter()
+            created = await database_sync_to_async(create_service_request)(
+                serializer.validated_data['customer_key'],
+                serializer.validated_data['design_key'],
+                serializer.validated_data['shop_key'],
+                serializer.validated_data.get('contents', ''),
             )
-
-            # Request 생성
-            request = await database_sync_to_async(Request.objects.create)(
-                customer=customer,
-                shop=shop,
-                design=design,
-                price=design.price,  
-                status="pending",   
-                contents=serializer.validated_data.get('contents', '')
-            )
-
-            # 시리얼라이즈
-            request_serializer = AddRequestSerializer(request)
-            request_data = await database_sync_to_async(lambda: request_serializer.data)()
+            timings = {'db': time.perf_counter() - started, **created['timings']}
+            request_key = str(created['request_key'])
 
             # 네일샵에 알림 전송
-            await self.channel_layer.group_send(
-                f"shop_{shop.shop_key}",
+            started = time.perf_counter()
+            await publish(
+                f"shop_{created['shop_key']}",
                 {
                     "type": "notify_shop_new_request",
-                    "request_key": str(request.request_key),
+                    "request_key": request_key,
+                    "request": created['request'],
                 }
             )
+            timings['notify'] = time.perf_counter() - started
 
             # 요청자에게 응답
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "type": "completed_request",
                 "status": "pending",
                 "message": "시술 요청이 완료되었습니다.",
-                "request_key": str(request.request_key)
-            }, ensure_ascii=False))
+                "request_key": request_key
+            })
+
+            for phase, duration in timings.items():
+                action_metrics.observe_phase("request_service", phase, duration)
+            logger.info(
+                f"request_service {request_key} timings: "
+                + ", ".join(f"{phase}={duration * 1000:.1f}ms" for phase, duration in timings.items())
+            )
 
         except (Customers.DoesNotExist, Designs.DoesNotExist) as e:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": str(e)
-            }))
+            })
         
         except Shops.DoesNotExist:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": "Invalid shop_key: Shop not found"
-            }, ensure_ascii=False))
+            })
             return
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": str(e)
-            }))
+            })
 
+    @action("respond_service", schema={"request_key": str, "status": str, "price": (int, str), "contents": str})
     async def handle_service_response(self, data: Dict[str, Any]) -> None:
         """
         시술 요청에 대한 응답을 처리합니다.
@@ -284,102 +749,97 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
             data = data.get('data', {})
             serializer = ResponseSerializer(data=data)
             if not serializer.is_valid():
-                await self.send(text_data=json.dumps({
+                await self.reply({
                     "error": serializer.errors
-                }))
+                })
                 return
 
-            request = await database_sync_to_async(Request.objects.get)(
-                request_key=data['request_key']
-            )
-
             response_status = serializer.validated_data['status']
             
             if response_status not in ['accepted', 'rejected']:
-                await self.send(text_data=json.dumps({
+                await self.reply({
                     "error": "Invalid response status"
-                }, ensure_ascii=False))
+                })
                 return
 
-            # Request 상태 업데이트
-            request.status = response_status
-            await database_sync_to_async(request.save)()
-
-            # Response 객체 생성
-            @database_sync_to_async
-            def create_response():
-                return Response.objects.create(
-                    request=request,
-                    customer=request.customer,
-                    shop=request.shop,
-                    price=data.get('price', request.price),
-                    contents=serializer.validated_data.get('contents', '')
-                )
-
-            response = await create_response()
-
-            # response_data 생성
-            response_data = {
-                "shop_name": response.shop.shop_name,
-                "price": response.price,
-                "contents": response.contents
-            }
+            # 상태 변경과 Response 생성을 한 번의 thread 전환, 한 트랜잭션에서 처리
+            # (event loop에서는 DB를 조회하지 않도록 필요한 값을 모두 dict로 반환)
+            response = await database_sync_to_async(respond_to_request)(
+                serializer.validated_data['request_key'],
+                response_status,
+                price=serializer.validated_data.get('price'),
+                contents=serializer.validated_data.get('contents', ''),
+            )
 
             # 1. 네일샵에게 응답
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "type": "completed_response",
                 "message": "응답이 완료되었습니다.",
-                "response_key": str(response.response_key)
-            }, ensure_ascii=False))
+                "response_key": str(response['response_key'])
+            })
 
             # 2. 고객에게 새 응답 알림 
-            await self.channel_layer.group_send(
-                f"customer_{request.customer.customer_key}",
+            await publish(
+                f"customer_{response['customer_key']}",
                 {
                     "type": "notify_customer_new_response",
-                    "shop_name": response.shop.shop_name,
-                    "request_key": str(request.request_key)
+                    "shop_name": response['shop_name'],
+                    "request_key": str(response['request_key']),
+                    "design": response['design'],
                 }
             )
             
         except Request.DoesNotExist:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": "Request not found"
-            }))
+            })
+        except RequestAlreadyAnswered:
+            await self.reply({
+                "error": "Request has already been answered"
+            })
+        except Exception as e:
+            await self.reply({
+                "error": str(e)
+            })
             
     async def notify_customer_request_sent(self, event: Dict[str, Any]) -> None:
         """고객의 요청이 정상적으로 전송되었음을 고객에게 알림"""
-        await self.send(text_data=json.dumps({
+        await self.notify(event, {
             "type": "completed_request",
             "status": "pending",
             "request_data": event["response_data"]
-        }, ensure_ascii=False))
+        })
 
     async def notify_shop_response_sent(self, event: Dict[str, Any]) -> None:
         """샵의 응답이 정상적으로 전송되었음을 샵에게 알림"""
-        await self.send(text_data=json.dumps({
+        await self.notify(event, {
             "type": "completed_response",
             "status": event["status"],
             "response_data": event["response_data"]
-        }, ensure_ascii=False))
+        })
 
     async def notify_shop_new_request(self, event: Dict[str, Any]) -> None:
         """고객의 요청이 도착했음을 샵에게 알림"""
-        await self.send(text_data=json.dumps({
+        await self.notify(event, {
             "type": "new_request",
             "message": "새로운 시술 요청이 도착했습니다.",
-            "request_key": event["request_key"]
-        }, ensure_ascii=False))
+            "request_key": event["request_key"],
+            # get_requests의 requests 항목과 같은 형식
+            "request": event.get("request"),
+        })
 
     async def notify_customer_new_response(self, event: Dict[str, Any]) -> None:
         """샵의 응답이 도착했음을 고객에게 알림"""
-        await self.send(text_data=json.dumps({
+        await self.notify(event, {
             "type": "new_response",
             "message": "요청에 대한 응답이 도착했습니다.",
             "shop_name": event["shop_name"],
-            "request_key": event["request_key"]
-        }, ensure_ascii=False))
+            "request_key": event["request_key"],
+            # get_responses의 designs 항목과 같은 형식 (이 요청만 포함)
+            "design": event.get("design"),
+        })
         
+    @action("get_responses", schema={"customer_key": str}, concurrent=True)
     async def handle_get_responses(self, data: Dict[str, Any]) -> None:
         """
         디자인별 응답 목록을 조회합니다.
@@ -426,83 +886,37 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
         try:
             customer_key = data.get('data', {}).get('customer_key')
             if not customer_key:
-                await self.send(text_data=json.dumps({
+                await self.reply({
                     "error": "customer key is required"
-                }))
+                })
                 return
 
-            # 고객의 모든 요청을 디자인별로 그룹화하여 조회
-            requests = Request.objects.filter(
-                customer__customer_key=customer_key
-            ).select_related('design', 'shop')
-            
-            requests = await database_sync_to_async(list)(requests)
-
-            # 디자인별로 요청과 응답을 그룹화
-            design_requests = {}
-            for request in requests:
-                design_key = str(request.design.design_key)
-                if design_key not in design_requests:
-                    design_requests[design_key] = {
-                        'design_key': design_key,
-                        'design_name': request.design.design_name,
-                        'shop_requests': {}
-                    }
-
-                shop_key = str(request.shop.shop_key)
-                if shop_key not in design_requests[design_key]['shop_requests']:
-                    design_requests[design_key]['shop_requests'][shop_key] = {
-                        'shop_name': request.shop.shop_name,
-                        'request_details': []
-                    }
-
-                # 해당 요청에 대한 응답들 조회
-                responses = Response.objects.filter(request=request).select_related('shop')
-                responses = await database_sync_to_async(list)(responses)
-
-                # 요청과 응답을 구분하여 저장
-                request_detail = {
-                    'request_key': str(request.request_key),
-                    'status': request.status,
-                    'created_at': request.created_at.isoformat(),
-                    'request': {
-                        'price': request.price,  # 고객이 제시한 희망 가격
-                        'contents': request.contents,  # 고객의 요청 내용
-                    },
-                    'response': {
-                        'response_key': str(responses[0].response_key) if responses else None,
-                        'price': responses[0].price if responses else None,  # 샵이 제시한 가격
-                        'contents': responses[0].contents if responses else None,  # 샵의 응답 내용
-                        'created_at': responses[0].created_at.isoformat() if responses else None
-                    } if responses else None
-                }
-
-                design_requests[design_key]['shop_requests'][shop_key]['request_details'].append(request_detail)
+            formatted_designs = await database_sync_to_async(build_response_list)(customer_key)
 
-            # Dictionary를 리스트로 변환하고 shop_requests도 리스트로 변환
-            formatted_designs = []
-            for design in design_requests.values():
-                design['shop_requests'] = list(design['shop_requests'].values())
-                formatted_designs.append(design)
-
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "type": "response_list",
                 "designs": formatted_designs
-            }, ensure_ascii=False))
+            })
 
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": str(e)
-            }))
+            })
     
+    @action("get_requests", schema={"shop_key": str, "limit": (int, str), "cursor": str, "since": str}, concurrent=True)
     async def handle_get_requests(self, data: Dict[str, Any]) -> None:
         """
-        샵 화면에서 고객의 요청 목록을 조회합니다.
+        샵 화면에서 고객의 요청 목록을 최신순으로 조회합니다.
+        cursor를 보내면 해당 위치 이전(더 오래된) 요청을, since를 보내면 해당 위치 이후에 새로 도착한 요청만 반환합니다.
+        since 응답에는 최근 5초 안에 생성되어 이미 받은 요청이 다시 포함될 수 있으므로 request_key로 중복을 제거합니다.
 
         {
             "action": "get_requests",
             "data": {
-                "shop_key": str
+                "shop_key": str,
+                "limit": int,  # 기본 20, 최대 100
+                "cursor": str,  # 이전 응답의 next_cursor
+                "since": str  # 이전 응답의 latest_cursor
             }
         }
         
@@ -519,54 +933,59 @@ class NailServiceConsumer(AsyncWebsocketConsumer):
                     "price": int,
                     "contents": str
                 }
-            ]
+            ],
+            "next_cursor": str,  # 더 오래된 요청이 남아있을 때만
+            "latest_cursor": str,  # 다음 since 요청에 사용할 가장 최신 요청의 위치
+            "has_more": bool
         }
         """
         try:
-            shop_key = data.get('data', {}).get('shop_key')
+            params = data.get('data', {})
+            shop_key = params.get('shop_key')
             if not shop_key:
-                await self.send(text_data=json.dumps({
+                await self.reply({
                     "error": "shop key is required"
-                }))
+                })
                 return
 
-            requests = Request.objects.filter(
-                shop__shop_key=shop_key
-            ).select_related('customer', 'design')
-            
-            requests = await database_sync_to_async(list)(requests)
-
-            formatted_requests = []
-            for request in requests:
-                formatted_requests.append({
-                    "request_key": str(request.request_key),
-                    "customer_name": request.customer.customer_name,
-                    "design_name": request.design.design_name,
-                    "status": request.status,
-                    "created_at": request.created_at.isoformat(),
-                    "price": request.price,
-                    "contents": request.contents
-                })
+            page = await database_sync_to_async(build_request_page)(
+                shop_key,
+                limit=params.get('limit'),
+                cursor=params.get('cursor'),
+                since=params.get('since'),
+            )
 
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "type": "request_list",
-                "requests": formatted_requests
-            }, ensure_ascii=False))
+                **page
+            })
 
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.reply({
                 "error": str(e)
-            }))
+            })
     
     async def notify_tryon_result(self, event):
         """
-        WebSocket 그룹에 Try-On 결과 알림을 전송합니다.
+        WebSocket 그룹에 Try-On 작업 결과 알림을 전송합니다.
+        status: "completed" | "failed"
         """
-        await self.send(
-            text_data=json.dumps({
+        if event.get("status") == "failed":
+            await self.notify(event, {
                 "type": "tryon_result",
-                "message": "이미지가 생성되었습니다.",
-                # "original_image": event["original_image"],
-                # "predicted_image": event["predicted_image"]
-            }, ensure_ascii=False)
-        )
+                "job_id": event.get("job_id"),
+                "status": "failed",
+                "message": "이미지 생성에 실패했습니다.",
+                "error": event.get("error"),
+            })
+            return
+
+        await self.notify(event, {
+            "type": "tryon_result",
+            "job_id": event.get("job_id"),
+            "status": "completed",
+            "message": "이미지가 생성되었습니다.",
+            "design_key": event.get("design_key"),
+            # "original_image": event["original_image"],
+            # "predicted_image": event["predicted_image"]
+        })
@@ -0,0 +1,74 @@
+import datetime
+import decimal
+import json
+import uuid
+import logging
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # orjson이 없으면 표준 json 사용
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+def default(obj):
+    """표준 JSON 타입이 아닌 값 변환 (UUID → str, Decimal → float, 날짜/시간 → ISO 8601)"""
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class StdlibEncoder:
+    """표준 json 모듈 encoder"""
+
+    name = 'json'
+
+    def dumps(self, payload):
+        return json.dumps(payload, ensure_ascii=False, default=default)
+
+class OrjsonEncoder:
+    """
+    orjson encoder, UUID와 datetime은 orjson이 직접 변환
+    WebSocket text frame으로 보내야 하므로 str로 반환
+    """
+
+    name = 'orjson'
+
+    def dumps(self, payload):
+        return orjson.dumps(payload, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+ENCODERS = {
+    StdlibEncoder.name: StdlibEncoder,
+    OrjsonEncoder.name: OrjsonEncoder,
+}
+
+_encoders = {}
+
+def get_encoder(name=None):
+    """
+    이름에 해당하는 encoder 반환 (None이면 settings.WS_JSON_ENCODER)
+    "auto"는 orjson이 설치되어 있으면 orjson, 없으면 표준 json
+    """
+    name = name or getattr(settings, 'WS_JSON_ENCODER', 'auto')
+    if name == 'auto':
+        name = OrjsonEncoder.name if orjson is not None else StdlibEncoder.name
+    if name == OrjsonEncoder.name and orjson is None:
+        logger.warning("orjson is not installed, falling back to json")
+        name = StdlibEncoder.name
+
+    encoder = _encoders.get(name)
+    if encoder is None:
+        encoder = _encoders[name] = ENCODERS[name]()
+    return encoder
+
+def to_primitive(payload):
+    """
+    UUID, Decimal, datetime을 포함한 값을 JSON 기본 타입만으로 변환
+    channel layer(msgpack)로 보내는 이벤트처럼 encoder를 거치지 않는 경로에서 사용
+    """
+    return json.loads(get_encoder().dumps(payload))
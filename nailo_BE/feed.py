@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .models import Designs
+from .serializers import DesignSerializer
+from .utils import encode_cursor, keyset_filter
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "home_feed:version"
+SNAPSHOT_KEY = "home_feed:snapshot"
+LOCK_KEY = "home_feed:lock"
+LOCK_TIMEOUT = 30  # 생성 중 프로세스가 종료되어도 잠금이 풀리는 시간(초)
+BUILD_WAIT = 2.0  # 스냅샷이 없을 때 다른 요청의 생성을 기다리는 최대 시간(초)
+REBUILD_DELAY = 1.0  # 연속된 디자인 변경을 한 번의 생성으로 모으기 위해 기다리는 시간(초)
+
+DEFAULT_DESIGN_PAGE_SIZE = 10
+MAX_DESIGN_PAGE_SIZE = 100
+
+def _chunk_key(build_id, index):
+    return f"home_feed:{build_id}:{index}"
+
+def active_designs():
+    """홈 화면 디자인 순서 (최신 순, 같은 시각이면 design_key 역순)"""
+    return Designs.objects.filter(is_active=True).order_by('-created_at', '-design_key')
+
+def build_design_page(limit=None, cursor=None):
+    """
+    홈 화면 전체 디자인을 (created_at, design_key) keyset 페이지네이션하여 반환
+    OFFSET과 COUNT(*) 없이 인덱스에서 커서 위치부터 읽으므로 스크롤 깊이와 관계없이 쿼리 1번
+    """
+    limit = min(int(limit or DEFAULT_DESIGN_PAGE_SIZE), MAX_DESIGN_PAGE_SIZE)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+
+    designs = active_designs()
+    if cursor:
+        designs = keyset_filter(designs, cursor, 'created_at', 'design_key')
+    designs = list(designs[:limit + 1])
+    has_more = len(designs) > limit
+    designs = designs[:limit]
+
+    return {
+        "results": DesignSerializer(designs, many=True).data,
+        "next_cursor": encode_cursor(designs[-1].created_at, designs[-1].design_key) if has_more else None,
+    }
+
+class FeedChunkMissing(Exception):
+    """스냅샷의 chunk가 cache에서 제거됨"""
+
+class FeedSnapshot:
+    """
+    Paginator에 그대로 넘길 수 있는 스냅샷 목록
+    길이는 메타데이터에서 읽고, slice는 해당 범위의 chunk만 cache에서 읽어서 반환
+    """
+
+    def __init__(self, meta):
+        self.meta = meta
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("FeedSnapshot only supports slicing")
+        start, stop, _ = index.indices(len(self))
+        if start >= stop:
+            return []
+
+        size = self.meta["chunk_size"]
+        first = start // size
+        keys = [_chunk_key(self.meta["build_id"], n) for n in range(first, (stop - 1) // size + 1)]
+        chunks = cache.get_many(keys)
+        if len(chunks) != len(keys):
+            raise FeedChunkMissing(self.meta["build_id"])
+        items = [item for key in keys for item in chunks[key]]
+        return items[start - first * size:stop - first * size]
+
+class HomeFeed:
+    """
+    홈 화면 전체 디자인 목록(type=all)의 스냅샷을 공유 cache에 보관
+    - 활성 디자인을 최신 순으로 직렬화하여 chunk 단위로 저장하고, 페이지 요청은 필요한 chunk만 읽음
+    - 디자인이 변경되거나 TTL이 지나면 이전 스냅샷을 계속 사용하면서 백그라운드 스레드 하나가 다시 생성
+      (생성 요청이 여러 번 와도 대기 중인 요청은 하나로 합쳐짐)
+    - cache.add 잠금으로 여러 프로세스 중 하나만 생성
+    HOME_FEED_BACKGROUND가 꺼져 있으면 오래된 스냅샷을 요청 처리 중에 다시 생성
+    like_count는 스냅샷 생성 시점의 값이므로 최대 HOME_FEED_TTL초 늦게 반영됨
+    """
+
+    def __init__(self, ttl=None, chunk_size=None):
+        self._ttl = ttl
+        self._chunk_size = chunk_size
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'HOME_FEED_TTL', 60)
+
+    @property
+    def chunk_size(self):
+        if self._chunk_size is not None:
+            return self._chunk_size
+        return getattr(settings, 'HOME_FEED_CHUNK_SIZE', 100)
+
+    def version(self):
+        return cache.get(VERSION_KEY, 0)
+
+    def invalidate(self):
+        """현재 스냅샷을 오래된 것으로 표시 (다음 생성 전까지는 계속 사용)"""
+        cache.add(VERSION_KEY, 0, timeout=None)
+        cache.incr(VERSION_KEY)
+
+    def _is_fresh(self, meta):
+        return meta["version"] == self.version() and time.time() - meta["built_at"] < self.ttl
+
+    def build(self):
+        """스냅샷을 생성하여 저장하고 메타데이터를 반환"""
+        version = self.version()
+        items = [dict(item) for item in DesignSerializer(active_designs(), many=True).data]
+
+        build_id = uuid.uuid4().hex
+        size = self.chunk_size
+        # 이전 스냅샷을 읽는 중인 요청이 있을 수 있으므로 chunk는 메타데이터보다 늦게 만료
+        timeout = self.ttl * 10
+        cache.set_many(
+            {_chunk_key(build_id, n): items[offset:offset + size] for n, offset in enumerate(range(0, len(items), size))},
+            timeout=timeout + 60,
+        )
+        meta = {
+            "build_id": build_id,
+            "version": version,
+            "built_at": time.time(),
+            "count": len(items),
+            "chunk_size": size,
+        }
+        cache.set(SNAPSHOT_KEY, meta, timeout=timeout)
+        logger.info(f"Built home feed snapshot with {len(items)} designs")
+        return meta
+
+    def rebuild(self):
+        """잠금을 얻은 경우에만 스냅샷을 생성, 이미 다른 곳에서 생성 중이면 None"""
+        if not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+            return None
+        try:
+            return self.build()
+        finally:
+            cache.delete(LOCK_KEY)
+
+    def request_rebuild(self):
+        """백그라운드 스레드에 다시 생성을 요청 (이미 대기 중인 요청이 있으면 합쳐짐)"""
+        if not getattr(settings, 'HOME_FEED_BACKGROUND', True):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='home-feed-rebuild', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            time.sleep(REBUILD_DELAY)
+            self._event.clear()
+            try:
+                self.rebuild()
+            except Exception as e:
+                logger.error(f"Error rebuilding home feed: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def snapshot(self):
+        """
+        현재 스냅샷 반환
+        오래된 스냅샷은 그대로 반환하고 백그라운드에서 다시 생성
+        (HOME_FEED_BACKGROUND가 꺼져 있으면 잠금을 얻은 요청만 생성하고 나머지는 이전 스냅샷 사용)
+        스냅샷이 없는데 다른 요청이 생성 중이면 BUILD_WAIT초까지 기다리고, 그래도 없으면 None
+        """
+        meta = cache.get(SNAPSHOT_KEY)
+        if meta is not None:
+            if not self._is_fresh(meta):
+                if getattr(settings, 'HOME_FEED_BACKGROUND', True):
+                    self.request_rebuild()
+                else:
+                    meta = self.rebuild() or meta
+            return FeedSnapshot(meta)
+
+        meta = self.rebuild()
+        deadline = time.monotonic() + BUILD_WAIT
+        while meta is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            meta = cache.get(SNAPSHOT_KEY)
+        return FeedSnapshot(meta) if meta is not None else None
+
+home_feed = HomeFeed()
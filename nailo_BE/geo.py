@@ -0,0 +1,168 @@
+import heapq
+import math
+import threading
+import time
+import logging
+
+from django.conf import settings
+
+from .models import Shops
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+
+def haversine(lat1, lng1, lat2, lng2):
+    """두 좌표 사이의 거리(m)를 반환"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+class ShopGridIndex:
+    """
+    활성화된 네일샵을 위도/경도 격자(bucket)로 나누어 보관하는 공간 인덱스
+    각 샵은 JSON 직렬화가 가능한 형태(str key, float 좌표)로 미리 변환하여 저장
+    """
+
+    def __init__(self, shops, cell_size=0.01):
+        self.cell_size = cell_size
+        self.buckets = {}
+        self.shops = []
+        for shop in shops:
+            entry = {
+                'shop_key': str(shop['shop_key']),
+                'shop_name': shop['shop_name'],
+                'shop_id': shop['shop_id'],
+                'lat': float(shop['lat']),
+                'lng': float(shop['lng']),
+                'shop_url': shop['shop_url'],
+            }
+            self.shops.append(entry)
+            self.buckets.setdefault(self._cell(entry['lat'], entry['lng']), []).append(entry)
+
+    def __len__(self):
+        return len(self.shops)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _ring(self, center, radius):
+        """center 셀에서 radius 칸 떨어진 셀들을 반환"""
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for d in range(-radius, radius + 1):
+            yield (row - radius, col + d)
+            yield (row + radius, col + d)
+        for d in range(-radius + 1, radius):
+            yield (row + d, col - radius)
+            yield (row + d, col + radius)
+
+    def _ring_min_distance(self, lat, radius):
+        """radius 칸 떨어진 셀에 있는 샵까지의 최소 거리(m) 하한"""
+        if radius == 0:
+            return 0.0
+        lat_m = (radius - 1) * self.cell_size * 111_000
+        lng_m = lat_m * max(math.cos(math.radians(min(abs(lat) + radius * self.cell_size, 90))), 0.0)
+        return min(lat_m, lng_m)
+
+    def _with_distance(self, shop, lat, lng):
+        return dict(shop, distance=round(haversine(lat, lng, shop['lat'], shop['lng']), 1))
+
+    def within(self, lat, lng, radius_m, limit=None):
+        """(lat, lng)에서 radius_m 이내의 샵을 가까운 순으로 반환"""
+        lat_span = math.ceil(radius_m / (111_000 * self.cell_size))
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_span * self.cell_size, 89.9))), 1e-6)
+        lng_span = math.ceil(radius_m / (111_000 * cos_lat * self.cell_size))
+        row, col = self._cell(lat, lng)
+
+        results = []
+        if (2 * lat_span + 1) * (2 * lng_span + 1) > len(self.buckets):
+            candidates = (shop for bucket in self.buckets.values() for shop in bucket)
+        else:
+            candidates = (
+                shop
+                for r in range(row - lat_span, row + lat_span + 1)
+                for c in range(col - lng_span, col + lng_span + 1)
+                for shop in self.buckets.get((r, c), ())
+            )
+        for shop in candidates:
+            entry = self._with_distance(shop, lat, lng)
+            if entry['distance'] <= radius_m:
+                results.append(entry)
+
+        results.sort(key=lambda shop: shop['distance'])
+        return results[:limit] if limit is not None else results
+
+    def nearest(self, lat, lng, k):
+        """(lat, lng)에서 가장 가까운 샵 k개를 가까운 순으로 반환"""
+        if k <= 0:
+            return []
+        center = self._cell(lat, lng)
+        heap = []  # (-distance, shop_key, entry) 최대 힙
+        radius = 0
+        # 주변 셀을 한 겹씩 넓혀가며 탐색, 탐색할 셀이 전체 bucket보다 많아지면 전체 탐색으로 전환
+        while (2 * radius + 1) ** 2 <= 4 * len(self.buckets):
+            if len(heap) == k and -heap[0][0] < self._ring_min_distance(lat, radius):
+                break
+            for cell in self._ring(center, radius):
+                for shop in self.buckets.get(cell, ()):
+                    entry = self._with_distance(shop, lat, lng)
+                    item = (-entry['distance'], entry['shop_key'], entry)
+                    if len(heap) < k:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+            if len(heap) == len(self.shops):
+                break
+            radius += 1
+        else:
+            entries = (self._with_distance(shop, lat, lng) for shop in self.shops)
+            return heapq.nsmallest(k, entries, key=lambda shop: (shop['distance'], shop['shop_key']))
+        return [item[2] for item in sorted(heap, key=lambda item: (-item[0], item[1]))]
+
+class ShopIndexCache:
+    """
+    ShopGridIndex를 프로세스 메모리에 보관하는 캐시
+    샵이 변경되면 signals에서 invalidate()를 호출하여 다음 요청 때 다시 생성
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'SHOP_INDEX_TTL', 300)
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _is_stale(self):
+        return self._index is None or time.monotonic() - self._built_at > self.ttl
+
+    def get(self):
+        """현재 인덱스를 반환 (필요할 때만 DB에서 다시 생성)"""
+        index = self._index
+        if index is not None and not self._is_stale():
+            return index
+
+        with self._lock:
+            if self._is_stale():
+                shops = Shops.objects.filter(is_active=True).values(
+                    'shop_key', 'shop_name', 'shop_id', 'lat', 'lng', 'shop_url'
+                )
+                self._index = ShopGridIndex(shops, cell_size=getattr(settings, 'SHOP_INDEX_CELL_SIZE', 0.01))
+                self._built_at = time.monotonic()
+                logger.info(f"Built shop index with {len(self._index)} shops")
+            return self._index
+
+shop_index = ShopIndexCache()
@@ -0,0 +1,270 @@
+import base64
+import binascii
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class InferenceError(Exception):
+    """모델 서버 호출 실패"""
+
+class InferenceUnavailable(InferenceError):
+    """서킷 브레이커가 열려 있어 모델 서버를 호출하지 않음"""
+
+class MultipartStream:
+    """
+    multipart/form-data 본문을 파일에서 조금씩 읽어 보내는 file-like 객체
+    requests는 read()와 len()이 있는 객체를 Content-Length와 함께 스트리밍으로 전송하므로
+    이미지 전체를 메모리에 올리지 않음
+    """
+
+    def __init__(self, fields, file_field, filename, fileobj, content_type="application/octet-stream"):
+        self.boundary = uuid.uuid4().hex
+        # 따옴표나 줄바꿈으로 part header가 추가되지 않도록 제거
+        filename = re.sub(r'["\\\r\n]', '', filename)
+        preamble = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        )
+        preamble += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        epilogue = f"\r\n--{self.boundary}--\r\n".encode()
+
+        start = fileobj.tell()
+        file_size = fileobj.seek(0, os.SEEK_END) - start
+        fileobj.seek(start)
+        self._parts = [preamble, fileobj, epilogue]
+        self._length = len(preamble) + file_size + len(epilogue)
+        self._index = 0
+        self._offset = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+            else:
+                chunk = part.read(size)
+            if not chunk:
+                self._index += 1
+                self._offset = 0
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+_IMAGE_FIELD_PATTERN = re.compile(rb'"image_data"\s*:\s*"')
+
+def stream_image_data(response, destination, chunk_size=64 * 1024):
+    """
+    모델 서버의 JSON 응답({"image_data": "<base64>"})을 스트리밍으로 읽으면서
+    base64를 조금씩 디코딩하여 destination 파일에 바로 기록
+    메모리 사용량은 응답 크기와 관계없이 chunk_size 수준으로 유지됨
+    """
+    buffer = b""
+    pending = b""
+    found = False
+    with open(destination, "wb") as out:
+        for chunk in response.iter_content(chunk_size):
+            buffer += chunk
+            if not found:
+                match = _IMAGE_FIELD_PATTERN.search(buffer)
+                if match is None:
+                    # 필드 이름이 chunk 경계에 걸칠 수 있으므로 끝부분만 남김
+                    buffer = buffer[-256:]
+                    continue
+                found = True
+                buffer = buffer[match.end():]
+
+            end = buffer.find(b'"')
+            data = buffer if end < 0 else buffer[:end]
+            if end < 0 and data.endswith(b"\\"):
+                # 이스케이프 문자(\/)가 chunk 경계에 걸친 경우 다음 chunk와 함께 처리
+                data, buffer = data[:-1], data[-1:]
+            else:
+                buffer = b""
+            pending += data.replace(b"\\/", b"/")
+
+            usable = len(pending) // 4 * 4
+            try:
+                out.write(base64.b64decode(pending[:usable], validate=True))
+                pending = pending[usable:]
+                if end >= 0:
+                    out.write(base64.b64decode(pending, validate=True))
+                    return
+            except binascii.Error as e:
+                raise InferenceError(f"Invalid image data: {str(e)}") from e
+
+    raise InferenceError("Model server response does not contain image_data")
+
+class CircuitBreaker:
+    """
+    연속 실패가 failure_threshold번 발생하면 reset_timeout초 동안 호출을 차단하고,
+    이후 한 번의 시험 호출(half-open)이 성공하면 다시 닫힘
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """지금 호출해도 되는지 반환"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # 시험 호출은 한 번만 허용
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Model server circuit opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class InferenceClient:
+    """
+    모델 서버(FastAPI) 호출용 클라이언트
+    - 커넥션 풀(keep-alive) 재사용
+    - 연결/응답 단계별 timeout
+    - 5xx 및 연결 오류(연결 timeout 포함) 시 jitter가 있는 지수 백오프로 재시도
+    - 서킷 브레이커로 모델 서버 장애 시 빠르게 실패
+    """
+
+    def __init__(self, base_url, connect_timeout=3.0, read_timeout=60.0, max_retries=2,
+                 backoff=0.5, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_before_retry(self, attempt):
+        # full jitter: 0 ~ backoff * 2^attempt 사이에서 랜덤 대기
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def predict(self, image_file, filename, design_id):
+        """
+        손 사진과 디자인 ID를 모델 서버의 /predict로 전송하고 200 응답을 반환
+        응답 본문은 읽지 않은 상태(stream)로 반환하므로 stream_image_data()로 저장하거나 close() 해야 함
+        실패하면 InferenceError, 서킷이 열려 있으면 InferenceUnavailable 발생
+        """
+        if not self.breaker.allow():
+            raise InferenceUnavailable("Model server is unavailable")
+
+        try:
+            return self._predict(image_file, filename, design_id)
+        except InferenceError:
+            # 브레이커 상태는 이미 기록됨
+            raise
+        except Exception:
+            # 예상하지 못한 예외도 실패로 기록해야 half-open 상태에서 멈추지 않음
+            self.breaker.record_failure()
+            raise
+
+    def _predict(self, image_file, filename, design_id):
+        url = f"{self.base_url}/predict"
+        start = image_file.tell()
+        for attempt in range(self.max_retries + 1):
+            image_file.seek(start)
+            body = MultipartStream({"design_name": design_id}, "image", filename, image_file, "image/png")
+            try:
+                # 요청 본문은 파일에서 조금씩 읽어 전송하고, 응답 본문은 호출한 쪽에서 스트리밍으로 읽음
+                response = self.session.post(
+                    url,
+                    data=body,
+                    headers={"Content-Type": body.content_type},
+                    timeout=self.timeout,
+                    stream=True,
+                )
+            except requests.ReadTimeout as e:
+                # 응답 대기 중 timeout은 모델 서버가 작업 중일 수 있으므로 재시도하지 않음
+                # (ConnectTimeout은 ConnectionError이기도 하므로 아래에서 재시도)
+                self.breaker.record_failure()
+                raise InferenceError(f"Model server timeout: {str(e)}") from e
+            except requests.ConnectionError as e:
+                if attempt < self.max_retries:
+                    logger.warning(f"Model server connection error, retrying ({attempt + 1}/{self.max_retries}): {str(e)}")
+                    self._sleep_before_retry(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise InferenceError(f"Model server connection error: {str(e)}") from e
+
+            if response.status_code >= 500:
+                if attempt < self.max_retries:
+                    logger.warning(f"Model server returned {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+                    response.close()
+                    self._sleep_before_retry(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise InferenceError(f"Model server error: {response.text}")
+
+            self.breaker.record_success()
+            if response.status_code != 200:
+                raise InferenceError(f"Model server error: {response.text}")
+            return response
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_inference_client():
+    """settings 기반으로 생성한 프로세스 공용 InferenceClient 반환"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient(
+                settings.MODEL_SERVER_URL,
+                connect_timeout=settings.MODEL_SERVER_CONNECT_TIMEOUT,
+                read_timeout=settings.MODEL_SERVER_READ_TIMEOUT,
+                max_retries=settings.MODEL_SERVER_MAX_RETRIES,
+                pool_size=settings.TRYON_MAX_WORKERS,
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.MODEL_SERVER_CIRCUIT_THRESHOLD,
+                    reset_timeout=settings.MODEL_SERVER_CIRCUIT_RESET,
+                ),
+            )
+        return _client
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import BooleanField, Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Designs, Like
+from .serializers import LikedDesignSerializer
+from .utils import encode_cursor, keyset_filter
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_LOCK_KEY = "likes:reconcile"
+
+DEFAULT_LIKE_PAGE_SIZE = 20
+MAX_LIKE_PAGE_SIZE = 100
+
+class DesignNotFound(Exception):
+    """좋아요 대상 디자인이 없음"""
+
+def _current_like_count(design_key):
+    return Designs.objects.filter(pk=design_key).values_list('like_count', flat=True).first() or 0
+
+def toggle_like(customer, design_key):
+    """
+    좋아요를 토글하고 (liked, like_count)를 반환
+    하나의 트랜잭션에서 DB의 like_count를 직접 증감(UPDATE ... SET like_count = like_count ± 1)하므로
+    동시 요청에도 갱신이 유실되지 않고, like_count가 NULL이어도 0부터 계산
+    """
+    like_reconciler.ensure_started()
+    try:
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(customer=customer, design_id=design_key).delete()
+            if deleted:
+                # 좋아요 취소
+                Designs.objects.filter(pk=design_key).update(
+                    like_count=Greatest(Coalesce(F('like_count'), Value(0)) - 1, Value(0))
+                )
+                return False, _current_like_count(design_key)
+
+            # 좋아요 추가, 디자인이 없으면 갱신된 행이 없음
+            updated = Designs.objects.filter(pk=design_key).update(
+                like_count=Coalesce(F('like_count'), Value(0)) + 1
+            )
+            if not updated:
+                raise DesignNotFound(design_key)
+            Like.objects.create(customer=customer, design_id=design_key)
+            return True, _current_like_count(design_key)
+    except IntegrityError:
+        # 같은 고객의 동시 좋아요 요청 중 다른 요청이 먼저 추가한 경우, 트랜잭션 전체가 롤백되므로 카운트는 그대로
+        logger.info(f"Concurrent like for design {design_key} by {customer.pk}")
+        return True, _current_like_count(design_key)
+
+def reconcile_like_counts(design_keys=None):
+    """
+    Like 행 수를 기준으로 like_count를 다시 계산하고 값이 달랐던 디자인 수를 반환
+    like_count를 직접 수정했거나 이전 코드에서 어긋난 값을 바로잡을 때 사용
+    """
+    designs = Designs.objects.all()
+    if design_keys is not None:
+        designs = designs.filter(pk__in=design_keys)
+
+    actual = Subquery(
+        Like.objects.filter(design=OuterRef('pk'))
+        .order_by()
+        .values('design')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    drifted = designs.annotate(actual=Coalesce(actual, Value(0))).exclude(like_count=F('actual'))
+    drifted_keys = list(drifted.values_list('pk', flat=True))
+    if drifted_keys:
+        Designs.objects.filter(pk__in=drifted_keys).update(like_count=Coalesce(actual, Value(0)))
+        logger.info(f"Reconciled like_count for {len(drifted_keys)} designs")
+    return len(drifted_keys)
+
+class LikeReconciler:
+    """
+    LIKE_RECONCILE_INTERVAL초마다 reconcile_like_counts()를 실행하는 백그라운드 스레드
+    - 좋아요 요청이 처음 들어오면 시작 (LIKE_RECONCILE_BACKGROUND가 꺼져 있으면 시작하지 않음)
+    - 여러 워커 프로세스 중 주기마다 cache.add 잠금을 얻은 하나만 실행
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not getattr(settings, 'LIKE_RECONCILE_BACKGROUND', True):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='like-reconciler', daemon=True)
+                self._thread.start()
+
+    def run_once(self):
+        """이번 주기의 잠금을 얻은 경우에만 like_count를 바로잡고 바로잡은 디자인 수 반환, 이미 실행됐으면 None"""
+        if not cache.add(RECONCILE_LOCK_KEY, 1, timeout=settings.LIKE_RECONCILE_INTERVAL):
+            return None
+        return reconcile_like_counts()
+
+    def _run(self):
+        while True:
+            time.sleep(settings.LIKE_RECONCILE_INTERVAL)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error reconciling like counts: {str(e)}")
+            finally:
+                close_old_connections()
+
+like_reconciler = LikeReconciler()
+
+def build_like_page(customer, limit=None, cursor=None):
+    """
+    고객이 좋아요한 디자인을 최근에 좋아요한 순으로 (liked_at, id) keyset 페이지네이션하여 반환
+    디자인은 JOIN으로 함께 조회하므로 페이지당 쿼리 1번
+    """
+    limit = min(int(limit or DEFAULT_LIKE_PAGE_SIZE), MAX_LIKE_PAGE_SIZE)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+
+    likes = (
+        Like.objects.filter(customer=customer)
+        .select_related('design')
+        .annotate(is_liked=Value(True, output_field=BooleanField()))
+    )
+    if cursor:
+        likes = keyset_filter(likes, cursor, 'liked_at', 'id')
+    likes = list(likes.order_by('-liked_at', '-id')[:limit + 1])
+    has_more = len(likes) > limit
+    likes = likes[:limit]
+
+    return {
+        "results": LikedDesignSerializer(likes, many=True).data,
+        "next_cursor": encode_cursor(likes[-1].liked_at, likes[-1].id) if has_more else None,
+    }
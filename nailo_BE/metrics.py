@@ -0,0 +1,125 @@
+import bisect
+import threading
+
+# 응답 시간 histogram 구간(초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """누적 구간별 개수, 합계, 전체 개수를 보관하는 Prometheus 형식 histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(le, 누적 개수) 목록 반환"""
+        total = 0
+        result = []
+        for le, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((le, total))
+        return result
+
+class ActionMetrics:
+    """
+    WebSocket action별 처리 시간, 처리 중인 개수, 에러 개수를 집계
+    프로세스 단위로 집계하므로 worker가 여러 개면 Prometheus에서 instance별로 수집
+    """
+
+    def __init__(self):
+        self._latency = {}
+        self._in_flight = {}
+        self._errors = {}
+        self._phases = {}  # (action, phase) -> Histogram
+        self._lock = threading.Lock()
+
+    def start(self, action):
+        with self._lock:
+            self._in_flight[action] = self._in_flight.get(action, 0) + 1
+
+    def finish(self, action, duration, error=False):
+        with self._lock:
+            self._in_flight[action] -= 1
+            self._latency.setdefault(action, Histogram()).observe(duration)
+            if error:
+                self._errors[action] = self._errors.get(action, 0) + 1
+
+    def observe_phase(self, action, phase, duration):
+        """action 내부 단계(DB 처리, 알림 전송 등)별 처리 시간 기록"""
+        with self._lock:
+            self._phases.setdefault((action, phase), Histogram()).observe(duration)
+
+    def error(self, action):
+        """처리 전에 실패한 요청(잘못된 action, 형식 오류)의 에러 개수만 증가"""
+        with self._lock:
+            self._errors[action] = self._errors.get(action, 0) + 1
+
+    def snapshot(self, action):
+        """테스트와 디버깅용 action별 현재 값"""
+        with self._lock:
+            histogram = self._latency.get(action)
+            return {
+                "count": histogram.count if histogram else 0,
+                "in_flight": self._in_flight.get(action, 0),
+                "errors": self._errors.get(action, 0),
+                "phases": {
+                    phase: phase_histogram.count
+                    for (name, phase), phase_histogram in self._phases.items() if name == action
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._latency.clear()
+            self._in_flight.clear()
+            self._errors.clear()
+            self._phases.clear()
+
+    def render(self):
+        """Prometheus text exposition format으로 변환"""
+        with self._lock:
+            lines = [
+                "# HELP nailo_ws_action_duration_seconds WebSocket action 처리 시간",
+                "# TYPE nailo_ws_action_duration_seconds histogram",
+            ]
+            for action, histogram in sorted(self._latency.items()):
+                for le, count in histogram.cumulative():
+                    lines.append(f'nailo_ws_action_duration_seconds_bucket{{action="{action}",le="{le}"}} {count}')
+                lines.append(f'nailo_ws_action_duration_seconds_sum{{action="{action}"}} {histogram.sum}')
+                lines.append(f'nailo_ws_action_duration_seconds_count{{action="{action}"}} {histogram.count}')
+
+            lines += [
+                "# HELP nailo_ws_action_phase_duration_seconds WebSocket action 단계별 처리 시간",
+                "# TYPE nailo_ws_action_phase_duration_seconds histogram",
+            ]
+            for (action, phase), histogram in sorted(self._phases.items()):
+                labels = f'action="{action}",phase="{phase}"'
+                for le, count in histogram.cumulative():
+                    lines.append(f'nailo_ws_action_phase_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'nailo_ws_action_phase_duration_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'nailo_ws_action_phase_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += [
+                "# HELP nailo_ws_action_in_flight 처리 중인 WebSocket action 개수",
+                "# TYPE nailo_ws_action_in_flight gauge",
+            ]
+            for action, value in sorted(self._in_flight.items()):
+                lines.append(f'nailo_ws_action_in_flight{{action="{action}"}} {value}')
+
+            lines += [
+                "# HELP nailo_ws_action_errors_total 에러로 끝난 WebSocket action 개수",
+                "# TYPE nailo_ws_action_errors_total counter",
+            ]
+            for action, value in sorted(self._errors.items()):
+                lines.append(f'nailo_ws_action_errors_total{{action="{action}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+action_metrics = ActionMetrics()
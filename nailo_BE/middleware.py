@@ -0,0 +1,21 @@
+from .utils import identity_cache
+
+class UserIdentityMiddleware:
+    """
+    X-User-Type / X-User-Id 헤더로 요청한 사용자를 한 번만 조회하여
+    request.nailo_user, request.nailo_user_type에 저장
+    헤더가 없거나 사용자가 없으면 둘 다 None
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user_type = request.headers.get("X-User-Type")
+        user_id = request.headers.get("X-User-Id")
+
+        request.nailo_user, request.nailo_user_type = None, None
+        if user_type and user_id:
+            request.nailo_user, request.nailo_user_type = identity_cache.get(user_type, user_id)
+
+        return self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0003_tryonhistory_design_key"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="request",
+            index=models.Index(fields=["shop", "created_at"], name="request_shop_created_idx"),
+        ),
+    ]
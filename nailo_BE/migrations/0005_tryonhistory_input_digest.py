@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0004_request_shop_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tryonhistory",
+            name="input_digest",
+            field=models.CharField(blank=True, db_index=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0005_tryonhistory_input_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaFile",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("path", models.CharField(max_length=255, unique=True)),
+                ("size", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("owner", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="media_files", to="nailo_be.customers")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["created_at"], name="mediafile_created_idx"), models.Index(fields=["owner", "created_at"], name="mediafile_owner_created_idx")],
+            },
+        ),
+    ]
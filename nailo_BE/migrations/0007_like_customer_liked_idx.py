@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0006_mediafile"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="like",
+            index=models.Index(fields=["customer", "liked_at", "id"], name="like_customer_liked_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0007_like_customer_liked_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tryonhistory",
+            index=models.Index(fields=["user", "created_at", "id"], name="tryon_user_created_idx"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0008_tryon_user_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="designs",
+            index=models.Index(condition=models.Q(("is_active", True)), fields=["created_at"], name="design_active_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="request",
+            index=models.Index(fields=["customer", "design"], name="request_customer_design_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="response",
+            index=models.Index(fields=["request", "created_at"], name="response_request_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="shops",
+            index=models.Index(fields=["shop_id"], name="shop_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="shops",
+            index=models.Index(condition=models.Q(("is_active", True)), fields=["is_active"], name="shop_active_idx"),
+        ),
+    ]
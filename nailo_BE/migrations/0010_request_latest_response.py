@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_latest_response(apps, schema_editor):
+    """응답이 있는 기존 요청에 가장 최근 응답을 연결"""
+    Request = apps.get_model("nailo_be", "Request")
+    Response = apps.get_model("nailo_be", "Response")
+    latest = Response.objects.filter(request=OuterRef("pk")).order_by("-created_at").values("pk")[:1]
+    Request.objects.filter(pk__in=Response.objects.values("request")).update(latest_response=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0009_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="request",
+            name="latest_response",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to="nailo_be.response"),
+        ),
+        migrations.RunPython(backfill_latest_response, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0010_request_latest_response"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="designs",
+            name="design_active_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="designs",
+            index=models.Index(condition=models.Q(("is_active", True)), fields=["created_at", "design_key"], name="design_active_created_idx"),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+# 부분 인덱스(condition=Q(is_active=True))를 지원하지 않는 DB(MySQL 등)에서는 Django가 해당 인덱스를 만들지 않으므로
+# is_active로 시작하는 일반 인덱스를 대신 생성 (SQLite/PostgreSQL에서는 부분 인덱스만 사용)
+FALLBACK_INDEXES = [
+    ("Designs", models.Index(fields=["is_active", "created_at", "design_key"], name="design_active_created_fb_idx")),
+    ("Shops", models.Index(fields=["is_active"], name="shop_active_fb_idx")),
+]
+
+
+def add_fallback_indexes(apps, schema_editor):
+    if schema_editor.connection.features.supports_partial_indexes:
+        return
+    for model_name, index in FALLBACK_INDEXES:
+        schema_editor.add_index(apps.get_model("nailo_be", model_name), index)
+
+
+def remove_fallback_indexes(apps, schema_editor):
+    if schema_editor.connection.features.supports_partial_indexes:
+        return
+    for model_name, index in FALLBACK_INDEXES:
+        schema_editor.remove_index(apps.get_model("nailo_be", model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("nailo_be", "0011_design_active_created_key_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fallback_indexes, remove_fallback_indexes),
+    ]
@@ -12,6 +12,14 @@ class Shops(models.Model):
     shop_url = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop_id'], name='shop_id_idx'),  # 샵 사용자 조회
+            # 활성 샵만 담는 부분 인덱스 (boolean 조건은 WHERE "is_active"로 조회되므로 일반 인덱스로는 검색되지 않음)
+            # 부분 인덱스를 지원하지 않는 DB(MySQL)에서는 0012 마이그레이션이 (is_active) 일반 인덱스를 대신 생성
+            models.Index(fields=['is_active'], condition=models.Q(is_active=True), name='shop_active_idx'),
+        ]
+
     def __str__(self):
         return self.shop_name
 
@@ -36,6 +44,13 @@ class Designs(models.Model):
     tag = models.CharField(max_length=50, blank=True, null=True)                                         
     is_active = models.BooleanField(default=True)                         
 
+    class Meta:
+        indexes = [
+            # 활성 디자인의 최신 순 조회 (홈 화면 페이지/커서 모드, 랜덤 추천용 key 로드)
+            # 부분 인덱스를 지원하지 않는 DB(MySQL)에서는 0012 마이그레이션이 (is_active, created_at, design_key) 인덱스를 대신 생성
+            models.Index(fields=['created_at', 'design_key'], condition=models.Q(is_active=True), name='design_active_created_idx'),
+        ]
+
     def __str__(self):
         return self.design_name
 
@@ -46,6 +61,9 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ('customer', 'design')
+        indexes = [
+            models.Index(fields=['customer', 'liked_at', 'id'], name='like_customer_liked_idx'),
+        ]
         
 class Request(models.Model):
     STATUS_CHOICES = [
@@ -61,6 +79,14 @@ class Request(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     contents = models.TextField(blank=True, null=True)  
     created_at = models.DateTimeField(auto_now_add=True)
+    # 가장 최근 응답 (응답 목록 조회 시 JOIN 한 번으로 함께 조회), respond_to_request에서 응답 생성과 함께 갱신
+    latest_response = models.ForeignKey('Response', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'created_at'], name='request_shop_created_idx'),
+            models.Index(fields=['customer', 'design'], name='request_customer_design_idx'),
+        ]
 
     def __str__(self):
         return f"Request {self.request_key} from {self.customer} for {self.design}"
@@ -74,6 +100,11 @@ class Response(models.Model):
     contents = models.TextField(blank=True, null=True)            
     created_at = models.DateTimeField(auto_now_add=True)                    
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['request', 'created_at'], name='response_request_created_idx'),
+        ]
+
     def __str__(self):
         return f"Response {self.response_key} to Request {self.request}"
     
@@ -83,6 +114,28 @@ class TryOnHistory(models.Model):
     predicted_image = models.ImageField(upload_to='tryon/predicted/')
     created_at = models.DateTimeField(auto_now_add=True)
     design_key = models.ForeignKey(Designs, to_field='design_key', on_delete=models.CASCADE)
-    
+    input_digest = models.CharField(max_length=64, blank=True, default='', db_index=True)  # 손 사진 + 디자인 ID의 sha256
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='tryon_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"History for {self.user.customer_name} at {self.created_at}"
+
+class MediaFile(models.Model):
+    """Try-On 이미지 파일의 보관 기한을 관리하기 위한 인덱스 (생성 순서대로 삭제)"""
+    path = models.CharField(max_length=255, unique=True)  # TryOnHistory에 저장되는 형식과 동일 ("/tryon/hand/<파일명>")
+    owner = models.ForeignKey(Customers, on_delete=models.SET_NULL, null=True, blank=True, related_name="media_files")
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='mediafile_created_idx'),
+            models.Index(fields=['owner', 'created_at'], name='mediafile_owner_created_idx'),
+        ]
+
     def __str__(self):
-        return f"History for {self.user.customer_name} at {self.created_at}"
\ No newline at end of file
+        return self.path
@@ -0,0 +1,95 @@
+"""
+WebSocket 재연결 지원
+- 세션: 연결 시 발급한 토큰으로 재연결하면 사용자 조회 없이 연결
+- 알림 순번(seq): 그룹별로 증가하는 번호를 알림에 붙이고 최근 알림을 보관하여,
+  재연결 시 마지막으로 확인한(ack) 번호 이후의 알림을 다시 전송
+세션과 알림은 Django cache에 저장하므로 여러 worker가 같은 cache를 쓰면 worker 간에도 이어짐
+"""
+
+import secrets
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from .encoders import to_primitive
+
+def _session_key(token):
+    return f"ws_session:{token}"
+
+def _seq_key(group):
+    return f"ws_seq:{group}"
+
+def _event_key(group, seq):
+    return f"ws_event:{group}:{seq}"
+
+def _session_ttl():
+    return getattr(settings, 'WS_SESSION_TTL', 24 * 60 * 60)
+
+def _buffer_size():
+    return getattr(settings, 'WS_REPLAY_BUFFER_SIZE', 100)
+
+def _event_ttl():
+    return getattr(settings, 'WS_REPLAY_TTL', 60 * 60)
+
+async def create_session(user_type, user_id, key, name):
+    """연결한 사용자 정보로 세션을 만들고 토큰을 반환"""
+    token = secrets.token_urlsafe(24)
+    await cache.aset(_session_key(token), {
+        "user_type": user_type,
+        "user_id": user_id,
+        "key": key,
+        "name": name,
+        "last_seq": 0,
+    }, timeout=_session_ttl())
+    return token
+
+async def get_session(token, user_type, user_id):
+    """토큰의 세션을 반환, 없거나 다른 사용자의 세션이면 None"""
+    session = await cache.aget(_session_key(token))
+    if session is None or session["user_type"] != user_type or session["user_id"] != user_id:
+        return None
+    # 사용 중인 세션은 만료 시간을 연장
+    await cache.atouch(_session_key(token), timeout=_session_ttl())
+    return session
+
+async def ack_session(token, seq):
+    """클라이언트가 확인한 마지막 알림 번호를 세션에 저장"""
+    session = await cache.aget(_session_key(token))
+    if session is None:
+        return
+    session["last_seq"] = max(session["last_seq"], seq)
+    await cache.aset(_session_key(token), session, timeout=_session_ttl())
+
+async def current_seq(group):
+    return await cache.aget(_seq_key(group), 0)
+
+async def publish(group, event):
+    """
+    그룹 알림에 순번을 붙여 보관한 뒤 전송
+    보관 기간(WS_REPLAY_TTL)이 지나거나 최근 WS_REPLAY_BUFFER_SIZE개를 벗어난 알림은 재전송하지 않음
+    """
+    await cache.aadd(_seq_key(group), 0, timeout=None)
+    seq = await cache.aincr(_seq_key(group))
+    event = {**to_primitive(event), "seq": seq}
+    await cache.aset(_event_key(group, seq), event, timeout=_event_ttl())
+    await get_channel_layer().group_send(group, event)
+    return seq
+
+def publish_sync(group, event):
+    """동기 코드(작업 큐, 뷰)에서 사용하는 publish"""
+    return async_to_sync(publish)(group, event)
+
+async def missed_events(group, last_seq):
+    """last_seq 이후 보관 중인 알림을 순번 순으로 반환"""
+    seq = await current_seq(group)
+    if last_seq > seq:
+        # 순번이 초기화된 경우 (cache 재시작 등)
+        last_seq = 0
+    first = max(last_seq + 1, seq - _buffer_size() + 1)
+    keys = [_event_key(group, n) for n in range(first, seq + 1)]
+    if not keys:
+        return []
+    events = await cache.aget_many(keys)
+    return [events[key] for key in keys if key in events]
@@ -0,0 +1,158 @@
+import os
+import threading
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Q
+
+from .models import MediaFile, TryOnHistory
+
+logger = logging.getLogger(__name__)
+
+def register_media(path, owner_id=None):
+    """
+    새로 저장한 Try-On 이미지 파일을 보관 인덱스에 등록하고 백그라운드 정리를 요청
+    path는 TryOnHistory에 저장되는 형식("/tryon/hand/<파일명>")을 사용
+    """
+    full_path = Path(settings.MEDIA_ROOT) / path.lstrip('/')
+    size = full_path.stat().st_size if full_path.exists() else 0
+    MediaFile.objects.create(path=path, owner_id=owner_id, size=size)
+    retention_sweeper.request(owner_id)
+
+def _evict(files):
+    """
+    (id, path) 목록의 파일과 이를 참조하는 히스토리를 함께 삭제
+    히스토리의 나머지 이미지(원본/결과)도 같이 삭제하여 짝이 맞지 않는 파일을 남기지 않음
+    """
+    ids = {file_id for file_id, _ in files}
+    paths = {path for _, path in files}
+    if not ids:
+        return 0
+
+    histories = TryOnHistory.objects.filter(Q(original_image__in=paths) | Q(predicted_image__in=paths))
+    for original_image, predicted_image in histories.values_list('original_image', 'predicted_image'):
+        paths.update((original_image, predicted_image))
+    paired = MediaFile.objects.filter(path__in=paths).exclude(id__in=ids).values_list('id', 'path')
+    ids.update(file_id for file_id, _ in paired)
+
+    media_root = Path(settings.MEDIA_ROOT)
+    for path in paths:
+        try:
+            os.remove(media_root / path.lstrip('/'))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting media file {path}: {str(e)}")
+
+    histories.delete()
+    MediaFile.objects.filter(id__in=ids).delete()
+    logger.info(f"Evicted {len(ids)} media files")
+    return len(ids)
+
+def sweep(max_files=None, max_files_per_user=None, owners=None, total=None):
+    """
+    사용자별/전체 파일 수 제한을 넘은 오래된 파일부터 삭제하고 삭제한 파일 수를 반환
+    - owners를 넘기면 해당 사용자만 (owner, created_at) 인덱스로 확인 (업로드 후 정리)
+      None이면 모든 사용자의 파일 수를 GROUP BY로 확인 (주기적인 전체 정리, 테이블 전체를 읽음)
+    - total(현재 전체 파일 수)을 넘기면 count() 없이 사용
+    초과분은 created_at 인덱스로 가장 오래된 파일만 조회
+    """
+    if max_files is None:
+        max_files = settings.TRYON_RETENTION_MAX_FILES
+    if max_files_per_user is None:
+        max_files_per_user = settings.TRYON_RETENTION_MAX_FILES_PER_USER
+
+    evicted = 0
+
+    # 사용자별 제한
+    if owners is None:
+        over_quota = [
+            (row['owner'], row['total'])
+            for row in MediaFile.objects.filter(owner__isnull=False)
+            .values('owner')
+            .annotate(total=Count('id'))
+            .filter(total__gt=max_files_per_user)
+        ]
+    else:
+        over_quota = [(owner, MediaFile.objects.filter(owner=owner).count()) for owner in owners]
+    for owner, owned in over_quota:
+        if owned <= max_files_per_user:
+            continue
+        oldest = MediaFile.objects.filter(owner=owner).order_by('created_at', 'id')
+        evicted += _evict(list(oldest.values_list('id', 'path')[:owned - max_files_per_user]))
+
+    # 전체 제한
+    if total is None:
+        total = MediaFile.objects.count()
+    excess = total - evicted - max_files
+    if excess > 0:
+        oldest = MediaFile.objects.order_by('created_at', 'id')
+        evicted += _evict(list(oldest.values_list('id', 'path')[:excess]))
+
+    return evicted
+
+class RetentionSweeper:
+    """
+    보관 기한 정리를 요청 처리 흐름 밖의 백그라운드 스레드에서 실행
+    - request(): 파일이 등록되면 해당 사용자만 확인하고, 전체 파일 수는 마지막 정리 이후 등록된 개수를 더해 계산
+    - TRYON_RETENTION_SWEEP_INTERVAL초마다 모든 사용자와 전체 파일 수를 다시 확인
+      (다른 워커 프로세스에서 등록한 파일도 이때 반영)
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._owners = set()  # 마지막 정리 이후 파일을 등록한 사용자
+        self._registered = 0  # 마지막 정리 이후 등록된 파일 수
+        self._total = None  # 마지막 정리 후 전체 파일 수, None이면 다음 정리에서 count()
+
+    def request(self, owner_id=None):
+        with self._lock:
+            if owner_id is not None:
+                self._owners.add(owner_id)
+            self._registered += 1
+        if not getattr(settings, 'TRYON_RETENTION_BACKGROUND', True):
+            return
+        self._ensure_started()
+        self._event.set()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+                self._thread.start()
+
+    def run_once(self, full=False):
+        """등록된 사용자만 정리 (full=True이거나 전체 파일 수를 모르면 전체 정리), 삭제한 파일 수 반환"""
+        with self._lock:
+            owners, self._owners = self._owners, set()
+            registered, self._registered = self._registered, 0
+            total = self._total
+
+        if full or total is None:
+            owners = None
+            total = MediaFile.objects.count()
+        else:
+            total += registered
+        evicted = sweep(owners=owners, total=total)
+        with self._lock:
+            self._total = total - evicted
+        return evicted
+
+    def _run(self):
+        while True:
+            requested = self._event.wait(settings.TRYON_RETENTION_SWEEP_INTERVAL)
+            self._event.clear()
+            try:
+                self.run_once(full=not requested)
+            except Exception as e:
+                logger.error(f"Error in retention sweep: {str(e)}")
+                with self._lock:
+                    self._total = None
+            finally:
+                close_old_connections()
+
+retention_sweeper = RetentionSweeper()
@@ -0,0 +1,59 @@
+import random
+import threading
+import time
+import logging
+
+from django.conf import settings
+
+from .models import Designs
+
+logger = logging.getLogger(__name__)
+
+class DesignKeyPool:
+    """
+    활성화된 디자인 key 배열을 메모리에 캐싱하고 랜덤 샘플링을 제공하는 클래스
+    디자인이 변경되면 signals에서 invalidate()를 호출하여 다음 요청 때 다시 로드
+    다른 워커 프로세스의 변경은 TTL이 지나면 반영
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._keys = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'DESIGN_POOL_TTL', 300)
+
+    def invalidate(self):
+        """캐시된 key 배열을 무효화"""
+        with self._lock:
+            self._keys = None
+
+    def _is_stale(self):
+        return self._keys is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def keys(self):
+        """활성화된 디자인 key 배열 반환 (필요할 때만 DB에서 로드)"""
+        keys = self._keys
+        if keys is not None and not self._is_stale():
+            return keys
+
+        with self._lock:
+            if self._is_stale():
+                self._keys = list(
+                    Designs.objects.filter(is_active=True).values_list('design_key', flat=True)
+                )
+                self._loaded_at = time.monotonic()
+                logger.info(f"Loaded {len(self._keys)} active design keys")
+            return self._keys
+
+    def sample(self, k):
+        """활성화된 디자인 중 k개의 key를 중복 없이 랜덤 추출"""
+        keys = self.keys()
+        return random.sample(keys, min(len(keys), k))
+
+design_key_pool = DesignKeyPool()
@@ -10,6 +10,20 @@ class DesignSerializer(serializers.ModelSerializer):
     class Meta:
         model = Designs
         fields = fields = ['design_key', 'design_name', 'design_url', 'price', 'like_count', 'is_active']
+
+# 좋아요 리스트 조회
+class LikedDesignSerializer(serializers.ModelSerializer):
+    design_key = serializers.UUIDField(source='design.design_key', read_only=True)
+    design_name = serializers.CharField(source='design.design_name', read_only=True)
+    design_url = serializers.URLField(source='design.design_url', read_only=True)
+    price = serializers.IntegerField(source='design.price', read_only=True)
+    like_count = serializers.IntegerField(source='design.like_count', read_only=True)
+    is_active = serializers.BooleanField(source='design.is_active', read_only=True)
+    is_liked = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Like
+        fields = ['design_key', 'design_name', 'design_url', 'price', 'like_count', 'is_active', 'is_liked', 'liked_at']
         
 class AddRequestSerializer(serializers.ModelSerializer):
     shop_name = serializers.CharField(source='shop.shop_name', read_only=True)
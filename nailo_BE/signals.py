@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Customers, Designs, Shops
+from .sampling import design_key_pool
+from .feed import home_feed
+from .geo import shop_index
+from .utils import identity_cache
+
+@receiver([post_save, post_delete], sender=Designs)
+def invalidate_design_caches(sender, **kwargs):
+    """디자인이 추가/수정/삭제되면 디자인 관련 캐시를 무효화하고, 커밋 후 홈 화면 스냅샷을 다시 생성"""
+    design_key_pool.invalidate()
+    home_feed.invalidate()
+    transaction.on_commit(home_feed.request_rebuild)
+
+@receiver([post_save, post_delete], sender=Shops)
+def invalidate_shop_caches(sender, **kwargs):
+    """샵이 추가/수정/삭제되면 샵 공간 인덱스와 사용자 캐시를 무효화"""
+    shop_index.invalidate()
+    identity_cache.invalidate('shop', kwargs['instance'].pk, kwargs['instance'].shop_id)
+
+@receiver([post_save, post_delete], sender=Customers)
+def invalidate_customer_caches(sender, **kwargs):
+    """고객이 추가/수정/삭제되면 사용자 캐시를 무효화"""
+    identity_cache.invalidate('customer', kwargs['instance'].pk, kwargs['instance'].customer_id)
@@ -5,7 +5,9 @@ import uuid
 from channels.testing import ChannelsLiveServerTestCase, WebsocketCommunicator
 from channels.layers import get_channel_layer
 from channels.db import database_sync_to_async
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.db import OperationalError, connection
+from django.db.backends.utils import CursorWrapper
 from rest_framework.test import APITestCase
 from rest_framework import status
 from uuid import UUID
@@ -13,9 +15,60 @@ from uuid import UUID
 from .models import *
 from nailo.asgi import application
 from .routing import websocket_urlpatterns
-from .utils import get_user_id
+from .utils import get_user_id, identity_cache, IdentityCache, encode_cursor
+from .sampling import design_key_pool
+from . import feed
+from .feed import home_feed, active_designs, build_design_page
+from .serializers import DesignSerializer
+from .geo import ShopGridIndex, haversine, shop_index
+from .consumers import (
+    NailServiceConsumer, ACTIONS, build_response_list, build_request_page, create_service_request,
+    respond_to_request, RequestAlreadyAnswered,
+)
+from .metrics import action_metrics
+from .realtime import create_session, publish, missed_events
+from . import consumers
+from . import encoders
+from .encoders import get_encoder
+from . import tryon
+from .tryon import TryOnJobQueue, TryOnQueueFull, TryOnResultCache, run_tryon_job, build_history_page
+from . import retention
+from .retention import register_media, sweep, RetentionSweeper
+from .likes import toggle_like, reconcile_like_counts, build_like_page, LikeReconciler, RECONCILE_LOCK_KEY
+from . import likes
+from .inference import CircuitBreaker, InferenceClient, InferenceError, InferenceUnavailable, MultipartStream, stream_image_data
 
 import random
+import importlib
+import re
+import datetime
+import decimal
+import threading
+import unittest
+import base64
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import requests
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.utils import timezone
+from PIL import Image
+
+try:
+    from channels_redis.pubsub import RedisPubSubChannelLayer
+    from fakeredis import TcpFakeServer
+except ImportError:
+    RedisPubSubChannelLayer = TcpFakeServer = None
 
 logger = logging.getLogger('nailo_be.consumers')
 
@@ -432,6 +485,59 @@ class GetUserIdTests(TestCase):
         user, user_type = get_user_id("customer", "nonexistent_id")
         self.assertIsNone(user, user_type)
 
+class IdentityCacheTests(APITestCase):
+    def setUp(self):
+        identity_cache.clear()
+        self.customer = Customers.objects.create(customer_id="cached_customer", customer_name="Cached")
+
+    def test_cache_hit_skips_db(self):
+        """두 번째 조회부터는 DB를 조회하지 않음"""
+        with self.assertNumQueries(1):
+            user, user_type = identity_cache.get("customer", "cached_customer")
+        with self.assertNumQueries(0):
+            cached, cached_type = identity_cache.get("customer", "cached_customer")
+
+        self.assertEqual((cached.pk, cached_type), (user.pk, user_type))
+
+    def test_missing_user_not_cached(self):
+        """없는 사용자는 캐시하지 않으므로 생성 후 바로 조회됨"""
+        self.assertEqual(identity_cache.get("customer", "new_customer"), (None, None))
+        Customers.objects.create(customer_id="new_customer", customer_name="New")
+
+        user, _ = identity_cache.get("customer", "new_customer")
+        self.assertEqual(user.customer_name, "New")
+
+    def test_invalidated_on_change(self):
+        """고객 정보가 변경되거나 삭제되면 캐시에서 제거"""
+        identity_cache.get("customer", "cached_customer")
+        self.customer.customer_name = "Renamed"
+        self.customer.save()
+
+        user, _ = identity_cache.get("customer", "cached_customer")
+        self.assertEqual(user.customer_name, "Renamed")
+
+        self.customer.delete()
+        self.assertEqual(identity_cache.get("customer", "cached_customer"), (None, None))
+
+    def test_lru_eviction(self):
+        """최대 크기를 넘으면 가장 오래 사용하지 않은 항목부터 제거"""
+        cache = IdentityCache(ttl=60, max_size=1)
+        Customers.objects.create(customer_id="other_customer", customer_name="Other")
+        cache.get("customer", "cached_customer")
+        cache.get("customer", "other_customer")
+
+        with self.assertNumQueries(1):
+            cache.get("customer", "cached_customer")
+
+    def test_middleware_resolves_identity_once(self):
+        """미들웨어가 조회한 사용자를 뷰에서 사용, 캐시된 뒤에는 사용자 조회 쿼리 없음"""
+        headers = {"HTTP_X_USER_TYPE": "customer", "HTTP_X_USER_ID": "cached_customer"}
+        self.client.get('/api/like-list/', **headers)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/like-list/', **headers)
+        self.assertEqual(response.status_code, 200)
+
 class HomePageViewTests(APITestCase):
     @classmethod
     def setUp(self):
@@ -460,6 +566,29 @@ class HomePageViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 9)  
 
+    def test_random_designs_excludes_inactive(self):
+        """비활성화된 디자인은 랜덤 결과에 포함되지 않음"""
+        Designs.objects.exclude(design_name="Design 1").update(is_active=False)
+        design_key_pool.invalidate()
+
+        response = self.client.get('/api/home/', {'type': 'random'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([d['design_name'] for d in response.data], ["Design 1"])
+
+    def test_random_designs_uses_cached_keys(self):
+        """key 배열이 캐싱된 뒤에는 샘플링된 디자인만 조회"""
+        self.client.get('/api/home/', {'type': 'random'})
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/home/', {'type': 'random'})
+        self.assertEqual(len(response.data), 9)
+        self.assertEqual(len({d['design_key'] for d in response.data}), 9)
+
+    def test_design_change_invalidates_key_pool(self):
+        """디자인이 추가되면 key 배열을 다시 로드"""
+        design_key_pool.keys()
+        design = Designs.objects.create(design_name="Design 26", shop=self.shop, price=1000)
+        self.assertIn(design.design_key, design_key_pool.keys())
+
     def test_paginated_designs_first_page(self):
         """전체 디자인의 첫 번째 페이지 반환 API 테스트"""
         response = self.client.get('/api/home/', {'type': 'all', 'page': 1, 'page_size': 10})
@@ -494,6 +623,151 @@ class HomePageViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 9)
                 
+class HomeFeedTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5665, lng=126.9780, shop_url="")
+        for i in range(25):
+            Designs.objects.create(design_name=f"Design {i + 1}", shop=self.shop, price=1000, like_count=i)
+
+    def get_page(self, page, page_size=10):
+        return self.client.get('/api/home/', {'type': 'all', 'page': page, 'page_size': page_size})
+
+    def expected_page(self, page, page_size=10):
+        return DesignSerializer(active_designs()[(page - 1) * page_size:page * page_size], many=True).data
+
+    def test_pages_served_from_snapshot(self):
+        """스냅샷 생성 후에는 DB 조회 없이 페이지 반환"""
+        self.get_page(1)
+        with self.assertNumQueries(0):
+            response = self.get_page(2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(response.data['total_pages'], 3)
+        self.assertEqual(response.data['results'], self.expected_page(2))
+
+    def test_page_spanning_chunks(self):
+        """여러 chunk에 걸친 페이지도 순서대로 반환"""
+        with override_settings(HOME_FEED_CHUNK_SIZE=4):
+            cache.clear()
+            response = self.get_page(2, page_size=7)
+        self.assertEqual(response.data['results'], self.expected_page(2, page_size=7))
+
+    def test_design_change_rebuilds_snapshot(self):
+        """디자인이 추가되면 다음 요청에서 새 스냅샷 사용"""
+        self.get_page(1)
+        design = Designs.objects.create(design_name="Design 26", shop=self.shop, price=1000)
+
+        response = self.get_page(1)
+        self.assertEqual(response.data['count'], 26)
+        self.assertEqual(response.data['results'][0]['design_key'], str(design.design_key))
+
+    def test_stale_snapshot_served_while_rebuilding(self):
+        """다른 곳에서 생성 중이면 DB 조회 없이 이전 스냅샷 사용"""
+        self.get_page(1)
+        home_feed.invalidate()
+        cache.add(feed.LOCK_KEY, 1)
+
+        with self.assertNumQueries(0):
+            response = self.get_page(1)
+        self.assertEqual(response.data['count'], 25)
+
+    @override_settings(HOME_FEED_BACKGROUND=True)
+    def test_stale_snapshot_rebuilt_in_background(self):
+        """백그라운드 생성이 켜져 있으면 오래된 스냅샷을 바로 반환하고 생성은 백그라운드에 요청"""
+        self.get_page(1)
+        home_feed.invalidate()
+
+        with mock.patch.object(home_feed, 'request_rebuild') as request_rebuild:
+            with self.assertNumQueries(0):
+                response = self.get_page(1)
+        request_rebuild.assert_called_once()
+        self.assertEqual(response.data['count'], 25)
+
+    @override_settings(HOME_FEED_BACKGROUND=True)
+    def test_background_rebuild_requests_are_coalesced(self):
+        """연속된 생성 요청은 하나의 스레드에서 한 번으로 합쳐짐"""
+        home = feed.HomeFeed()
+        rebuilt = threading.Event()
+        with mock.patch.object(feed, 'REBUILD_DELAY', 0.1), \
+                mock.patch.object(home, 'rebuild', side_effect=lambda: rebuilt.set()) as rebuild:
+            for _ in range(20):
+                home.request_rebuild()
+            self.assertTrue(rebuilt.wait(2))
+            time.sleep(0.2)
+
+        self.assertEqual(rebuild.call_count, 1)
+
+    def test_concurrent_requests_build_once(self):
+        """스냅샷이 없을 때 동시에 요청해도 한 번만 생성"""
+        # 다른 스레드에서는 테스트 트랜잭션의 데이터를 볼 수 없으므로 미리 만든 스냅샷을 저장하는 것으로 대체
+        meta = home_feed.build()
+        cache.delete(feed.SNAPSHOT_KEY)
+        builds = []
+
+        def slow_build():
+            builds.append(threading.get_ident())
+            time.sleep(0.2)
+            cache.set(feed.SNAPSHOT_KEY, meta)
+            return meta
+
+        results = []
+        with mock.patch.object(home_feed, 'build', side_effect=slow_build):
+            threads = [threading.Thread(target=lambda: results.append(home_feed.snapshot())) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual([len(snapshot) for snapshot in results], [25] * 5)
+
+    def test_missing_chunk_falls_back_to_database(self):
+        """chunk가 cache에서 제거되면 DB에서 조회"""
+        self.get_page(1)
+        cache.delete(feed._chunk_key(cache.get(feed.SNAPSHOT_KEY)["build_id"], 0))
+
+        response = self.get_page(1)
+        self.assertEqual(response.data['results'], self.expected_page(1))
+
+    def test_cursor_mode_walks_feed_in_page_order(self):
+        """pagination=cursor는 페이지 번호 방식과 같은 순서로 모든 디자인을 한 번씩 반환"""
+        Designs.objects.filter(design_name__in=["Design 3", "Design 4"]).update(is_active=False)
+        keys, cursor = [], None
+        while True:
+            params = {'type': 'all', 'pagination': 'cursor', 'page_size': 7}
+            response = self.client.get('/api/home/', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            keys += [design['design_key'] for design in response.data['results']]
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(keys, [str(design.design_key) for design in active_designs()])
+        self.assertEqual(len(keys), 23)
+
+    def test_cursor_page_is_one_query_at_any_depth(self):
+        """커서 위치와 관계없이 COUNT 없이 쿼리 1번"""
+        first = build_design_page(limit=5)
+        deep = build_design_page(limit=5, cursor=build_design_page(limit=20)['next_cursor'])
+        with self.assertNumQueries(1):
+            build_design_page(limit=5, cursor=first['next_cursor'])
+        with self.assertNumQueries(1):
+            build_design_page(limit=5, cursor=deep['next_cursor'])
+
+    def test_cursor_mode_invalid_cursor(self):
+        """잘못된 커서는 400"""
+        response = self.client.get('/api/home/', {'type': 'all', 'pagination': 'cursor', 'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_mode_bad_cursor_key(self):
+        """디코딩은 되지만 design_key가 UUID가 아닌 커서도 400"""
+        cursor = encode_cursor(Designs.objects.first().created_at, "abc")
+        response = self.client.get('/api/home/', {'type': 'all', 'pagination': 'cursor', 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
 class DesignTests(APITestCase):
     @classmethod
     # 각 한 번만 생성
@@ -532,8 +806,38 @@ class DesignTests(APITestCase):
 
         print("like_list: ", response)
         self.assertEqual(response.status_code, 200) 
-        self.assertIn("Test Design", response.data[0]["design_name"])  
-        self.assertEqual(response.data[0]["price"], 1000)
+        self.assertIn("Test Design", response.data["results"][0]["design_name"])  
+        self.assertEqual(response.data["results"][0]["price"], 1000)
+        self.assertTrue(response.data["results"][0]["is_liked"])
+        self.assertIsNone(response.data["next_cursor"])
+
+    def test_like_list_pagination(self):
+        """최근에 좋아요한 순으로 커서 페이지네이션, 페이지당 쿼리 1번"""
+        designs = [
+            Designs.objects.create(shop=self.shop, design_name=f"Design {i}", price=1000, like_count=1)
+            for i in range(4)
+        ]
+        for design in designs:
+            Like.objects.create(customer=self.customer, design=design)
+
+        with self.assertNumQueries(1):
+            first = build_like_page(self.customer, limit=3)
+        with self.assertNumQueries(1):
+            second = build_like_page(self.customer, limit=3, cursor=first["next_cursor"])
+
+        names = [item["design_name"] for item in first["results"] + second["results"]]
+        self.assertEqual(names, ["Design 3", "Design 2", "Design 1", "Design 0", "Test Design"])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_like_list_invalid_cursor(self):
+        """잘못된 커서는 400"""
+        response = self.client.get(
+            '/api/like-list/',
+            {"cursor": "invalid"},
+            HTTP_X_USER_TYPE='customer',
+            HTTP_X_USER_ID=self.customer.customer_id,
+        )
+        self.assertEqual(response.status_code, 400)
 
     # def test_like_list_empty(self):
     #     """좋아요 리스트가 비어 있을 때"""
@@ -606,4 +910,1438 @@ class LikeToggleTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["message"], "좋아요가 취소되었습니다.")
-        self.assertEqual(response.data["like_count"], 0)
\ No newline at end of file
+        self.assertEqual(response.data["like_count"], 0)
+
+    def test_like_toggle_null_count(self):
+        """like_count가 NULL이어도 0부터 계산"""
+        Designs.objects.filter(pk=self.design.pk).update(like_count=None)
+
+        response = self.client.post(
+            f'/api/like-toggle/{self.design.design_key}/',
+            HTTP_X_USER_TYPE='customer',
+            HTTP_X_USER_ID=self.customer.customer_id,
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["like_count"], 1)
+
+    def test_like_toggle_unknown_design(self):
+        """없는 디자인이면 404, 좋아요도 생성하지 않음"""
+        response = self.client.post(
+            f'/api/like-toggle/{uuid.uuid4()}/',
+            HTTP_X_USER_TYPE='customer',
+            HTTP_X_USER_ID=self.customer.customer_id,
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Like.objects.exists())
+
+    def test_toggle_like_query_count(self):
+        """토글은 고정된 수의 쿼리로 처리 (트랜잭션 시작/종료 포함)"""
+        with self.assertNumQueries(6):
+            toggle_like(self.customer, self.design.design_key)
+        with self.assertNumQueries(5):
+            toggle_like(self.customer, self.design.design_key)
+
+    def test_reconcile_like_counts(self):
+        """Like 행 수와 다른 like_count를 바로잡음"""
+        other = Designs.objects.create(shop=self.shop, design_name='Other', price=1000, like_count=None)
+        Like.objects.create(customer=self.customer, design=self.design)
+        Designs.objects.filter(pk=self.design.pk).update(like_count=5)
+
+        self.assertEqual(reconcile_like_counts(), 2)
+        self.design.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.design.like_count, 1)
+        self.assertEqual(other.like_count, 0)
+        self.assertEqual(reconcile_like_counts(), 0)
+
+    def test_reconciler_runs_once_per_interval(self):
+        """주기마다 잠금을 얻은 프로세스 하나만 like_count를 바로잡음"""
+        cache.delete(RECONCILE_LOCK_KEY)
+        Designs.objects.filter(pk=self.design.pk).update(like_count=5)
+
+        self.assertEqual(LikeReconciler().run_once(), 1)
+        self.assertIsNone(LikeReconciler().run_once())
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.like_count, 0)
+
+    @override_settings(LIKE_RECONCILE_BACKGROUND=True)
+    def test_toggle_like_starts_reconciler(self):
+        """좋아요 요청이 처음 들어오면 백그라운드 정리 스레드를 시작"""
+        reconciler, release = LikeReconciler(), threading.Event()
+        with mock.patch.object(likes, 'like_reconciler', reconciler), \
+                mock.patch.object(LikeReconciler, '_run', side_effect=release.wait) as run:
+            toggle_like(self.customer, self.design.design_key)
+            toggle_like(self.customer, self.design.design_key)
+            release.set()
+            reconciler._thread.join()
+
+        run.assert_called_once()
+
+class LikeToggleConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5665, lng=126.9780, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Hot Design", price=1000, like_count=0)
+        self.customers = [
+            Customers.objects.create(customer_id=f"customer_{i}", customer_name=f"Customer {i}")
+            for i in range(8)
+        ]
+
+    def test_concurrent_toggles_do_not_drift(self):
+        """여러 스레드가 동시에 토글해도 like_count가 Like 행 수와 일치"""
+        toggles_per_customer = 5
+        errors = []
+        barrier = threading.Barrier(len(self.customers))
+
+        def worker(customer):
+            try:
+                barrier.wait()
+                done = 0
+                while done < toggles_per_customer:
+                    try:
+                        toggle_like(customer, self.design.design_key)
+                        done += 1
+                    except OperationalError:
+                        # SQLite 테이블 잠금, 트랜잭션이 롤백되었으므로 다시 시도
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(customer,)) for customer in self.customers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.design.refresh_from_db()
+        # 고객마다 홀수 번 토글했으므로 모두 좋아요 상태
+        self.assertEqual(Like.objects.filter(design=self.design).count(), len(self.customers))
+        self.assertEqual(self.design.like_count, len(self.customers))
+
+class ShopGridIndexTests(TestCase):
+    def setUp(self):
+        # 서울 시청 기준으로 거리가 다른 샵들
+        self.origin = (37.5665, 126.9780)
+        self.index = ShopGridIndex([
+            {'shop_key': 'near', 'shop_name': 'Near', 'shop_id': 'near', 'lat': 37.5670, 'lng': 126.9785, 'shop_url': ''},
+            {'shop_key': 'mid', 'shop_name': 'Mid', 'shop_id': 'mid', 'lat': 37.5800, 'lng': 126.9900, 'shop_url': ''},
+            {'shop_key': 'far', 'shop_name': 'Far', 'shop_id': 'far', 'lat': 37.4000, 'lng': 127.1000, 'shop_url': ''},
+            {'shop_key': 'busan', 'shop_name': 'Busan', 'shop_id': 'busan', 'lat': 35.1796, 'lng': 129.0756, 'shop_url': ''},
+        ])
+
+    def test_within_radius_sorted_by_distance(self):
+        """반경 내 샵만 가까운 순으로 반환"""
+        shops = self.index.within(*self.origin, 5000)
+        self.assertEqual([shop['shop_key'] for shop in shops], ['near', 'mid'])
+        self.assertLessEqual(shops[0]['distance'], shops[1]['distance'])
+
+    def test_nearest_k(self):
+        """가장 가까운 k개 샵 반환"""
+        shops = self.index.nearest(*self.origin, 3)
+        self.assertEqual([shop['shop_key'] for shop in shops], ['near', 'mid', 'far'])
+
+    def test_nearest_matches_brute_force(self):
+        """격자 탐색 결과가 전체 탐색 결과와 동일"""
+        rng = random.Random(0)
+        shops = [
+            {'shop_key': str(i), 'shop_name': '', 'shop_id': '', 'shop_url': '',
+             'lat': 37.4 + rng.random() * 0.3, 'lng': 126.8 + rng.random() * 0.4}
+            for i in range(300)
+        ]
+        index = ShopGridIndex(shops)
+        for lat, lng in [(37.55, 127.0), (37.45, 126.85), (33.0, 126.5)]:
+            expected = sorted(shops, key=lambda shop: (round(haversine(lat, lng, shop['lat'], shop['lng']), 1), shop['shop_key']))[:10]
+            self.assertEqual(
+                [shop['shop_key'] for shop in index.nearest(lat, lng, 10)],
+                [shop['shop_key'] for shop in expected],
+            )
+
+class ConsumerTestMixin:
+    async def connect(self, user_type="customer", user_id="test_customer"):
+        """consumer에 연결하고 연결 메시지를 받은 communicator 반환"""
+        communicator, _ = await self.connect_with_welcome(user_type, user_id)
+        return communicator
+
+    async def connect_with_welcome(self, user_type="customer", user_id="test_customer", query=""):
+        """consumer에 연결하고 (communicator, 연결 메시지) 반환, query는 재연결용 query string"""
+        path = f"/ws/{user_type}/{user_id}/" + (f"?{query}" if query else "")
+        communicator = WebsocketCommunicator(NailServiceConsumer.as_asgi(), path)
+        communicator.scope['url_route'] = {'kwargs': {'user_type': user_type, 'user_id': user_id}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, await communicator.receive_json_from()
+
+class NearbyShopsConsumerTests(ConsumerTestMixin, TestCase):
+    def setUp(self):
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.near = Shops.objects.create(shop_id="near", shop_name="Near", lat=37.5670, lng=126.9785, shop_url="")
+        self.far = Shops.objects.create(shop_id="far", shop_name="Far", lat=35.1796, lng=129.0756, shop_url="")
+        Shops.objects.create(shop_id="closed", shop_name="Closed", lat=37.5665, lng=126.9780, shop_url="", is_active=False)
+
+    async def test_nearby_shops_within_radius(self):
+        """반경 내 활성화된 샵만 거리순으로 반환"""
+        communicator = await self.connect("customer", self.customer.customer_id)
+        await communicator.send_json_to({"action": "nearby_shops", "data": {"lat": 37.5665, "lng": 126.9780, "radius": 1000}})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual(response["type"], "shop_list")
+        self.assertEqual([shop["shop_id"] for shop in response["shops"]], ["near"])
+        self.assertIsInstance(response["shops"][0]["lat"], float)
+
+    async def test_nearby_shops_k_nearest(self):
+        """k개의 가장 가까운 샵 반환"""
+        communicator = await self.connect("customer", self.customer.customer_id)
+        await communicator.send_json_to({"action": "nearby_shops", "data": {"lat": 37.5665, "lng": 126.9780, "k": 5}})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual([shop["shop_id"] for shop in response["shops"]], ["near", "far"])
+
+    async def test_non_positive_radius_or_k_rejected(self):
+        """0 이하의 radius와 k는 위치 오류로 응답"""
+        communicator = await self.connect("customer", self.customer.customer_id)
+        responses = []
+        for params in ({"k": 0}, {"k": -1}, {"radius": 0}, {"radius": -100}, {"radius": 1000, "k": 0}):
+            await communicator.send_json_to({"action": "nearby_shops", "data": {"lat": 37.5665, "lng": 126.9780, **params}})
+            responses.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+
+        self.assertEqual(responses, [{"error": "Invalid location parameters"}] * 5)
+
+    async def test_shop_change_rebuilds_index(self):
+        """샵이 추가되면 인덱스를 다시 생성"""
+        await database_sync_to_async(shop_index.get)()
+        await Shops.objects.acreate(shop_id="new", shop_name="New", lat=37.5666, lng=126.9781, shop_url="")
+
+        communicator = await self.connect("customer", self.customer.customer_id)
+        await communicator.send_json_to({"action": "nearby_shops", "data": {"lat": 37.5665, "lng": 126.9780, "k": 1}})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual(response["shops"][0]["shop_id"], "new")
+
+class ResponseListTests(TestCase):
+    def setUp(self):
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shops = [
+            Shops.objects.create(shop_id=f"shop_{i}", shop_name=f"Shop {i}", lat=37.5665, lng=126.9780, shop_url="")
+            for i in range(3)
+        ]
+        self.designs = [
+            Designs.objects.create(shop=self.shops[i % 3], design_name=f"Design {i}", price=1000)
+            for i in range(4)
+        ]
+
+    def create_history(self, count):
+        for i in range(count):
+            design = self.designs[i % len(self.designs)]
+            shop = self.shops[i % len(self.shops)]
+            request = Request.objects.create(customer=self.customer, shop=shop, design=design, price=design.price)
+            if i % 2 == 0:
+                request.latest_response = Response.objects.create(
+                    customer=self.customer, shop=shop, request=request, price=2000, contents="ok"
+                )
+                request.save(update_fields=['latest_response'])
+
+    def test_query_count_is_constant(self):
+        """요청 이력 크기와 관계없이 JOIN 쿼리 1번"""
+        self.create_history(3)
+        with self.assertNumQueries(1):
+            build_response_list(self.customer.customer_key)
+
+        self.create_history(30)
+        with self.assertNumQueries(1):
+            designs = build_response_list(self.customer.customer_key)
+
+        details = [
+            detail
+            for design in designs
+            for shop in design['shop_requests']
+            for detail in shop['request_details']
+        ]
+        self.assertEqual(len(details), 33)
+        self.assertEqual(sum(1 for detail in details if detail['response']), 17)
+
+    def test_response_tree_shape(self):
+        """디자인 → 샵 → 요청 → 응답 구조"""
+        self.create_history(1)
+        designs = build_response_list(self.customer.customer_key)
+
+        self.assertEqual(len(designs), 1)
+        self.assertEqual(designs[0]['design_name'], "Design 0")
+        detail = designs[0]['shop_requests'][0]['request_details'][0]
+        self.assertEqual(designs[0]['shop_requests'][0]['shop_name'], "Shop 0")
+        self.assertEqual(detail['response']['price'], 2000)
+        self.assertEqual(detail['request']['price'], 1000)
+
+    def test_backfill_latest_response(self):
+        """기존 요청에는 마이그레이션에서 가장 최근 응답을 연결"""
+        migration = importlib.import_module(".migrations.0010_request_latest_response", __package__)
+        request = Request.objects.create(customer=self.customer, shop=self.shops[0], design=self.designs[0], price=1000)
+        pending = Request.objects.create(customer=self.customer, shop=self.shops[0], design=self.designs[0], price=1000)
+        first = Response.objects.create(customer=self.customer, shop=self.shops[0], request=request, price=1500)
+        latest = Response.objects.create(customer=self.customer, shop=self.shops[0], request=request, price=2000)
+        Response.objects.filter(pk=first.pk).update(created_at=latest.created_at - datetime.timedelta(minutes=1))
+
+        migration.backfill_latest_response(django_apps, None)
+
+        request.refresh_from_db()
+        pending.refresh_from_db()
+        self.assertEqual(request.latest_response, latest)
+        self.assertIsNone(pending.latest_response)
+
+class BatchActionTests(ConsumerTestMixin, TestCase):
+    def setUp(self):
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5670, lng=126.9785, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Design 1", price=1000)
+        Request.objects.create(customer=self.customer, shop=self.shop, design=self.design, price=1000)
+
+    def batch(self, **extra):
+        return {
+            "action": "batch",
+            "actions": [
+                {"id": "requests", "action": "get_requests", "data": {"shop_key": str(self.shop.shop_key)}},
+                {"id": "shops", "action": "nearby_shops", "data": {"lat": 37.5665, "lng": 126.9780, "k": 1}},
+                {"id": "unknown", "action": "unknown"},
+            ],
+            **extra,
+        }
+
+    async def test_combined_batch(self):
+        """모든 결과를 보낸 순서대로 한 frame에 담아 반환"""
+        communicator = await self.connect("shop", "shop")
+        await communicator.send_json_to(self.batch())
+        response = await communicator.receive_json_from()
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+        self.assertEqual(response["type"], "batch_result")
+        self.assertEqual([result["id"] for result in response["results"]], ["requests", "shops", "unknown"])
+        requests_result, shops_result, unknown_result = (result["responses"] for result in response["results"])
+        self.assertEqual(requests_result[0]["type"], "request_list")
+        self.assertEqual(len(requests_result[0]["requests"]), 1)
+        self.assertEqual(shops_result[0]["shops"][0]["shop_id"], "shop")
+        self.assertEqual(unknown_result, [{"error": "Unknown action: unknown"}])
+
+    async def test_stream_batch(self):
+        """응답마다 id를 붙여 바로 전송하고 마지막에 완료 알림"""
+        communicator = await self.connect("shop", "shop")
+        await communicator.send_json_to(self.batch(mode="stream"))
+        frames = [await communicator.receive_json_from() for _ in range(4)]
+        await communicator.disconnect()
+
+        self.assertEqual(frames[-1], {"type": "batch_complete", "ids": ["requests", "shops", "unknown"]})
+        by_id = {frame["id"]: frame for frame in frames[:-1]}
+        self.assertEqual(by_id["requests"]["type"], "request_list")
+        self.assertEqual(by_id["shops"]["type"], "shop_list")
+        self.assertIn("error", by_id["unknown"])
+
+    async def test_invalid_batch(self):
+        """actions가 없거나 중첩된 batch는 에러"""
+        communicator = await self.connect("shop", "shop")
+        await communicator.send_json_to({"action": "batch", "actions": []})
+        empty = await communicator.receive_json_from()
+        await communicator.send_json_to({"action": "batch", "actions": [{"action": "batch"}]})
+        nested = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertIn("error", empty)
+        self.assertEqual(nested, {"error": "Nested batch is not allowed"})
+
+class ActionDispatchMetricsTests(ConsumerTestMixin, TestCase):
+    def setUp(self):
+        action_metrics.reset()
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5670, lng=126.9785, shop_url="")
+
+    def test_registered_actions(self):
+        """handler가 decorator로 등록되고 조회 action만 concurrent"""
+        self.assertEqual(
+            set(ACTIONS),
+            {"batch", "ack", "nearby_shops", "request_service", "respond_service", "get_responses", "get_requests"},
+        )
+        self.assertEqual(
+            {name for name, spec in ACTIONS.items() if spec["concurrent"]},
+            {"nearby_shops", "get_responses", "get_requests"},
+        )
+
+    async def test_records_latency_and_errors(self):
+        """처리 시간과 에러 응답을 action별로 집계"""
+        communicator = await self.connect()
+        await communicator.send_json_to({"action": "nearby_shops", "data": {"lat": 37.5665, "lng": 126.9780}})
+        await communicator.receive_json_from()
+        await communicator.send_json_to({"action": "get_responses", "data": {}})
+        error = await communicator.receive_json_from()
+        await communicator.send_json_to({"action": "nope"})
+        await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual(error, {"error": "customer key is required"})
+        self.assertEqual(action_metrics.snapshot("nearby_shops"), {"count": 1, "in_flight": 0, "errors": 0, "phases": {}})
+        self.assertEqual(action_metrics.snapshot("get_responses"), {"count": 1, "in_flight": 0, "errors": 1, "phases": {}})
+        self.assertEqual(action_metrics.snapshot("unknown")["errors"], 1)
+
+    async def test_schema_type_check(self):
+        """schema와 타입이 다른 필드는 handler를 실행하지 않고 에러"""
+        communicator = await self.connect()
+        await communicator.send_json_to({"action": "get_requests", "data": {"shop_key": ["x"]}})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual(response, {"error": "Invalid type for shop_key"})
+        self.assertEqual(action_metrics.snapshot("get_requests"), {"count": 0, "in_flight": 0, "errors": 1, "phases": {}})
+
+    def test_prometheus_endpoint(self):
+        """/metrics/는 Prometheus text format으로 반환"""
+        action_metrics.start("get_requests")
+        action_metrics.finish("get_requests", 0.03)
+        action_metrics.error("get_requests")
+
+        response = self.client.get('/metrics/')
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn('nailo_ws_action_duration_seconds_bucket{action="get_requests",le="0.025"} 0', body)
+        self.assertIn('nailo_ws_action_duration_seconds_bucket{action="get_requests",le="0.05"} 1', body)
+        self.assertIn('nailo_ws_action_duration_seconds_count{action="get_requests"} 1', body)
+        self.assertIn('nailo_ws_action_in_flight{action="get_requests"} 0', body)
+        self.assertIn('nailo_ws_action_errors_total{action="get_requests"} 1', body)
+        stats = tryon.tryon_result_cache.stats()
+        self.assertIn(f"nailo_tryon_cache_hits_total {stats['hits']}", body)
+        self.assertIn(f"nailo_tryon_cache_misses_total {stats['misses']}", body)
+
+class EncoderTests(TestCase):
+    def setUp(self):
+        self.key = uuid.uuid4()
+        self.now = datetime.datetime(2024, 11, 25, 6, 3, 26, 350928, tzinfo=datetime.timezone.utc)
+        self.payload = {"key": self.key, "price": decimal.Decimal("37.5665"), "created_at": self.now, "name": "네일"}
+
+    def test_encoders_agree(self):
+        """표준 json과 orjson이 같은 결과를 만듦"""
+        expected = {"key": str(self.key), "price": 37.5665, "created_at": self.now.isoformat(), "name": "네일"}
+        names = ["json"] + (["orjson"] if encoders.orjson is not None else [])
+        for name in names:
+            encoded = get_encoder(name).dumps(self.payload)
+            self.assertIsInstance(encoded, str)
+            self.assertIn("네일", encoded)
+            self.assertEqual(json.loads(encoded), expected)
+
+    def test_unknown_type_raises(self):
+        """변환할 수 없는 타입은 TypeError"""
+        with self.assertRaises(TypeError):
+            get_encoder("json").dumps({"value": object()})
+
+    def test_falls_back_without_orjson(self):
+        """orjson이 없으면 auto/orjson 설정도 표준 json 사용"""
+        with mock.patch.object(encoders, "orjson", None):
+            self.assertEqual(get_encoder("auto").name, "json")
+            self.assertEqual(get_encoder("orjson").name, "json")
+
+class ServiceRequestTests(ConsumerTestMixin, TestCase):
+    def setUp(self):
+        action_metrics.reset()
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5670, lng=126.9785, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Design 1", price=1000)
+
+    def request_data(self, **overrides):
+        return {
+            "customer_key": str(self.customer.customer_key),
+            "design_key": str(self.design.design_key),
+            "shop_key": str(self.shop.shop_key),
+            "contents": "요청",
+            **overrides,
+        }
+
+    def test_create_in_one_query_and_insert(self):
+        """FK 검증 1번, 생성 1번, 알림용 row 조회 1번 (트랜잭션 savepoint 포함 5개)"""
+        data = self.request_data()
+        with self.assertNumQueries(5):
+            created = create_service_request(data["customer_key"], data["design_key"], data["shop_key"], data["contents"])
+
+        request = Request.objects.get(request_key=created["request_key"])
+        self.assertEqual((request.customer, request.shop, request.design), (self.customer, self.shop, self.design))
+        self.assertEqual(request.price, 1000)
+        self.assertEqual(set(created["timings"]), {"validate", "create"})
+
+    def test_missing_foreign_keys(self):
+        """없는 고객/디자인/샵은 각 모델의 DoesNotExist, 요청은 생성하지 않음"""
+        for field, model in (("customer_key", Customers), ("design_key", Designs), ("shop_key", Shops)):
+            data = self.request_data(**{field: str(uuid.uuid4())})
+            with self.assertRaises(model.DoesNotExist):
+                create_service_request(data["customer_key"], data["design_key"], data["shop_key"])
+        self.assertFalse(Request.objects.exists())
+
+    async def test_request_service_notifies_shop(self):
+        """요청자에게 완료 응답, 샵에게 새 요청 알림, 단계별 시간 기록"""
+        shop_ws = await self.connect("shop", "shop")
+        customer_ws = await self.connect()
+
+        await customer_ws.send_json_to({"action": "request_service", "data": self.request_data()})
+        completed = await customer_ws.receive_json_from()
+        notification = await shop_ws.receive_json_from()
+        await shop_ws.disconnect()
+        await customer_ws.disconnect()
+
+        self.assertEqual(completed["type"], "completed_request")
+        self.assertEqual(notification["type"], "new_request")
+        self.assertEqual(notification["request_key"], completed["request_key"])
+        # get_requests 목록 항목과 같은 형식
+        self.assertEqual(notification["request"], {
+            "request_key": completed["request_key"],
+            "status": "pending",
+            "created_at": notification["request"]["created_at"],
+            "price": 1000.0,
+            "contents": self.request_data()["contents"],
+            "customer_name": "Test Customer",
+            "design_name": "Design 1",
+        })
+        self.assertEqual(
+            action_metrics.snapshot("request_service")["phases"],
+            {"db": 1, "validate": 1, "create": 1, "notify": 1},
+        )
+
+class ServiceResponseTests(ConsumerTestMixin, TestCase):
+    def setUp(self):
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5670, lng=126.9785, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Design 1", price=1000)
+        self.request = Request.objects.create(customer=self.customer, shop=self.shop, design=self.design, price=1000)
+
+    def respond_message(self, **data):
+        return {"action": "respond_service", "data": {"request_key": str(self.request.request_key), "status": "accepted", **data}}
+
+    def test_respond_is_single_unit(self):
+        """조건부 UPDATE, JOIN 조회, INSERT, latest_response 갱신 (트랜잭션 savepoint 포함 6개)"""
+        with self.assertNumQueries(6):
+            response = respond_to_request(self.request.request_key, "accepted", price=1500)
+
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, "accepted")
+        self.assertEqual(self.request.latest_response_id, response["response_key"])
+        self.assertEqual(Response.objects.get(pk=response["response_key"]).price, 1500)
+        self.assertEqual(response["shop_name"], "Shop")
+        self.assertEqual(response["customer_key"], self.customer.customer_key)
+
+    def test_second_response_rejected(self):
+        """이미 응답한 요청은 다시 응답할 수 없음"""
+        respond_to_request(self.request.request_key, "accepted")
+        with self.assertRaises(RequestAlreadyAnswered):
+            respond_to_request(self.request.request_key, "rejected")
+        with self.assertRaises(Request.DoesNotExist):
+            respond_to_request(uuid.uuid4(), "accepted")
+
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, "accepted")
+        self.assertEqual(Response.objects.count(), 1)
+
+    async def test_no_queries_on_event_loop_thread(self):
+        """응답 처리 중 event loop thread에서는 쿼리가 실행되지 않음"""
+        shop_ws = await self.connect("shop", "shop")
+        customer_ws = await self.connect("customer", "test_customer")
+
+        loop_thread = threading.get_ident()
+        query_threads = []
+        execute = CursorWrapper._execute
+
+        def record_thread(cursor, *args, **kwargs):
+            query_threads.append(threading.get_ident())
+            return execute(cursor, *args, **kwargs)
+
+        with mock.patch.object(CursorWrapper, "_execute", autospec=True, side_effect=record_thread):
+            await shop_ws.send_json_to(self.respond_message(price=1500))
+            completed = await shop_ws.receive_json_from()
+            notification = await customer_ws.receive_json_from()
+            await shop_ws.send_json_to(self.respond_message())
+            duplicate = await shop_ws.receive_json_from()
+        await shop_ws.disconnect()
+        await customer_ws.disconnect()
+
+        self.assertEqual(completed["type"], "completed_response")
+        self.assertEqual(notification["type"], "new_response")
+        self.assertEqual(notification["shop_name"], "Shop")
+        # get_responses의 디자인 항목과 같은 형식
+        design = notification["design"]
+        self.assertEqual((design["design_key"], design["design_name"]), (str(self.design.design_key), "Design 1"))
+        detail = design["shop_requests"][0]["request_details"][0]
+        self.assertEqual(design["shop_requests"][0]["shop_name"], "Shop")
+        self.assertEqual((detail["request_key"], detail["status"]), (str(self.request.request_key), "accepted"))
+        self.assertEqual(detail["response"]["price"], 1500.0)
+        self.assertEqual(duplicate, {"error": "Request has already been answered"})
+        self.assertTrue(query_threads)
+        self.assertNotIn(loop_thread, query_threads)
+
+    async def test_unexpected_error_replies_to_shop(self):
+        """예상하지 못한 DB 오류도 handler에서 에러 메시지로 응답"""
+        consumer = NailServiceConsumer()
+        with mock.patch.object(consumer, "reply", new_callable=mock.AsyncMock) as reply, \
+                mock.patch.object(consumers, "respond_to_request", side_effect=OperationalError("database is locked")):
+            await consumer.handle_service_response(self.respond_message())
+
+        reply.assert_awaited_once_with({"error": "database is locked"})
+
+class SessionResumeTests(ConsumerTestMixin, TestCase):
+    def setUp(self):
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.group = f"customer_{self.customer.customer_key}"
+
+    async def publish_tryon(self, job_id):
+        return await publish(self.group, {"type": "notify_tryon_result", "job_id": job_id, "status": "completed"})
+
+    async def test_reconnect_with_session_skips_lookup(self):
+        """세션 토큰으로 재연결하면 사용자를 조회하지 않음"""
+        communicator, welcome = await self.connect_with_welcome()
+        await communicator.disconnect()
+        self.assertIn("session", welcome)
+
+        with mock.patch.object(identity_cache, "get", side_effect=AssertionError("lookup")) as lookup:
+            communicator, resumed = await self.connect_with_welcome(query=f"session={welcome['session']}")
+            await communicator.disconnect()
+
+        lookup.assert_not_called()
+        self.assertEqual(resumed["session"], welcome["session"])
+        self.assertEqual(resumed["message"], welcome["message"])
+
+    async def test_replays_missed_notifications(self):
+        """last_seq 이후의 알림을 연결 메시지 다음에 다시 전송"""
+        communicator, welcome = await self.connect_with_welcome()
+        await communicator.disconnect()
+        first = await self.publish_tryon("job-1")
+        await self.publish_tryon("job-2")
+
+        communicator, _ = await self.connect_with_welcome(query=f"session={welcome['session']}&last_seq={first}")
+        replayed = await communicator.receive_json_from()
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+        self.assertEqual((replayed["type"], replayed["job_id"], replayed["seq"]), ("tryon_result", "job-2", first + 1))
+
+    async def test_event_during_resume_sent_once(self):
+        """group_add와 재전송 사이에 도착한 알림은 실시간 전송과 재전송 중 한 번만 보냄"""
+        communicator, welcome = await self.connect_with_welcome()
+        await communicator.disconnect()
+        first = await self.publish_tryon("job-1")
+
+        async def publish_then_fetch(group, last_seq):
+            await self.publish_tryon("job-2")
+            return await missed_events(group, last_seq)
+
+        with mock.patch.object(consumers, 'missed_events', side_effect=publish_then_fetch):
+            communicator, _ = await self.connect_with_welcome(query=f"session={welcome['session']}&last_seq={first - 1}")
+            replayed = [await communicator.receive_json_from() for _ in range(2)]
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        self.assertEqual([event["job_id"] for event in replayed], ["job-1", "job-2"])
+        self.assertEqual([event["seq"] for event in replayed], [first, first + 1])
+
+    async def test_out_of_order_live_events_all_delivered(self):
+        """발행 순서와 다르게 도착한 실시간 알림도 모두 전송"""
+        communicator = await self.connect()
+        for seq in (6, 5):
+            await get_channel_layer().group_send(self.group, {
+                "type": "notify_tryon_result", "job_id": f"job-{seq}", "status": "completed", "seq": seq,
+            })
+        received = [await communicator.receive_json_from() for _ in range(2)]
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+        self.assertEqual([event["seq"] for event in received], [6, 5])
+
+    async def test_ack_sets_resume_point(self):
+        """ack한 번호 이후의 알림만 다시 전송"""
+        communicator, welcome = await self.connect_with_welcome()
+        await self.publish_tryon("job-1")
+        live = await communicator.receive_json_from()
+        await communicator.send_json_to({"action": "ack", "data": {"seq": live["seq"]}})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+        await self.publish_tryon("job-2")
+
+        communicator, _ = await self.connect_with_welcome(query=f"session={welcome['session']}")
+        replayed = await communicator.receive_json_from()
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+        self.assertEqual(replayed["job_id"], "job-2")
+
+    async def test_replay_buffer_is_bounded(self):
+        """보관 개수를 넘은 오래된 알림은 다시 전송하지 않음"""
+        communicator, welcome = await self.connect_with_welcome()
+        await communicator.disconnect()
+        with override_settings(WS_REPLAY_BUFFER_SIZE=2):
+            for n in range(4):
+                await self.publish_tryon(f"job-{n}")
+            communicator, _ = await self.connect_with_welcome(query=f"session={welcome['session']}&last_seq={welcome['seq']}")
+            replayed = [await communicator.receive_json_from() for _ in range(2)]
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        self.assertEqual([event["job_id"] for event in replayed], ["job-2", "job-3"])
+
+    async def test_session_of_other_user_ignored(self):
+        """다른 사용자의 토큰이면 새로 조회하고 새 세션 발급"""
+        token = await create_session("customer", "someone_else", "key", "Other")
+        communicator, welcome = await self.connect_with_welcome(query=f"session={token}")
+        await communicator.disconnect()
+
+        self.assertNotEqual(welcome["session"], token)
+        self.assertIn("Test Customer", welcome["message"])
+
+    async def test_failed_connect_disconnects_cleanly(self):
+        """없는 사용자는 연결이 거부되고 disconnect에서 에러가 나지 않음"""
+        communicator = WebsocketCommunicator(NailServiceConsumer.as_asgi(), "/ws/customer/nobody/")
+        communicator.scope['url_route'] = {'kwargs': {'user_type': 'customer', 'user_id': 'nobody'}}
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+class RequestPageTests(TestCase):
+    def setUp(self):
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5665, lng=126.9780, shop_url="")
+        self.other_shop = Shops.objects.create(shop_id="other", shop_name="Other", lat=37.5665, lng=126.9780, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Design", price=1000)
+        self.requests = [self.create_request() for _ in range(25)]
+        self.create_request(shop=self.other_shop)
+
+    def create_request(self, shop=None):
+        return Request.objects.create(customer=self.customer, shop=shop or self.shop, design=self.design, price=1000)
+
+    def test_cursor_pagination_walks_full_history(self):
+        """커서를 따라가면 모든 요청을 중복 없이 최신순으로 조회"""
+        keys, cursor, pages = [], None, 0
+        while True:
+            page = build_request_page(self.shop.shop_key, limit=10, cursor=cursor)
+            keys += [request['request_key'] for request in page['requests']]
+            pages += 1
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(pages, 3)
+        expected = sorted(self.requests, key=lambda r: (r.created_at, str(r.request_key)), reverse=True)
+        self.assertEqual(keys, [r.request_key for r in expected])
+
+    @mock.patch.object(consumers, "REQUEST_SINCE_LOOKBACK", 0)
+    def test_since_returns_only_new_requests(self):
+        """since 커서 이후에 도착한 요청만 반환"""
+        first_page = build_request_page(self.shop.shop_key, limit=5)
+        new_requests = [self.create_request(), self.create_request()]
+
+        page = build_request_page(self.shop.shop_key, since=first_page['latest_cursor'])
+        self.assertEqual(
+            [request['request_key'] for request in page['requests']],
+            [r.request_key for r in new_requests],
+        )
+
+        empty = build_request_page(self.shop.shop_key, since=page['latest_cursor'])
+        self.assertEqual(empty['requests'], [])
+        self.assertEqual(empty['latest_cursor'], page['latest_cursor'])
+
+    def test_since_includes_late_committed_request(self):
+        """먼저 생성되었지만 늦게 커밋된 요청도 다음 since 응답에 포함"""
+        Request.objects.update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        first_page = build_request_page(self.shop.shop_key, limit=5)
+        later = self.create_request()
+        page = build_request_page(self.shop.shop_key, since=first_page['latest_cursor'])
+        # later보다 먼저 created_at이 정해졌지만 page 조회 후에 커밋된 요청
+        late = self.create_request()
+        Request.objects.filter(pk=late.pk).update(created_at=later.created_at - datetime.timedelta(milliseconds=1))
+
+        next_page = build_request_page(self.shop.shop_key, since=page['latest_cursor'])
+
+        self.assertEqual([request['request_key'] for request in page['requests']], [later.request_key])
+        self.assertEqual([request['request_key'] for request in next_page['requests']], [late.request_key, later.request_key])
+
+    def test_invalid_cursor(self):
+        """잘못된 커서는 ValueError"""
+        with self.assertRaises(ValueError):
+            build_request_page(self.shop.shop_key, cursor="invalid")
+
+@unittest.skipIf(RedisPubSubChannelLayer is None, "channels_redis and fakeredis are required")
+class RedisChannelLayerTests(TestCase):
+    """여러 워커 프로세스가 같은 Redis(fakeredis)를 바라볼 때 그룹 메시지가 전달되는지 확인"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = TcpFakeServer(("127.0.0.1", 0))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        host, port = cls.server.server_address
+        cls.redis_url = f"redis://{host}:{port}/0"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    async def test_group_send_reaches_other_worker(self):
+        """다른 워커의 레이어에서 보낸 group_send가 샵 소켓에 도달"""
+        worker_a = RedisPubSubChannelLayer(hosts=[self.redis_url])
+        worker_b = RedisPubSubChannelLayer(hosts=[self.redis_url])
+        channel = await worker_a.new_channel()
+        await worker_a.group_add("shop_test", channel)
+
+        await worker_b.group_send("shop_test", {"type": "notify_shop_new_request", "request_key": "key"})
+        message = await asyncio.wait_for(worker_a.receive(channel), 5)
+
+        self.assertEqual(message["request_key"], "key")
+        await worker_a.flush()
+        await worker_b.flush()
+
+    async def test_group_send_fans_out_to_every_worker(self):
+        """같은 그룹에 등록된 여러 워커의 소켓 모두에 전달"""
+        workers = [RedisPubSubChannelLayer(hosts=[self.redis_url]) for _ in range(3)]
+        channels = []
+        for worker in workers:
+            channel = await worker.new_channel()
+            await worker.group_add("customer_test", channel)
+            channels.append(channel)
+
+        sender = RedisPubSubChannelLayer(hosts=[self.redis_url])
+        await sender.group_send("customer_test", {"type": "notify_tryon_result"})
+        messages = await asyncio.wait_for(asyncio.gather(*(
+            worker.receive(channel) for worker, channel in zip(workers, channels)
+        )), 5)
+
+        self.assertEqual([message["type"] for message in messages], ["notify_tryon_result"] * 3)
+        for layer in workers + [sender]:
+            await layer.flush()
+
+def make_png_bytes(color=(255, 0, 0)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def make_model_response(image_bytes, body=None):
+    """모델 서버의 스트리밍 응답을 흉내내는 requests.Response"""
+    response = requests.models.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body if body is not None else json.dumps({"image_data": base64.b64encode(image_bytes).decode()}).encode())
+    return response
+
+class TryOnTestMixin:
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, TRYON_RETENTION_BACKGROUND=False)
+        self.settings_override.enable()
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5665, lng=126.9780, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Design 1", price=1000)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+class TryOnViewTests(TryOnTestMixin, APITestCase):
+    def post_tryon(self):
+        return self.client.post(
+            '/api/try-on/',
+            {"design_key": str(self.design.design_key), "image": SimpleUploadedFile("hand.png", make_png_bytes(), "image/png")},
+            format='multipart',
+            HTTP_X_USER_TYPE='customer',
+            HTTP_X_USER_ID=self.customer.customer_id,
+        )
+
+    def test_tryon_returns_job_id_immediately(self):
+        """모델 서버 호출 없이 작업 ID를 바로 반환"""
+        with mock.patch.object(tryon.tryon_queue, 'submit', return_value="job-id") as submit:
+            response = self.post_tryon()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["job_id"], "job-id")
+        args = submit.call_args.args
+        self.assertIs(args[0], run_tryon_job)
+        self.assertEqual(args[1], self.customer.customer_key)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, "tryon/hand", args[4])))
+
+    def test_repeated_tryon_is_served_from_cache(self):
+        """같은 사진과 디자인으로 다시 요청하면 모델 서버 없이 기존 히스토리 반환"""
+        with mock.patch.object(tryon.tryon_queue, 'submit', return_value="job-id") as submit:
+            self.assertEqual(self.post_tryon().status_code, 202)
+        job_args = submit.call_args.args[1:]
+
+        client = mock.Mock()
+        client.predict.return_value = make_model_response(make_png_bytes((0, 0, 255)))
+        with mock.patch.object(tryon, 'get_inference_client', return_value=client):
+            run_tryon_job("job-id", *job_args)
+        history = TryOnHistory.objects.get()
+
+        with mock.patch.object(tryon.tryon_queue, 'submit') as submit:
+            response = self.post_tryon()
+
+        submit.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["cached"])
+        self.assertEqual(response.json()["predicted_image"], f"/media{history.predicted_image.name}")
+        self.assertEqual(TryOnHistory.objects.count(), 1)
+
+    def test_evicted_cache_entry_falls_through_to_model_server(self):
+        """캐시에서 찾은 결과 파일이 그 사이 삭제되었으면 miss로 처리하고 작업 큐로 전달"""
+        missing = os.path.join(self.media_root, "tryon/cache/missing.png")
+        misses = tryon.tryon_result_cache.misses
+        with mock.patch.object(tryon.tryon_result_cache, 'get', return_value=Path(missing)), \
+                mock.patch.object(tryon.tryon_queue, 'submit', return_value="job-id") as submit:
+            response = self.post_tryon()
+
+        self.assertEqual(response.status_code, 202)
+        submit.assert_called_once()
+        self.assertEqual(tryon.tryon_result_cache.misses, misses + 1)
+        self.assertFalse(TryOnHistory.objects.exists())
+
+    def test_tryon_queue_full_returns_429(self):
+        """큐가 가득 차 있으면 429 반환"""
+        with mock.patch.object(tryon.tryon_queue, 'submit', side_effect=TryOnQueueFull):
+            response = self.post_tryon()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "tryon/hand")), [])
+
+    def test_rejected_tryon_not_counted_by_sweeper(self):
+        """429로 거절된 요청의 파일은 보관 정리의 전체 파일 수에 더해지지 않음"""
+        sweeper = RetentionSweeper()
+        with mock.patch.object(retention, 'retention_sweeper', sweeper):
+            with mock.patch.object(tryon.tryon_queue, 'submit', side_effect=TryOnQueueFull):
+                self.assertEqual(self.post_tryon().status_code, 429)
+            self.assertEqual(sweeper._registered, 0)
+            self.assertFalse(MediaFile.objects.exists())
+
+            with mock.patch.object(tryon.tryon_queue, 'submit', return_value="job-id"):
+                self.assertEqual(self.post_tryon().status_code, 202)
+            self.assertEqual(sweeper._registered, 1)
+            self.assertEqual(MediaFile.objects.count(), 1)
+
+def full_table_scans(queries):
+    """
+    실행된 SELECT/UPDATE/DELETE마다 EXPLAIN QUERY PLAN을 실행해 인덱스 없이 전체를 읽는 테이블(또는 별칭)과 SQL 반환
+    SQLite 전용
+    """
+    scans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            for *_, detail in cursor.fetchall():
+                match = re.match(r'SCAN (?:TABLE )?(\w+)(.*)', detail)
+                if match and 'USING' not in match.group(2) and match.group(1) != 'CONSTANT':
+                    scans.append((match.group(1), sql))
+    return scans
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN 형식은 SQLite 기준")
+class QueryPlanTests(APITestCase):
+    """
+    뷰와 consumer의 주요 조회 경로가 테이블 전체를 읽지 않는지 확인
+    전체 목록을 반환하는 관리용 API(/api/shops/, /api/designs/)와 백그라운드 정리 작업은 제외
+    """
+
+    def setUp(self):
+        design_key_pool.invalidate()
+        shop_index.invalidate()
+        identity_cache.clear()
+        self.customer = Customers.objects.create(customer_id="test_customer", customer_name="Test Customer")
+        self.shop = Shops.objects.create(shop_id="shop", shop_name="Shop", lat=37.5665, lng=126.9780, shop_url="")
+        self.design = Designs.objects.create(shop=self.shop, design_name="Design 1", price=1000)
+        self.request = Request.objects.create(customer=self.customer, shop=self.shop, design=self.design, price=1000)
+        Like.objects.create(customer=self.customer, design=self.design)
+        TryOnHistory.objects.create(
+            user=self.customer, design_key=self.design,
+            original_image="/tryon/hand/hand.png", predicted_image="/tryon/predicted/predicted.png",
+        )
+
+    def get(self, url, user_type="customer", user_id="test_customer"):
+        return self.client.get(url, HTTP_X_USER_TYPE=user_type, HTTP_X_USER_ID=user_id)
+
+    def hot_paths(self):
+        return {
+            "home_all": lambda: self.get('/api/home/?type=all'),
+            "home_cursor": lambda: build_design_page(cursor=encode_cursor(self.design.created_at, self.design.design_key)),
+            "home_random": lambda: self.get('/api/home/?type=random'),
+            "like_list": lambda: self.get('/api/like-list/'),
+            "like_toggle": lambda: toggle_like(self.customer, self.design.design_key),
+            "design_detail": lambda: self.get(f'/api/nail-design/{self.design.design_key}/'),
+            "tryon_history": lambda: self.get('/api/try-on-history/'),
+            "shop_identity": lambda: get_user_id("shop", "shop"),
+            "nearby_shops": lambda: shop_index.get(),
+            "get_requests": lambda: build_request_page(self.shop.shop_key),
+            "get_responses": lambda: build_response_list(self.customer.customer_key),
+            "request_service": lambda: create_service_request(
+                self.customer.customer_key, self.design.design_key, self.shop.shop_key
+            ),
+            "respond_service": lambda: respond_to_request(self.request.request_key, "accepted"),
+        }
+
+    def test_hot_paths_use_indexes(self):
+        for name, run in self.hot_paths().items():
+            with self.subTest(name):
+                with CaptureQueriesContext(connection) as captured:
+                    run()
+                self.assertEqual(full_table_scans(captured.captured_queries), [])
+
+    def test_fallback_indexes_without_partial_index_support(self):
+        """부분 인덱스를 지원하지 않는 DB에서만 is_active로 시작하는 일반 인덱스를 생성"""
+        migration = importlib.import_module(".migrations.0012_active_fallback_indexes", __package__)
+        schema_editor = mock.Mock()
+
+        schema_editor.connection.features.supports_partial_indexes = True
+        migration.add_fallback_indexes(django_apps, schema_editor)
+        schema_editor.add_index.assert_not_called()
+
+        schema_editor.connection.features.supports_partial_indexes = False
+        migration.add_fallback_indexes(django_apps, schema_editor)
+        created = {model._meta.model_name: index for (model, index), _ in schema_editor.add_index.call_args_list}
+        self.assertEqual(created["designs"].fields, ["is_active", "created_at", "design_key"])
+        self.assertEqual(created["shops"].fields, ["is_active"])
+
+class TryOnHistoryViewTests(TryOnTestMixin, APITestCase):
+    def create_history(self, count):
+        return [
+            TryOnHistory.objects.create(
+                user=self.customer, design_key=self.design,
+                original_image=f"/tryon/hand/hand_{i}.png", predicted_image=f"/tryon/predicted/predicted_{i}.png",
+            )
+            for i in range(count)
+        ]
+
+    def get_history(self, **params):
+        return self.client.get(
+            '/api/try-on-history/', params,
+            HTTP_X_USER_TYPE='customer', HTTP_X_USER_ID=self.customer.customer_id,
+        )
+
+    def test_page_in_one_query(self):
+        """기록 수와 관계없이 페이지당 쿼리 1번 (디자인 조회 없음)"""
+        self.create_history(30)
+        with self.assertNumQueries(1):
+            page = build_history_page(self.customer, "https://testserver/media/", limit=10)
+
+        self.assertEqual(len(page["results"]), 10)
+        self.assertEqual(page["results"][0]["design_key"], self.design.design_key)
+        self.assertTrue(page["results"][0]["original_image"].startswith("https://testserver/media/tryon/hand/"))
+
+    def test_cursor_walks_full_history(self):
+        """next_cursor를 따라가면 모든 기록을 최근 순으로 한 번씩 반환"""
+        history = self.create_history(7)
+        images, cursor = [], None
+        while True:
+            response = self.get_history(limit=3, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            images += [item["predicted_image"] for item in response.json()["results"]]
+            cursor = response.json()["next_cursor"]
+            if not cursor:
+                break
+
+        expected = sorted(history, key=lambda item: (item.created_at, item.id), reverse=True)
+        self.assertEqual(images, [f"https://testserver/media{item.predicted_image.name}" for item in expected])
+
+    def test_cdn_url_prefix(self):
+        """MEDIA_CDN_URL이 있으면 CDN 주소로 이미지 URL 생성"""
+        self.create_history(1)
+        with override_settings(MEDIA_CDN_URL="https://cdn.example.com/media"):
+            result = self.get_history().json()["results"][0]
+
+        self.assertEqual(result["original_image"], "https://cdn.example.com/media/tryon/hand/hand_0.png")
+
+    def test_invalid_cursor(self):
+        """잘못된 커서는 400"""
+        self.assertEqual(self.get_history(cursor="invalid").status_code, 400)
+
+class TryOnJobQueueTests(TestCase):
+    def test_backpressure(self):
+        """동시 실행 수 + 대기 수를 넘으면 TryOnQueueFull"""
+        queue = TryOnJobQueue(max_workers=1, max_pending=1)
+        release = threading.Event()
+        finished = threading.Semaphore(0)
+
+        def job(job_id):
+            release.wait(5)
+            finished.release()
+
+        queue.submit(job)
+        queue.submit(job)
+        with self.assertRaises(TryOnQueueFull):
+            queue.submit(job)
+
+        release.set()
+        self.assertTrue(finished.acquire(timeout=5))
+        self.assertTrue(finished.acquire(timeout=5))
+        # 작업이 끝나면 다시 받을 수 있음
+        for _ in range(50):
+            try:
+                queue.submit(job)
+                break
+            except TryOnQueueFull:
+                threading.Event().wait(0.01)
+        else:
+            self.fail("queue slot was not released")
+
+class TryOnJobTests(TryOnTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"customer_{self.customer.customer_key}", self.channel)
+        os.makedirs(os.path.join(self.media_root, "tryon/hand"))
+        with open(os.path.join(self.media_root, "tryon/hand/hand.png"), "wb") as f:
+            f.write(make_png_bytes())
+
+    def tearDown(self):
+        async_to_sync(self.layer.group_discard)(f"customer_{self.customer.customer_key}", self.channel)
+        super().tearDown()
+
+    def test_job_saves_history_and_notifies(self):
+        """결과 이미지 저장 후 히스토리 생성 및 WebSocket 알림"""
+        client = mock.Mock()
+        client.predict.return_value = make_model_response(make_png_bytes((0, 0, 255)))
+        with mock.patch.object(tryon, 'get_inference_client', return_value=client):
+            run_tryon_job("job-id", self.customer.customer_key, self.design.design_key, 1, "hand.png")
+
+        message = async_to_sync(self.layer.receive)(self.channel)
+        self.assertEqual(message["status"], "completed")
+        self.assertEqual(message["job_id"], "job-id")
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, "tryon/predicted/predicted_hand.png")))
+        self.assertEqual(TryOnHistory.objects.filter(user=self.customer).count(), 1)
+
+    def test_job_failure_notifies_error(self):
+        """모델 서버 오류는 failed 알림으로 전달"""
+        client = mock.Mock()
+        client.predict.side_effect = InferenceError("Model server error")
+        with mock.patch.object(tryon, 'get_inference_client', return_value=client):
+            run_tryon_job("job-id", self.customer.customer_key, self.design.design_key, 1, "hand.png")
+
+        message = async_to_sync(self.layer.receive)(self.channel)
+        self.assertEqual(message["status"], "failed")
+        self.assertFalse(TryOnHistory.objects.exists())
+
+class FakeModelServer:
+    """
+    테스트용 로컬 모델 서버
+    behaviors에 (status, delay) 목록을 넣으면 요청마다 순서대로 적용하고, 마지막 동작을 계속 반복
+    """
+
+    def __init__(self):
+        self.behaviors = [(200, 0)]
+        self.requests = 0
+        self.last_headers = None
+        self.last_body = None
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                server.last_headers = self.headers
+                server.last_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                index = min(server.requests, len(server.behaviors) - 1)
+                status_code, delay = server.behaviors[index]
+                server.requests += 1
+                server.connections.add(self.client_address)
+                time.sleep(delay)
+                body = json.dumps({"image_data": base64.b64encode(make_png_bytes()).decode()}).encode()
+                try:
+                    self.send_response(status_code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # timeout 테스트에서 클라이언트가 먼저 연결을 끊은 경우
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        # 클라이언트가 먼저 연결을 끊는 경우(timeout, 재시도)의 traceback 출력 생략
+        self.httpd.handle_error = lambda request, client_address: None
+        self.url = "http://%s:%d" % self.httpd.server_address
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class InferenceClientTests(TestCase):
+    def setUp(self):
+        self.server = FakeModelServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def make_client(self, **kwargs):
+        options = dict(connect_timeout=1, read_timeout=1, max_retries=2, backoff=0.01)
+        options.update(kwargs)
+        return InferenceClient(self.server.url, **options)
+
+    def predict(self, client):
+        return client.predict(io.BytesIO(make_png_bytes()), "hand.png", 1)
+
+    def test_predict_reuses_pooled_connection(self):
+        """keep-alive 커넥션을 재사용"""
+        client = self.make_client()
+        for _ in range(3):
+            with self.predict(client) as response:
+                self.assertIn("image_data", response.json())
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retries_on_5xx(self):
+        """5xx 응답은 재시도 후 성공"""
+        self.server.behaviors = [(503, 0), (502, 0), (200, 0)]
+        response = self.predict(self.make_client())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_gives_up_after_max_retries(self):
+        """재시도 횟수를 넘으면 InferenceError"""
+        self.server.behaviors = [(500, 0)]
+        with self.assertRaises(InferenceError):
+            self.predict(self.make_client(max_retries=1))
+        self.assertEqual(self.server.requests, 2)
+
+    def test_read_timeout(self):
+        """응답이 read timeout보다 늦으면 재시도 없이 InferenceError"""
+        self.server.behaviors = [(200, 0.5)]
+        with self.assertRaises(InferenceError):
+            self.predict(self.make_client(read_timeout=0.1))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_client_error_is_not_retried(self):
+        """4xx 응답은 재시도하지 않음"""
+        self.server.behaviors = [(422, 0)]
+        with self.assertRaises(InferenceError):
+            self.predict(self.make_client())
+        self.assertEqual(self.server.requests, 1)
+
+    def test_circuit_breaker_fails_fast(self):
+        """연속 실패 후에는 모델 서버를 호출하지 않고 바로 실패, reset 이후 다시 시도"""
+        self.server.behaviors = [(500, 0), (500, 0), (200, 0)]
+        client = self.make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+        for _ in range(2):
+            with self.assertRaises(InferenceError):
+                self.predict(client)
+
+        with self.assertRaises(InferenceUnavailable):
+            self.predict(client)
+        self.assertEqual(self.server.requests, 2)
+
+        time.sleep(0.25)
+        self.assertEqual(self.predict(client).status_code, 200)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_connect_timeout_is_retried(self):
+        """연결 timeout은 연결 오류와 같이 재시도"""
+        client = self.make_client()
+        post = client.session.post
+        calls = []
+
+        def flaky_post(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise requests.ConnectTimeout("connect timed out")
+            return post(*args, **kwargs)
+
+        with mock.patch.object(client.session, 'post', side_effect=flaky_post):
+            response = self.predict(client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_unexpected_error_in_trial_call_reopens_circuit(self):
+        """half-open 시험 호출에서 예상하지 못한 예외가 나도 실패로 기록하여 다시 시도할 수 있음"""
+        client = self.make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+        self.server.behaviors = [(500, 0), (200, 0)]
+        with self.assertRaises(InferenceError):
+            self.predict(client)
+
+        time.sleep(0.15)
+        with mock.patch.object(client.session, 'post', side_effect=RuntimeError("unexpected")):
+            with self.assertRaises(RuntimeError):
+                self.predict(client)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.15)
+        self.assertEqual(self.predict(client).status_code, 200)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_upload_is_streamed_as_multipart(self):
+        """손 사진을 Content-Length가 있는 multipart 본문으로 전송"""
+        image = make_png_bytes()
+        with self.predict(self.make_client()):
+            pass
+
+        self.assertNotIn("Transfer-Encoding", self.server.last_headers)
+        self.assertEqual(int(self.server.last_headers["Content-Length"]), len(self.server.last_body))
+        self.assertIn(b'name="design_name"\r\n\r\n1\r\n', self.server.last_body)
+        self.assertIn(b'filename="hand.png"\r\nContent-Type: image/png\r\n\r\n' + image + b"\r\n--", self.server.last_body)
+
+    def test_filename_cannot_inject_part_headers(self):
+        """파일 이름의 따옴표와 줄바꿈은 제거"""
+        body = MultipartStream({}, "image", 'hand".png\r\nX-Injected: 1', io.BytesIO(b"image"), "image/png").read()
+        self.assertIn(b'filename="hand.pngX-Injected: 1"\r\nContent-Type: image/png\r\n', body)
+        self.assertNotIn(b"\r\nX-Injected", body)
+
+class TryOnResultCacheTests(TryOnTestMixin, TestCase):
+    def make_result(self, name, size):
+        path = os.path.join(self.media_root, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_lru_eviction_by_bytes(self):
+        """용량을 넘으면 가장 오래 사용되지 않은 결과부터 삭제"""
+        cache = TryOnResultCache(max_bytes=250)
+        cache.put("a", self.make_result("a.png", 100))
+        cache.put("b", self.make_result("b.png", 100))
+        self.assertIsNotNone(cache.get("a"))  # a를 최근 사용으로 갱신
+
+        cache.put("c", self.make_result("c.png", 100))
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "entries": 2, "bytes": 200})
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "tryon/cache/b.png")))
+
+    def test_capacity_shared_across_processes(self):
+        """다른 프로세스가 추가한 결과도 용량에 포함하여 디렉토리 전체를 max_bytes 이하로 유지"""
+        first, second = TryOnResultCache(max_bytes=250), TryOnResultCache(max_bytes=250)
+        first.put("a", self.make_result("a.png", 100))
+        second.put("b", self.make_result("b.png", 100))
+        first.put("c", self.make_result("c.png", 100))
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, "tryon/cache"))), ["b.png", "c.png"])
+        self.assertEqual(first.stats()["bytes"], 200)
+        self.assertIsNone(second.get("a"))
+        self.assertIsNotNone(second.get("c"))
+
+    def test_restores_entries_from_disk(self):
+        """프로세스가 재시작되어도 디스크의 결과를 다시 사용"""
+        TryOnResultCache().put("a", self.make_result("a.png", 10))
+        self.assertIsNotNone(TryOnResultCache().get("a"))
+
+class StreamingIOTests(TryOnTestMixin, TestCase):
+    def test_multipart_stream_reads_in_bounded_chunks(self):
+        """본문을 요청한 크기만큼만 읽음"""
+        image = os.urandom(100_000)
+        stream = MultipartStream({"design_name": 1}, "image", "hand.png", io.BytesIO(image), "image/png")
+        chunks = list(iter(lambda: stream.read(8192), b""))
+        body = b"".join(chunks)
+
+        self.assertTrue(all(len(chunk) <= 8192 for chunk in chunks))
+        self.assertEqual(len(body), len(stream))
+        self.assertIn(image, body)
+
+    def test_stream_image_data_decodes_across_chunks(self):
+        """chunk 경계에 걸친 필드 이름, 이스케이프, base64도 올바르게 디코딩"""
+        image = os.urandom(5000)
+        encoded = base64.b64encode(image).decode().replace("/", "\\/")
+        body = ('{"status": "ok", "image_data" : "' + encoded + '"}').encode()
+        destination = os.path.join(self.media_root, "out.png")
+
+        for chunk_size in (1, 3, 7, 64, 4096):
+            stream_image_data(make_model_response(None, body), destination, chunk_size=chunk_size)
+            with open(destination, "rb") as f:
+                self.assertEqual(f.read(), image)
+
+    def test_stream_image_data_without_field(self):
+        """image_data가 없으면 InferenceError"""
+        with self.assertRaises(InferenceError):
+            stream_image_data(make_model_response(None, b'{"error": "x"}'), os.path.join(self.media_root, "out.png"))
+
+class RetentionTests(TryOnTestMixin, TestCase):
+    def create_tryon(self, customer, name, register=True):
+        """원본/결과 파일과 히스토리를 만들고 보관 인덱스에 등록 (register=False면 다른 프로세스의 등록처럼 인덱스에만 추가)"""
+        paths = (f"/tryon/hand/{name}.png", f"/tryon/predicted/predicted_{name}.png")
+        for path in paths:
+            full_path = os.path.join(self.media_root, path.lstrip('/'))
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(b"image")
+            if register:
+                register_media(path, customer.customer_key)
+            else:
+                MediaFile.objects.create(path=path, owner=customer, size=5)
+        TryOnHistory.objects.create(
+            user=customer, original_image=paths[0], predicted_image=paths[1], design_key=self.design
+        )
+        return paths
+
+    def exists(self, path):
+        return os.path.exists(os.path.join(self.media_root, path.lstrip('/')))
+
+    def test_per_user_quota_evicts_oldest_pairs(self):
+        """사용자별 제한을 넘으면 가장 오래된 Try-On의 파일과 히스토리를 함께 삭제"""
+        created = [self.create_tryon(self.customer, f"hand_{i}") for i in range(3)]
+
+        evicted = sweep(max_files=100, max_files_per_user=4)
+
+        self.assertEqual(evicted, 2)
+        self.assertFalse(any(self.exists(path) for path in created[0]))
+        self.assertTrue(all(self.exists(path) for paths in created[1:] for path in paths))
+        self.assertEqual(TryOnHistory.objects.count(), 2)
+        self.assertFalse(TryOnHistory.objects.filter(original_image=created[0][0]).exists())
+        self.assertEqual(MediaFile.objects.count(), 4)
+
+    def test_odd_quota_does_not_leave_half_pair(self):
+        """제한이 홀수여도 원본/결과 중 하나만 남기지 않음"""
+        created = [self.create_tryon(self.customer, f"hand_{i}") for i in range(2)]
+
+        sweep(max_files=100, max_files_per_user=3)
+
+        self.assertFalse(any(self.exists(path) for path in created[0]))
+        self.assertEqual(MediaFile.objects.count(), 2)
+        self.assertEqual(TryOnHistory.objects.count(), 1)
+
+    def test_global_quota_spans_users(self):
+        """전체 제한은 사용자와 관계없이 가장 오래된 파일부터 삭제"""
+        other = Customers.objects.create(customer_id="other", customer_name="Other")
+        first = self.create_tryon(other, "other_0")
+        second = self.create_tryon(self.customer, "hand_0")
+        third = self.create_tryon(other, "other_1")
+
+        evicted = sweep(max_files=4, max_files_per_user=100)
+
+        self.assertEqual(evicted, 2)
+        self.assertFalse(any(self.exists(path) for path in first))
+        self.assertTrue(all(self.exists(path) for path in second + third))
+        self.assertEqual(TryOnHistory.objects.filter(user=other).count(), 1)
+
+    def test_within_quota_is_noop(self):
+        """제한 이내면 아무것도 삭제하지 않음"""
+        self.create_tryon(self.customer, "hand_0")
+
+        self.assertEqual(sweep(max_files=10, max_files_per_user=10), 0)
+        self.assertEqual(MediaFile.objects.count(), 2)
+
+    @override_settings(TRYON_RETENTION_MAX_FILES=100, TRYON_RETENTION_MAX_FILES_PER_USER=2)
+    def test_sweeper_checks_only_new_owners(self):
+        """업로드 후 정리는 새로 등록한 사용자만 확인하고 전체 파일 수는 count() 없이 계산, 주기적 정리는 전체 확인"""
+        other = Customers.objects.create(customer_id="other", customer_name="Other")
+        sweeper = RetentionSweeper()
+        with mock.patch.object(retention, 'retention_sweeper', sweeper):
+            sweeper.run_once()
+            other_created = [self.create_tryon(other, f"other_{i}", register=False) for i in range(2)]
+            created = [self.create_tryon(self.customer, f"hand_{i}") for i in range(2)]
+
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(sweeper.run_once(), 2)
+            counts = [q['sql'] for q in captured.captured_queries if 'COUNT(' in q['sql']]
+            self.assertTrue(counts)
+            self.assertTrue(all('"owner_id" =' in sql for sql in counts))
+            self.assertFalse(any(self.exists(path) for path in created[0]))
+            self.assertTrue(all(self.exists(path) for paths in other_created for path in paths))
+
+            self.assertEqual(sweeper.run_once(full=True), 2)
+            self.assertFalse(any(self.exists(path) for path in other_created[0]))
+            self.assertEqual(MediaFile.objects.count(), 4)
@@ -0,0 +1,379 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils.encoding import filepath_to_uri
+
+from .models import TryOnHistory
+from .inference import get_inference_client, stream_image_data
+from .retention import register_media
+from .realtime import publish_sync
+from .utils import encode_cursor, keyset_filter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
+class TryOnQueueFull(Exception):
+    """대기 중인 Try-On 작업이 너무 많을 때 발생"""
+
+class TryOnJobQueue:
+    """
+    모델 서버와 통신하는 Try-On 작업을 처리하는 제한된 크기의 작업 큐
+    - max_workers: 동시에 모델 서버를 호출하는 작업 수
+    - max_pending: 실행 대기 중인 작업 수, 가득 차면 TryOnQueueFull 발생
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or getattr(settings, 'TRYON_MAX_WORKERS', 4)
+        self.max_pending = max_pending if max_pending is not None else getattr(settings, 'TRYON_MAX_PENDING', 16)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tryon')
+            return self._executor
+
+    def submit(self, func, *args, **kwargs):
+        """작업을 큐에 넣고 job_id를 반환, 큐가 가득 차 있으면 TryOnQueueFull 발생"""
+        if not self._slots.acquire(blocking=False):
+            raise TryOnQueueFull("Try-on queue is full")
+
+        job_id = str(uuid.uuid4())
+        try:
+            self._get_executor().submit(self._run, job_id, func, args, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs):
+        try:
+            func(job_id, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"Try-on job {job_id} failed: {str(e)}")
+        finally:
+            close_old_connections()
+            self._slots.release()
+
+tryon_queue = TryOnJobQueue()
+
+def save_upload(uploaded_file, path, mapped_id):
+    """업로드된 손 사진을 디스크에 저장하면서 결과 캐시 key(손 사진 + 디자인 ID의 sha256)를 함께 계산"""
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+            digest.update(chunk)
+    digest.update(f"|design={mapped_id}".encode())
+    return digest.hexdigest()
+
+def link_or_copy(source, destination):
+    """가능하면 하드링크로, 아니면 복사로 파일을 만든다"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def touch(path):
+    """수정 시각을 현재 시각으로 갱신 (os.utime() 기본값은 커널 시계 단위라 연속 호출이 같은 시각이 될 수 있음)"""
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+class TryOnResultCache:
+    """
+    입력(손 사진 + 디자인 ID) digest를 key로 결과 이미지를 보관하는 content-addressed 캐시
+    결과 파일은 MEDIA_ROOT/tryon/cache/<digest>.png에 저장하고,
+    전체 크기가 max_bytes를 넘으면 가장 오래 사용되지 않은 항목부터 삭제 (LRU)
+    캐시 디렉토리는 여러 워커 프로세스가 공유하므로 추가할 때마다 디스크의 파일 크기와 수정 시각으로
+    사용량과 LRU 순서를 다시 계산 (max_bytes는 모든 프로세스를 합한 용량)
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # digest -> 파일 크기
+        self._total_bytes = 0
+        self._directory = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'TRYON_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+
+    def _load(self):
+        """캐시 디렉토리를 처음 사용할 때 디스크의 파일로 LRU 순서를 복원"""
+        directory = Path(settings.MEDIA_ROOT) / "tryon/cache"
+        if directory == self._directory:
+            return directory
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan(directory)
+        self._directory = directory
+        return directory
+
+    def _scan(self, directory):
+        """디스크의 파일로 전체 크기와 LRU 순서(수정 시각)를 다시 계산 (다른 프로세스가 추가/삭제한 파일 포함)"""
+        files = []
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.png') or entry.name.startswith('temp_'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, entry.name[:-4], stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((digest, size) for _, digest, size in files)
+        self._total_bytes = sum(self._entries.values())
+
+    def get(self, digest):
+        """캐시된 결과 파일 경로를 반환, 없으면 None (다른 프로세스가 추가한 결과도 사용)"""
+        with self._lock:
+            directory = self._load()
+            path = directory / f"{digest}.png"
+            try:
+                touch(path)
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            else:
+                if digest not in self._entries:
+                    self._entries[digest] = size
+                    self._total_bytes += size
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return path
+
+            if digest in self._entries:
+                self._total_bytes -= self._entries.pop(digest)
+            self.misses += 1
+            return None
+
+    def put(self, digest, source_path):
+        """결과 파일을 캐시에 추가하고 용량을 넘으면 LRU 항목을 삭제"""
+        with self._lock:
+            directory = self._load()
+            path = directory / f"{digest}.png"
+            if not path.exists():
+                temp_path = directory / f"temp_{uuid.uuid4().hex}.png"
+                link_or_copy(source_path, temp_path)
+                os.replace(temp_path, path)
+            touch(path)
+            self._scan(directory)
+            self._entries.move_to_end(digest)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            digest, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._directory / f"{digest}.png")
+            except FileNotFoundError:
+                pass
+            logger.info(f"Evicted try-on cache entry {digest}")
+
+    def discard(self, digest):
+        """get() 이후 결과 파일이 삭제된 항목을 제거하고 hit를 miss로 정정"""
+        with self._lock:
+            if digest in self._entries:
+                self._total_bytes -= self._entries.pop(digest)
+            self.hits -= 1
+            self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def render(self):
+        """Prometheus text exposition format으로 변환 (hit rate = hits / (hits + misses))"""
+        stats = self.stats()
+        return "\n".join([
+            "# HELP nailo_tryon_cache_hits_total Try-On 결과 캐시 hit 개수",
+            "# TYPE nailo_tryon_cache_hits_total counter",
+            f"nailo_tryon_cache_hits_total {stats['hits']}",
+            "# HELP nailo_tryon_cache_misses_total Try-On 결과 캐시 miss 개수",
+            "# TYPE nailo_tryon_cache_misses_total counter",
+            f"nailo_tryon_cache_misses_total {stats['misses']}",
+            "# HELP nailo_tryon_cache_entries Try-On 결과 캐시 항목 수",
+            "# TYPE nailo_tryon_cache_entries gauge",
+            f"nailo_tryon_cache_entries {stats['entries']}",
+            "# HELP nailo_tryon_cache_bytes Try-On 결과 캐시 전체 크기(bytes)",
+            "# TYPE nailo_tryon_cache_bytes gauge",
+            f"nailo_tryon_cache_bytes {stats['bytes']}",
+        ]) + "\n"
+
+tryon_result_cache = TryOnResultCache()
+
+def use_cached_result(customer_key, design_key, input_digest, cached_path, unique_filename):
+    """
+    캐시된 결과로 히스토리를 반환합니다.
+    같은 고객의 같은 입력 히스토리가 남아있으면 그대로 반환하고, 없으면 결과 파일을 복사해 새로 생성합니다.
+    get() 이후 캐시 파일이 삭제되었으면 miss로 처리하고 None을 반환합니다.
+    """
+    media_root = Path(settings.MEDIA_ROOT)
+    hand_image_path = media_root / "tryon/hand" / unique_filename
+
+    history = TryOnHistory.objects.filter(
+        user_id=customer_key, input_digest=input_digest
+    ).order_by('-created_at').first()
+    if history is not None and (media_root / history.predicted_image.name.lstrip('/')).exists():
+        # 이미 같은 사진이 저장되어 있으므로 방금 업로드한 파일은 필요 없음
+        if os.path.exists(hand_image_path):
+            os.remove(hand_image_path)
+        return history
+
+    predicted_filename = f"predicted_{unique_filename}"
+    try:
+        link_or_copy(cached_path, media_root / "tryon/predicted" / predicted_filename)
+    except FileNotFoundError:
+        # 다른 요청의 put()으로 방금 LRU에서 삭제된 경우
+        tryon_result_cache.discard(input_digest)
+        return None
+    history = TryOnHistory.objects.create(
+        user_id=customer_key,
+        original_image=f"/tryon/hand/{unique_filename}",
+        predicted_image=f"/tryon/predicted/{predicted_filename}",
+        design_key_id=design_key,
+        input_digest=input_digest,
+    )
+    register_media(f"/tryon/hand/{unique_filename}", customer_key)
+    register_media(f"/tryon/predicted/{predicted_filename}", customer_key)
+    return history
+
+def notify_tryon(customer_key, event):
+    """고객 WebSocket 그룹에 Try-On 결과를 전송"""
+    publish_sync(f"customer_{customer_key}", {"type": "notify_tryon_result", **event})
+
+def run_tryon_job(job_id, customer_key, design_key, mapped_id, unique_filename, input_digest=''):
+    """
+    모델 서버에 손 사진을 보내 결과 이미지를 저장하고, 히스토리 저장 후 WebSocket으로 결과를 전달합니다.
+    input_digest가 있으면 결과를 캐시에 추가합니다.
+    모델 서버에는 클라이언트가 보낸 파일 이름 대신 서버에서 만든 unique_filename을 전달합니다.
+    실패하면 status가 failed인 결과를 전달합니다.
+    """
+    hand_image_path = Path(settings.MEDIA_ROOT) / "tryon/hand" / unique_filename
+    predicted_filename = f"predicted_{unique_filename}"
+    predicted_path = Path(settings.MEDIA_ROOT) / "tryon/predicted" / predicted_filename
+    temp_path = predicted_path.parent / f"temp_{predicted_filename}"
+
+    try:
+        os.makedirs(predicted_path.parent, exist_ok=True)
+
+        # 손 사진은 파일에서 스트리밍으로 전송하고, base64 응답은 디코딩하면서 임시 파일에 바로 기록
+        with open(hand_image_path, "rb") as hand_file:
+            response = get_inference_client().predict(hand_file, unique_filename, mapped_id)
+            with response:
+                stream_image_data(response, temp_path)
+
+        # 이미지 유효성 검사
+        try:
+            with Image.open(temp_path) as img:
+                img.verify()
+            logger.info(f"이미지가 정상적으로 수신되었습니다. 크기: {os.path.getsize(temp_path)} bytes")
+
+            # 정상이면 같은 디렉토리의 실제 파일명으로 교체
+            os.replace(temp_path, predicted_path)
+        except Exception as e:
+            raise ValueError(f"수신된 이미지가 손상되었습니다: {str(e)}")
+
+        TryOnHistory.objects.create(
+            user_id=customer_key,
+            original_image=f"/tryon/hand/{unique_filename}",
+            predicted_image=f"/tryon/predicted/{predicted_filename}",
+            design_key_id=design_key,
+            input_digest=input_digest,
+        )
+        register_media(f"/tryon/predicted/{predicted_filename}", customer_key)
+        if input_digest:
+            tryon_result_cache.put(input_digest, predicted_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        logger.error(f"Try-on job {job_id} error: {str(e)}")
+        notify_tryon(customer_key, {
+            "job_id": job_id,
+            "status": "failed",
+            "design_key": str(design_key),
+            "error": str(e),
+        })
+        return
+
+    notify_tryon(customer_key, {
+        "job_id": job_id,
+        "status": "completed",
+        "original_image": f"/media/tryon/hand/{unique_filename}",
+        "predicted_image": f"/media/tryon/predicted/{predicted_filename}",
+        "design_key": str(design_key),
+    })
+
+def media_url_prefix(request):
+    """
+    미디어 파일 URL 앞부분 (항상 '/'로 끝남)
+    MEDIA_CDN_URL이 있으면 CDN 주소, 없으면 요청 host 기준 https 주소
+    """
+    cdn_url = getattr(settings, 'MEDIA_CDN_URL', '')
+    if cdn_url:
+        return cdn_url.rstrip('/') + '/'
+    return request.build_absolute_uri(default_storage.base_url).replace('http://', 'https://')
+
+def build_history_page(customer, prefix, limit=None, cursor=None):
+    """
+    고객의 입혀보기 기록을 최근 순으로 (created_at, id) keyset 페이지네이션하여 반환
+    필요한 컬럼만 조회하고 design_key는 FK 컬럼 값을 그대로 사용하므로 페이지당 쿼리 1번
+    이미지 URL은 prefix 뒤에 저장된 파일 경로를 붙여서 생성
+    """
+    limit = min(int(limit or DEFAULT_HISTORY_PAGE_SIZE), MAX_HISTORY_PAGE_SIZE)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+
+    history = TryOnHistory.objects.filter(user=customer)
+    if cursor:
+        history = keyset_filter(history, cursor, 'created_at', 'id')
+    rows = list(
+        history.order_by('-created_at', '-id')
+        .values('id', 'original_image', 'predicted_image', 'created_at', 'design_key_id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    def media_url(name):
+        # 저장된 경로는 "/tryon/..." 형식
+        return prefix + filepath_to_uri(name).lstrip('/') if name else None
+
+    return {
+        "results": [
+            {
+                "original_image": media_url(row['original_image']),
+                "predicted_image": media_url(row['predicted_image']),
+                "created_at": row['created_at'],
+                "design_key": row['design_key_id'],
+            }
+            for row in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None,
+    }
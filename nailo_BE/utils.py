@@ -1,4 +1,13 @@
 from .models import Customers, Shops
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from collections import OrderedDict
+from datetime import datetime
+import base64
+import binascii
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,4 +37,94 @@ def get_user_id(user_type, user_id):
     
     except Exception as e:
         logger.error(f"Unexpected error in get_user_id: {str(e)}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+class IdentityCache:
+    """
+    (user_type, user_id) -> 사용자 객체를 프로세스 메모리에 보관하는 TTL + LRU 캐시
+    존재하지 않는 사용자는 캐시하지 않으며, 고객/샵이 변경되면 signals에서 invalidate()를 호출
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries = OrderedDict()  # (user_type, user_id) -> (user, 저장 시각)
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'IDENTITY_CACHE_TTL', 60)
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, 'IDENTITY_CACHE_SIZE', 1024)
+
+    def get(self, user_type, user_id):
+        """get_user_id와 같은 (user, user_type)을 반환, 캐시에 있으면 DB를 조회하지 않음"""
+        key = (user_type, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                return entry[0], user_type
+
+        user, resolved_type = get_user_id(user_type, user_id)
+        if user is not None:
+            with self._lock:
+                self._entries[key] = (user, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return user, resolved_type
+
+    def invalidate(self, user_type, pk, user_id=None):
+        """
+        해당 사용자의 캐시 항목을 삭제
+        id가 바뀐 경우를 위해 pk로도 찾고, 같은 id로 새로 생성된 경우를 위해 user_id로도 찾음
+        """
+        with self._lock:
+            stale = [
+                key for key, (user, _) in self._entries.items()
+                if key[0] == user_type and (user.pk == pk or key[1] == user_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+identity_cache = IdentityCache()
+
+def encode_cursor(created_at, key):
+    """(created_at, key) 위치를 클라이언트에 전달할 커서 문자열로 변환"""
+    raw = f"{created_at.isoformat()}|{key}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """커서 문자열을 (created_at, key) 튜플로 변환, 잘못된 커서는 ValueError"""
+    try:
+        created_at, key = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), key
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def keyset_filter(queryset, cursor, time_field, key_field, descending=True):
+    """
+    (time_field, key_field) 순서 기준으로 커서 이후의 row만 남기는 keyset 필터
+    descending=True면 커서보다 오래된 row, False면 커서보다 새로운 row
+    커서의 key가 key_field 형식(UUID, 정수 등)에 맞지 않으면 ValueError
+    """
+    created_at, key = decode_cursor(cursor)
+    op = 'lt' if descending else 'gt'
+    try:
+        return queryset.filter(
+            Q(**{f'{time_field}__{op}': created_at}) |
+            Q(**{time_field: created_at, f'{key_field}__{op}': key})
+        )
+    except (ValidationError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
@@ -2,10 +2,7 @@ import os
 from django.conf import settings
 
 from pathlib import Path
-from django.http import JsonResponse
-
-from channels.layers import get_channel_layer 
-from asgiref.sync import async_to_sync
+from django.http import JsonResponse, HttpResponse
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response as DRFResponse
@@ -18,13 +15,17 @@ from drf_yasg import openapi
 
 from .serializers import *
 from .models import *
-from .utils import get_user_id
+from .sampling import design_key_pool
+from .feed import home_feed, active_designs, build_design_page, FeedChunkMissing
+from .likes import toggle_like, build_like_page, DesignNotFound
+from .metrics import action_metrics
+from .retention import register_media
+from .tryon import (
+    tryon_queue, run_tryon_job, TryOnQueueFull,
+    tryon_result_cache, save_upload, use_cached_result,
+    build_history_page, media_url_prefix,
+)
 
-from PIL import Image
-import base64
-import shutil  
-import requests
-import random
 import re 
 import logging
 
@@ -72,7 +73,7 @@ class UserDetailView(APIView):
             if not user_type_header or not user_id:
                 return DRFResponse({"error": "사용자 정보를 헤더에 포함해야 합니다."}, status=400)
 
-            user, user_type = get_user_id(user_type_header, user_id)
+            user, user_type = request.nailo_user, request.nailo_user_type
             # 만약 packing 관련 오류라면 둘 중 하나가 invalid
             if not user or user_type != "customer":
                 return DRFResponse({"error": "유효하지 않은 사용자입니다."}, status=403)
@@ -125,6 +126,20 @@ class HomePageView(APIView):
                 type=openapi.TYPE_INTEGER,
                 required=False,
             ),
+            openapi.Parameter(
+                'pagination',
+                openapi.IN_QUERY,
+                description="'cursor'이면 page 대신 cursor로 다음 페이지 요청 (응답: results, next_cursor)",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                'cursor',
+                openapi.IN_QUERY,
+                description="이전 응답의 next_cursor (pagination=cursor일 때)",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
         ],
         responses={
             200: openapi.Schema(
@@ -141,34 +156,71 @@ class HomePageView(APIView):
     )
     def get(self, request, *args, **kwargs):
         query_type = request.query_params.get('type', 'random')  # 기본값은 'random'
-        designs = Designs.objects.all().order_by('-created_at')
+        designs = active_designs()
 
         if query_type == 'random':
-            return self._get_random_designs(designs)
+            return self._get_random_designs()
 
         elif query_type == 'all':
+            if request.query_params.get('pagination') == 'cursor':
+                return self._get_cursor_designs(request)
             return self._get_paginated_designs(designs, request)
 
         return DRFResponse({"error": "Invalid 'type' parameter. Use 'random' or 'all'."}, status=400)
 
-    def _get_random_designs(self, designs):
-        """HotNailList-랜덤 9개 디자인 반환"""
-        random_designs = random.sample(list(designs), min(len(designs), 9))
+    def _get_random_designs(self):
+        """HotNailList-랜덤 9개 디자인 반환 (캐싱된 활성 디자인 key에서 샘플링)"""
+        sampled_keys = design_key_pool.sample(9)
+        designs = Designs.objects.filter(design_key__in=sampled_keys, is_active=True).in_bulk()
+        random_designs = [designs[key] for key in sampled_keys if key in designs]
         serializer = DesignSerializer(random_designs, many=True)
         return DRFResponse(serializer.data)
 
+    def _get_cursor_designs(self, request):
+        """스냅-전체 디자인 반환 (커서 페이지네이션, 전체 개수 없음)"""
+        try:
+            page = build_design_page(
+                limit=request.query_params.get("page_size"),
+                cursor=request.query_params.get("cursor"),
+            )
+        except ValueError as e:
+            return DRFResponse({"error": str(e)}, status=400)
+        return DRFResponse(page, status=200)
+
     def _get_paginated_designs(self, designs, request):
-        """스냅-전체 디자인 반환 (페이지네이션)"""
+        """스냅-전체 디자인 반환 (페이지네이션, 공유 cache의 스냅샷에서 해당 페이지만 읽음)"""
         paginator = HomePagePagination()
+        snapshot = home_feed.snapshot()
+        if snapshot is not None:
+            try:
+                page = paginator.paginate_queryset(snapshot, request, view=self)
+                return paginator.get_paginated_response(page)
+            except FeedChunkMissing:
+                logger.warning("Home feed snapshot chunk missing, falling back to database")
+
+        # 스냅샷을 사용할 수 없으면 DB에서 직접 조회
         paginated_designs = paginator.paginate_queryset(designs, request, view=self)
         serializer = DesignSerializer(paginated_designs, many=True)
         return paginator.get_paginated_response(serializer.data)
     
 class LikeListView(APIView):
     @swagger_auto_schema(
-        operation_description="현재 사용자 기반 좋아요 리스트를 반환합니다.",
+        operation_description="현재 사용자 기반 좋아요 리스트를 최근에 좋아요한 순으로 반환합니다.",
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, description="페이지 크기 (기본 20, 최대 100)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="이전 응답의 next_cursor", type=openapi.TYPE_STRING),
+        ],
         responses={
-            200: DesignSerializer(many=True),
+            200: openapi.Response(
+                "좋아요 리스트",
+                openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        "results": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                        "next_cursor": openapi.Schema(type=openapi.TYPE_STRING),
+                    },
+                ),
+            ),
             400: "사용자 정보를 헤더에 포함해야 합니다.",
             403: "유효하지 않은 사용자입니다.",
         },
@@ -180,19 +232,19 @@ class LikeListView(APIView):
         if not user_type_header or not user_id:
             return DRFResponse({"error": "사용자 정보를 헤더에 포함해야 합니다."}, status=400)
 
-        user, user_type = get_user_id(user_type_header, user_id)
+        user, user_type = request.nailo_user, request.nailo_user_type
         if not user or user_type != "customer":
             return DRFResponse({"error": "유효하지 않은 사용자입니다."}, status=403)
 
-        customer = user
-        
-        liked_designs = Like.objects.filter(customer=customer)
-        if not liked_designs.exists():
-            return DRFResponse({"message": "좋아요 내역이 없습니다."}, status=200)
-
-        designs = [like.design for like in liked_designs]
-        serializer = DesignSerializer(designs, many=True)
-        return DRFResponse(serializer.data, status=200)
+        try:
+            page = build_like_page(
+                user,
+                limit=request.query_params.get("limit"),
+                cursor=request.query_params.get("cursor"),
+            )
+        except ValueError as e:
+            return DRFResponse({"error": str(e)}, status=400)
+        return DRFResponse(page, status=200)
 
 class LikeToggleView(APIView):
     @swagger_auto_schema(
@@ -229,30 +281,18 @@ class LikeToggleView(APIView):
         if not user_type_header or not user_id:
             return DRFResponse({"error": "사용자 정보를 헤더에 포함해야 합니다."}, status=400)
 
-        user, user_type = get_user_id(user_type_header, user_id)
+        user, user_type = request.nailo_user, request.nailo_user_type
         if not user or user_type != "customer":
             return DRFResponse({"error": "유효하지 않은 사용자입니다."}, status=403)
 
-        customer = user
-        
         try:
-            design = Designs.objects.get(pk=design_key)
-        except Designs.DoesNotExist:
+            liked, like_count = toggle_like(user, design_key)
+        except DesignNotFound:
             return DRFResponse({"error": "Design not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        like, created = Like.objects.get_or_create(customer=customer, design=design)
-
-        if not created:
-            # 좋아요 취소
-            like.delete()
-            design.like_count = design.like_count = design.like_count - 1
-            design.save()
-            return DRFResponse({"message": "좋아요가 취소되었습니다.", "like_count": design.like_count}, status=status.HTTP_200_OK)
-
-        # 좋아요 추가
-        design.like_count = design.like_count + 1
-        design.save()
-        return DRFResponse({"message": "좋아요가 추가되었습니다.", "like_count": design.like_count}, status=status.HTTP_201_CREATED)
+        if not liked:
+            return DRFResponse({"message": "좋아요가 취소되었습니다.", "like_count": like_count}, status=status.HTTP_200_OK)
+        return DRFResponse({"message": "좋아요가 추가되었습니다.", "like_count": like_count}, status=status.HTTP_201_CREATED)
 
 class DesignDetailView(APIView):
     @swagger_auto_schema(
@@ -292,46 +332,14 @@ class DesignListView(APIView):
         serializer = DesignSerializer(designs, many=True) 
         return DRFResponse(serializer.data)
 
-def manage_directory_files(directory_path, max_files=10):
-    """
-    디렉토리 내 파일 수를 관리하고 데이터베이스를 동기화하는 함수
-    가장 오래된 파일부터 삭제하여 최대 파일 수를 유지
-    """
-    try:
-        files = list(Path(directory_path).glob('*'))
-        files.sort(key=lambda x: x.stat().st_ctime)
-        
-        while len(files) >= max_files:
-            oldest_file = files.pop(0) 
-            try:
-                filename = oldest_file.name
-                
-                # DB에 저장된 형식과 동일한 경로로 구성
-                if "predicted" in str(oldest_file):
-                    db_path = f"/tryon/predicted/{filename}"
-                    TryOnHistory.objects.filter(predicted_image=db_path).delete()
-                else:
-                    db_path = f"/tryon/hand/{filename}"
-                    TryOnHistory.objects.filter(original_image=db_path).delete()
-                
-                if oldest_file.exists():
-                    oldest_file.unlink()
-                    logger.info(f"Deleted file {oldest_file} and its database record with path {db_path}")
-                
-            except Exception as e:
-                logger.error(f"Error in file deletion process for {oldest_file}: {str(e)}")
-                
-    except Exception as e:
-        logger.error(f"Error managing directory {directory_path}: {str(e)}")
-        
 class TryOnView(APIView):
     parser_classes = [MultiPartParser]
 
     @swagger_auto_schema(
         operation_summary="네일 입혀보기 기능",
         operation_description="""
-        사용자가 손 사진을 업로드하고 네일 디자인 키를 제공하면 FastAPI 모델 서버를 통해 처리된 결과를 반환합니다.
-        처리 결과는 WebSocket을 통해 사용자에게 전송됩니다.
+        사용자가 손 사진을 업로드하고 네일 디자인 키를 제공하면 작업 ID를 즉시 반환합니다.
+        FastAPI 모델 서버를 통해 처리된 결과는 WebSocket(notify_tryon_result)을 통해 사용자에게 전송됩니다.
         """,
         manual_parameters=[
             openapi.Parameter(
@@ -365,13 +373,25 @@ class TryOnView(APIView):
         ],
         responses={
             200: openapi.Response(
-                description="이미지 업로드 및 처리 성공",
+                description="같은 사진과 디자인의 결과가 캐시되어 있어 바로 반환",
                 examples={
                     "application/json": {
                         "message": "이미지가 생성되었습니다.",
                         "original_image": "/media/tryon/hand/0ad0f443-1464-4104-9755-f252f10825ba.png",
                         "predicted_image": "/media/tryon/predicted/predicted_0ad0f443-1464-4104-9755-f252f10825ba.png",
                         "design_key" : "uuid",
+                        "cached": True,
+                    }
+                }
+            ),
+            202: openapi.Response(
+                description="이미지 생성 요청 접수 (결과는 WebSocket notify_tryon_result로 전달)",
+                examples={
+                    "application/json": {
+                        "message": "이미지 생성 요청이 접수되었습니다.",
+                        "job_id": "uuid",
+                        "original_image": "/media/tryon/hand/0ad0f443-1464-4104-9755-f252f10825ba.png",
+                        "design_key" : "uuid",
                     }
                 }
             ),
@@ -391,11 +411,19 @@ class TryOnView(APIView):
                     }
                 }
             ),
+            429: openapi.Response(
+                description="대기 중인 요청이 너무 많음",
+                examples={
+                    "application/json": {
+                        "error": "Too many try-on requests. Please retry later."
+                    }
+                }
+            ),
             500: openapi.Response(
                 description="서버 에러",
                 examples={
                     "application/json": {
-                        "error": "Model server communication error: ..."
+                        "error": "..."
                     }
                 }
             ),
@@ -447,6 +475,10 @@ class TryOnView(APIView):
             if not mapped_id:
                 return JsonResponse({"error": f"Invalid design ID: {original_id}"}, status=400)
             
+            customer = request.nailo_user
+            if customer is None or request.nailo_user_type != "customer":
+                return JsonResponse({"error": "User not found."}, status=404)
+
             unique_filename = f"{uuid.uuid4()}.png"
             hand_image_path = Path(settings.MEDIA_ROOT) / "tryon/hand" / unique_filename
             predicted_path_dir = Path(settings.MEDIA_ROOT) / "tryon/predicted"
@@ -454,84 +486,48 @@ class TryOnView(APIView):
             os.makedirs(hand_image_path.parent, exist_ok=True)
             os.makedirs(predicted_path_dir, exist_ok=True)
 
-            manage_directory_files(hand_image_path.parent)
-            manage_directory_files(predicted_path_dir)
+            input_digest = save_upload(hand_image, hand_image_path, mapped_id)
 
-            with open(hand_image_path, "wb") as f:
-                for chunk in hand_image.chunks():
-                    f.write(chunk)
-                    
-            # 모델 서버 url
-            model_server_url = "https://52b9-211-117-82-98.ngrok-free.app/predict"
-            
-            files = {
-                "image": (hand_image.name, open(hand_image_path, "rb"), "image/png"),
-            }
-            data = {"design_name": mapped_id}
-            
-            response = requests.post(model_server_url, files=files, data=data)
-            if response.status_code != 200:
-                return JsonResponse({"error": f"Model server error: {response.text}"}, status=500)
-
-            predicted_filename = f"predicted_{unique_filename}"
-            predicted_path = Path(settings.MEDIA_ROOT) / "tryon/predicted" / predicted_filename
-            os.makedirs(predicted_path.parent, exist_ok=True)
-
-            temp_path = predicted_path.parent / f"temp_{predicted_filename}"
-
-            try:
-                # base64 디코딩 후 임시 저장
-                image_data = base64.b64decode(response.json()['image_data'])
-                with open(temp_path, "wb") as temp_file:
-                    temp_file.write(image_data)
-                
-                # 이미지 유효성 검사
-                try:
-                    with Image.open(temp_path) as img:
-                        img.verify()
-                    print(f"이미지가 정상적으로 수신되었습니다. 크기: {os.path.getsize(temp_path)} bytes")
-                    
-                    # 정상이면 실제 위치로 이동
-                    shutil.move(temp_path, predicted_path)
-                except Exception as e:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    raise ValueError(f"수신된 이미지가 손상되었습니다: {str(e)}")
-            except Exception as e:
-                return JsonResponse({"error": f"이미지 처리 중 오류 발생: {str(e)}"}, status=500)
-
-            # WebSocket 및 히스토리 저장
-            try:
-                customer = Customers.objects.get(customer_id=user_id)
-                design = Designs.objects.get(design_key=design_key)
-                
-                TryOnHistory.objects.create(
-                    user=customer,
-                    original_image=f"/tryon/hand/{unique_filename}",
-                    predicted_image=f"/tryon/predicted/{predicted_filename}",
-                    design_key=design,
+            # 같은 사진 + 디자인의 결과가 캐시에 있으면 모델 서버를 호출하지 않고 바로 반환
+            cached_path = tryon_result_cache.get(input_digest)
+            history = None
+            if cached_path is not None:
+                history = use_cached_result(
+                    customer.customer_key, design.design_key, input_digest, cached_path, unique_filename
                 )
-
-                group_name = f"customer_{customer.customer_key}"
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        "type": "notify_tryon_result",
-                        "original_image": f"/media/tryon/hand/{unique_filename}",
-                        "predicted_image": f"/media/tryon/predicted/{predicted_filename}",
-                        "design_key": str(design_key)
-                    },
+            if history is not None:
+                return JsonResponse({
+                    "message": "이미지가 생성되었습니다.",
+                    "original_image": f"/media{history.original_image.name}",
+                    "predicted_image": f"/media{history.predicted_image.name}",
+                    "design_key": design_key,
+                    "cached": True,
+                }, status=200)
+
+            # 모델 서버 호출은 작업 큐에서 처리하고 결과는 WebSocket(notify_tryon_result)으로 전달
+            try:
+                job_id = tryon_queue.submit(
+                    run_tryon_job,
+                    customer.customer_key,
+                    design.design_key,
+                    mapped_id,
+                    unique_filename,
+                    input_digest,
                 )
-            except Exception as e:
-                logger.error(f"WebSocket message error: {str(e)}")
+            except TryOnQueueFull:
+                os.remove(hand_image_path)
+                response = JsonResponse({"error": "Too many try-on requests. Please retry later."}, status=429)
+                response["Retry-After"] = "5"
+                return response
+            # 거절된 요청의 파일이 정리 대상 파일 수에 더해지지 않도록 접수된 후에 등록
+            register_media(f"/tryon/hand/{unique_filename}", customer.customer_key)
 
             return JsonResponse({
-                "message": "이미지가 생성되었습니다.",
+                "message": "이미지 생성 요청이 접수되었습니다.",
+                "job_id": job_id,
                 "original_image": f"/media/tryon/hand/{unique_filename}",
-                "predicted_image": f"/media/tryon/predicted/{predicted_filename}",
                 "design_key": design_key,
-            }, status=200)
+            }, status=202)
         except Designs.DoesNotExist:
             return JsonResponse({"error": "Design not found."}, status=404)
         except Exception as e:
@@ -540,44 +536,57 @@ class TryOnView(APIView):
 class TryOnHistoryView(APIView):
     @swagger_auto_schema(
         operation_summary="Try On History",
-        operation_description="사용자의 네일 입혀보기 기록을 반환합니다.",
+        operation_description="사용자의 네일 입혀보기 기록을 최근 순으로 반환합니다.",
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, description="페이지 크기 (기본 20, 최대 100)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="이전 응답의 next_cursor", type=openapi.TYPE_STRING),
+        ],
         responses={
             200: openapi.Response(
                 description="히스토리 반환",
                 schema=openapi.Schema(
-                    type=openapi.TYPE_ARRAY,
-                    items=openapi.Schema(
-                        type=openapi.TYPE_OBJECT,
-                        properties={
-                            "original_image": openapi.Schema(
-                                type=openapi.TYPE_STRING,
-                                description="원본 이미지 URL"
-                            ),
-                            "predicted_image": openapi.Schema(
-                                type=openapi.TYPE_STRING,
-                                description="처리된 이미지 URL"
-                            ),
-                            "created_at": openapi.Schema(
-                                type=openapi.TYPE_STRING,
-                                format="date-time",
-                                description="생성 날짜"
-                            ),
-                            "design_key": openapi.Schema(
-                                type=openapi.TYPE_STRING,
-                                description="디자인 키"
-                            ),
-                        }
-                    )
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        "results": openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
+                                type=openapi.TYPE_OBJECT,
+                                properties={
+                                    "original_image": openapi.Schema(
+                                        type=openapi.TYPE_STRING,
+                                        description="원본 이미지 URL"
+                                    ),
+                                    "predicted_image": openapi.Schema(
+                                        type=openapi.TYPE_STRING,
+                                        description="처리된 이미지 URL"
+                                    ),
+                                    "created_at": openapi.Schema(
+                                        type=openapi.TYPE_STRING,
+                                        format="date-time",
+                                        description="생성 날짜"
+                                    ),
+                                    "design_key": openapi.Schema(
+                                        type=openapi.TYPE_STRING,
+                                        description="디자인 키"
+                                    ),
+                                }
+                            )
+                        ),
+                        "next_cursor": openapi.Schema(type=openapi.TYPE_STRING),
+                    },
                 ),
                 examples={
-                    "application/json": [
-                        {
-                            "original_image": "http://localhost:8001/media/tryon/hand/15257_35734_0936.jpg",
-                            "predicted_image": "http://localhost:8001/media/tryon/predicted/predicted_15257_35734_0936.jpg",
-                            "created_at": "2024-11-25T06:03:26.350928Z",
-                            "design_key": "012869af-6557-4cab-b1a8-019445c1fed1"
-                        }
-                    ]
+                    "application/json": {
+                        "results": [
+                            {
+                                "original_image": "https://localhost:8001/media/tryon/hand/15257_35734_0936.jpg",
+                                "predicted_image": "https://localhost:8001/media/tryon/predicted/predicted_15257_35734_0936.jpg",
+                                "created_at": "2024-11-25T06:03:26.350928Z",
+                                "design_key": "012869af-6557-4cab-b1a8-019445c1fed1"
+                            }
+                        ],
+                        "next_cursor": None
+                    }
                 },
             ),
             400: openapi.Response(description="잘못된 요청"),
@@ -591,44 +600,22 @@ class TryOnHistoryView(APIView):
         if not user_type or not user_id or user_type != "customer":
             return DRFResponse({"error": "Invalid user headers"}, status=400)
 
-        try:
-            customer = Customers.objects.get(customer_id=user_id)
-        except Customers.DoesNotExist:
+        customer = request.nailo_user
+        if customer is None:
             return DRFResponse({"error": "User not found"}, status=404)
 
-        history = TryOnHistory.objects.filter(user=customer).order_by('-created_at')
-        data = []
-        for item in history:
-            try:
-                original_image_url = (
-                    request.build_absolute_uri(item.original_image.url).replace('http://', 'https://')
-                    if item.original_image else None
-                )
-                predicted_image_url = (
-                    request.build_absolute_uri(item.predicted_image.url).replace('http://', 'https://')
-                    if item.predicted_image else None
-                )
-                # 배포 서버
-                # original_image_url = (
-                #     request.build_absolute_uri(item.original_image.url).replace('http://', 'https://')
-                #     if item.original_image else None
-                # )
-                # predicted_image_url = (
-                #     request.build_absolute_uri(item.predicted_image.url).replace('http://', 'https://')
-                #     if item.predicted_image else None
-                # )
-                data.append({
-                    "original_image": original_image_url,
-                    "predicted_image": predicted_image_url,
-                    "created_at": item.created_at,
-                    "design_key": item.design_key.design_key,
-                })
-            except Exception as e:
-                data.append({
-                    "original_image": None,
-                    "predicted_image": None,
-                    "created_at": item.created_at,
-                    "design_key": item.design_key.design_key,
-                    "error": str(e)
-                })
-        return DRFResponse(data, status=200)
\ No newline at end of file
+        try:
+            page = build_history_page(
+                customer,
+                media_url_prefix(request),
+                limit=request.query_params.get("limit"),
+                cursor=request.query_params.get("cursor"),
+            )
+        except ValueError as e:
+            return DRFResponse({"error": str(e)}, status=400)
+        return DRFResponse(page, status=200)
+
+def metrics(request):
+    """WebSocket action별 처리 시간, 처리 중인 개수, 에러 개수와 Try-On 결과 캐시 지표를 Prometheus 형식으로 반환"""
+    body = action_metrics.render() + tryon_result_cache.render()
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
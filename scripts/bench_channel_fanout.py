@@ -0,0 +1,125 @@
+"""
+채널 레이어 fan-out 지연시간 벤치마크
+
+N개의 워커 프로세스에 M개의 샵 연결을 나누어 그룹에 등록한 뒤,
+별도의 송신 프로세스(TryOnView 같은 WSGI 프로세스 역할)가 모든 shop_<key> 그룹에 group_send 하고
+각 워커가 메시지를 받기까지 걸린 시간을 측정합니다.
+
+사용법:
+    python scripts/bench_channel_fanout.py --workers 4 --shops 200 --rounds 5
+    REDIS_URL=redis://localhost:6379/0 python scripts/bench_channel_fanout.py
+
+REDIS_URL이 없으면 fakeredis TCP 서버를 로컬에 띄워서 측정합니다.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+
+from channels_redis.pubsub import RedisPubSubChannelLayer
+
+def start_fake_redis():
+    """로컬 측정용 fakeredis TCP 서버를 띄우고 URL을 반환"""
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"redis://{host}:{port}/0"
+
+async def run_worker(redis_url, groups, rounds, ready, results):
+    layer = RedisPubSubChannelLayer(hosts=[redis_url])
+    channels = []
+    for group in groups:
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        channels.append(channel)
+    ready.put(len(channels))
+
+    latencies = []
+
+    async def drain(channel):
+        for _ in range(rounds):
+            message = await layer.receive(channel)
+            latencies.append(time.time() - message["sent_at"])
+
+    await asyncio.gather(*(drain(channel) for channel in channels))
+    await layer.flush()
+    results.put(latencies)
+
+def worker_main(redis_url, groups, rounds, ready, results):
+    asyncio.run(run_worker(redis_url, groups, rounds, ready, results))
+
+async def send_rounds(redis_url, groups, rounds, interval):
+    layer = RedisPubSubChannelLayer(hosts=[redis_url])
+    for _ in range(rounds):
+        await asyncio.gather(*(
+            layer.group_send(group, {"type": "notify_shop_new_request", "sent_at": time.time()})
+            for group in groups
+        ))
+        await asyncio.sleep(interval)
+    await layer.flush()
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def main():
+    parser = argparse.ArgumentParser(description="채널 레이어 fan-out 지연시간 벤치마크")
+    parser.add_argument("--workers", type=int, default=4, help="워커 프로세스 수 (N)")
+    parser.add_argument("--shops", type=int, default=100, help="연결된 샵 수 (M)")
+    parser.add_argument("--rounds", type=int, default=5, help="샵마다 보낼 알림 수")
+    parser.add_argument("--interval", type=float, default=0.2, help="라운드 사이 대기 시간(초)")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", ""))
+    args = parser.parse_args()
+
+    server = None
+    redis_url = args.redis_url
+    if not redis_url:
+        server, redis_url = start_fake_redis()
+        print(f"REDIS_URL이 없어 fakeredis 서버를 사용합니다: {redis_url}")
+
+    groups = [f"shop_bench_{i}" for i in range(args.shops)]
+    ready = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=worker_main,
+            args=(redis_url, groups[i::args.workers], args.rounds, ready, results),
+        )
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.get()
+
+    started = time.time()
+    asyncio.run(send_rounds(redis_url, groups, args.rounds, args.interval))
+
+    latencies = []
+    for _ in workers:
+        latencies += results.get()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    latencies_ms = [latency * 1000 for latency in latencies]
+    print(f"workers={args.workers} shops={args.shops} rounds={args.rounds} messages={len(latencies_ms)} elapsed={elapsed:.2f}s")
+    print(
+        f"latency(ms) mean={statistics.mean(latencies_ms):.2f} "
+        f"p50={percentile(latencies_ms, 50):.2f} "
+        f"p95={percentile(latencies_ms, 95):.2f} "
+        f"p99={percentile(latencies_ms, 99):.2f} "
+        f"max={max(latencies_ms):.2f}"
+    )
+
+    if server is not None:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
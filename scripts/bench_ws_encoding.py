@@ -0,0 +1,83 @@
+"""
+WebSocket 응답 JSON encoding 벤치마크
+
+1,000개 샵 목록(shop_list) frame을 만들 때 초당 frame 수를 비교합니다.
+- legacy: 샵마다 UUID/Decimal을 직접 변환한 뒤 json.dumps (이전 방식)
+- json: 변환 없이 표준 json encoder(default 함수)로 직렬화
+- orjson: 변환 없이 orjson encoder로 직렬화 (설치되어 있을 때만)
+
+사용법:
+    python scripts/bench_ws_encoding.py --shops 1000 --seconds 2
+"""
+import argparse
+import decimal
+import json
+import os
+import sys
+import time
+import uuid
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nailo.settings")
+django.setup()
+
+from nailo_be.encoders import get_encoder, orjson  # noqa: E402
+
+def make_shops(count):
+    return [
+        {
+            "shop_key": uuid.uuid4(),
+            "shop_name": f"네일샵 {i}",
+            "shop_id": f"shop_{i}",
+            "lat": decimal.Decimal("37.5665") + decimal.Decimal(i) / 10000,
+            "lng": decimal.Decimal("126.9780") + decimal.Decimal(i) / 10000,
+            "shop_url": f"https://example.com/shops/{i}.png",
+        }
+        for i in range(count)
+    ]
+
+def legacy(shops):
+    converted = [
+        dict(shop, shop_key=str(shop["shop_key"]), lat=float(shop["lat"]), lng=float(shop["lng"]))
+        for shop in shops
+    ]
+    return json.dumps({"type": "shop_list", "shops": converted}, ensure_ascii=False)
+
+def measure(encode, shops, seconds):
+    frames = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        encode(shops)
+        frames += 1
+    return frames / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    shops = make_shops(args.shops)
+    candidates = {
+        "legacy": legacy,
+        "json": lambda shops: get_encoder("json").dumps({"type": "shop_list", "shops": shops}),
+    }
+    if orjson is not None:
+        candidates["orjson"] = lambda shops: get_encoder("orjson").dumps({"type": "shop_list", "shops": shops})
+
+    # 모든 encoder가 같은 JSON을 만드는지 확인
+    expected = json.loads(legacy(shops))
+    for name, encode in candidates.items():
+        assert json.loads(encode(shops)) == expected, name
+
+    print(f"{args.shops} shops per frame")
+    baseline = None
+    for name, encode in candidates.items():
+        rate = measure(encode, shops, args.seconds)
+        baseline = baseline or rate
+        print(f"{name:>8}: {rate:8.1f} frames/sec ({rate / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    main()